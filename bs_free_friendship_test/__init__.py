@@ -1,4 +1,5 @@
 import os
+import time
 import atexit
 
 import flask as fl
@@ -6,22 +7,56 @@ import apscheduler.schedulers.background
 from werkzeug.middleware.proxy_fix import ProxyFix
 
 
-def create_app():
+def create_app(test_config: dict | None = None):
     from . import question
     from . import static
+    from . import fragment
+    from . import middleware
+    from . import profiler
 
     application = fl.Flask(__name__, instance_relative_config=True)
     application.config.from_mapping(
         SECRET_KEY="dev",  # Gets overriden by configuration
-        DATABASE=os.path.join(application.instance_path, "bs-free-friendship-test.sqlite")
+        STORAGE_BACKEND="sqlite",  # Or "memory", which keeps everything in one process, so only works with a single worker
+        STORAGE_SNAPSHOT=None,  # File the memory backend is loaded from and periodically written to, trusted like code
+        STORAGE_SNAPSHOT_INTERVAL=60.0,  # Seconds
+        DATABASE=os.path.join(application.instance_path, "bs-free-friendship-test.sqlite"),
+        DATABASE_SHARDS=1,  # Files quizes are spread over, named after DATABASE; changing it needs a new database
+        DATABASE_POOL_SIZE=8,  # Per shard, should be at least the number of server threads
+        DATABASE_POOL_TIMEOUT=10.0,  # Seconds
+        DATABASE_BUSY_TIMEOUT=5000,  # Milliseconds
+        DATABASE_MMAP_SIZE=64 * 1024 * 1024,  # Bytes
+        DATABASE_CACHE_SIZE=-8000,  # Negative means KiB
+        DATABASE_GROUP_COMMIT=False,  # Funnel writes through one thread, committing them in batches
+        DATABASE_GROUP_COMMIT_WINDOW=0.0,  # Seconds to wait for more writes, besides those queued during the last commit
+        DATABASE_GROUP_COMMIT_BATCH_SIZE=64,
+        SESSION_QUESTION_CURSOR=False,  # Keep the skip cursor in the session instead of the database
+        QUIZ_CACHE_SIZE=2048,  # Entries, two per finished quiz
+        QUIZ_CACHE_TTL=600.0,  # Seconds, bounds staleness across processes
+        COMPRESSION_MINIMUM_SIZE=1024,  # Bytes, smaller pages are sent as they are
+        COMPRESSION_LEVEL=6,
+        RESULTS_STREAM_MAX=2,  # Each stream holds a server thread, keep it below the thread count
+        RESULTS_STREAM_TIMEOUT=300.0,  # Seconds before a stream ends and the browser reconnects
+        RESULTS_STREAM_HEARTBEAT=15.0,  # Seconds
+        SLOW_REQUEST_THRESHOLD=0.5,  # Seconds, slower requests are logged
+        METRICS_TOKEN=None,  # Bearer token for /metrics, which is only served when set
+        PROFILE_SAMPLE_RATE=0.0,  # Fraction of requests profiled into instance/profiles
+        PROFILE_SECRET=None,  # Requests with this value in the profile header are always profiled
+        PROFILE_HEADER="X-Profile",
+        PROFILE_TOP=40,  # Functions listed in each summary
+        QUIZ_RETENTION_HOURS=48,
+        QUIZ_PURGE_BATCH_SIZE=200  # Quizes deleted per transaction
     )
 
-    # Apply some more configuration from the file
-    if application.config.from_pyfile("configuration.py", True):
-        application.logger.info("Using configuration file")
+    # Apply some more configuration from the file, or the one given by the scripts instead
+    if test_config is None:
+        if application.config.from_pyfile("configuration.py", True):
+            application.logger.info("Using configuration file")
+    else:
+        application.config.from_mapping(test_config)
 
     _initialize_application(application)
-    _setup_delete_scheduler(application)  # In debug mode, this will run twice
+    _setup_delete_scheduler(application)  # In debug mode, this will run twice, but only one process runs the jobs
 
     # Ensure the instance directory is available
     os.makedirs(application.instance_path, exist_ok=True)
@@ -31,6 +66,9 @@ def create_app():
 
     application.logger.info(f"Questions: {len(static.G_QUESTIONS)}")
 
+    fragment.initialize_question_fragments(application)
+    middleware.initialize_page_version(application)
+
     @application.route("/")
     def index():
         return fl.render_template("index.html")
@@ -39,6 +77,16 @@ def create_app():
     def information():
         return fl.render_template("information.html")
 
+    application.wsgi_app = middleware.CompressionMiddleware(
+        application.wsgi_app,
+        application.config["COMPRESSION_MINIMUM_SIZE"],
+        application.config["COMPRESSION_LEVEL"]
+    )
+
+    if profiler.is_enabled(application):
+        application.wsgi_app = profiler.wrap(application, application.wsgi_app)
+        application.logger.info("Profiling requests")
+
     application.wsgi_app = ProxyFix(application.wsgi_app, x_for=1, x_proto=1, x_host=1, x_prefix=1)
 
     return application
@@ -46,29 +94,102 @@ def create_app():
 
 def _initialize_application(application: fl.Flask):
     from . import database
+    from . import storage
+    from . import cache
+    from . import notification
+    from . import metrics
     from . import commands
+    from . import assets
     from . import create
     from . import quiz
 
+    database.initialize_pool(application)
+    database.initialize_writer(application)
+    storage.initialize_storage(application)
+    cache.initialize_quiz_cache(application)
+    assets.initialize_assets(application)
+    notification.initialize_results_broker(application)
+    metrics.initialize_metrics(application)
     application.teardown_appcontext(database.close_database)
     application.cli.add_command(commands.command_initialize_database)
+    application.cli.add_command(commands.command_migrate_database)
+    application.cli.add_command(commands.command_backfill_scores)
+    application.register_blueprint(assets.g_blueprint)
     application.register_blueprint(create.g_blueprint)
     application.register_blueprint(quiz.g_blueprint)
 
+    if metrics.is_enabled(application):
+        application.register_blueprint(metrics.g_blueprint)
+
 
 def _setup_delete_scheduler(application: fl.Flask):
+    from . import leader
+
+    batch_size = application.config["QUIZ_PURGE_BATCH_SIZE"]
+
+    # The purge deletes batches until one comes back short, which never happens with empty ones
+    if not isinstance(batch_size, int) or isinstance(batch_size, bool) or batch_size < 1:
+        raise ValueError(f"QUIZ_PURGE_BATCH_SIZE must be an integer of at least 1, not {batch_size!r}")
+
+    # Every process schedules the jobs, but only the one holding the lock runs them
+    application.extensions["scheduler_leader"] = leader.LeaderLock(os.path.join(application.instance_path, "scheduler.lock"))
+
     scheduler = apscheduler.schedulers.background.BackgroundScheduler()
-    scheduler.add_job(lambda: _delete_old_quizes(application), trigger="interval", seconds=1800)
+
+    # A store private to the process is purged by every process
+    if application.extensions["storage"].shared:
+        scheduler.add_job(lambda: _delete_old_quizes_as_leader(application), trigger="interval", seconds=1800)
+    else:
+        scheduler.add_job(lambda: _delete_old_quizes(application), trigger="interval", seconds=1800)
+
     scheduler.start()
     atexit.register(lambda: scheduler.shutdown())
 
 
+def _run_as_leader(application: fl.Flask, job) -> bool:
+    leader_lock = application.extensions["scheduler_leader"]
+    was_leader = leader_lock.is_leader()
+
+    try:
+        if not leader_lock.acquire():
+            return False
+    except OSError as err:
+        application.logger.error(f"Error acquiring scheduler lock: {err}")
+        return False
+
+    if not was_leader:
+        application.logger.info(f"Process {os.getpid()} is now running the scheduled jobs")
+
+    job(application)
+
+    return True
+
+
+def _delete_old_quizes_as_leader(application: fl.Flask):
+    from . import cache
+
+    # The other processes may have cached quizes the leader deletes, so they drop theirs at the same time
+    if not _run_as_leader(application, _delete_old_quizes):
+        cache.invalidate_quiz_cache(application)
+
+
 def _delete_old_quizes(application: fl.Flask):
     from . import database
-    from . import common
-
-    with database.open_database_ex(application) as db:
-        try:
-            common.delete_quizes_older_than(db, 48)
-        except database.DatabaseError as err:
-            application.logger.error(f"Error deleting quizes: {err}")
+    from . import cache
+    from . import metrics
+
+    begin = time.monotonic()
+
+    try:
+        deleted_quizes, deleted_rows = application.extensions["storage"].delete_quizes_older_than(
+            application.config["QUIZ_RETENTION_HOURS"],
+            application.config["QUIZ_PURGE_BATCH_SIZE"]
+        )
+    except database.DatabaseError as err:
+        application.logger.error(f"Error deleting quizes: {err}")
+        metrics.record_purge_error(application)
+    else:
+        duration = time.monotonic() - begin
+        application.logger.info(f"Deleted {deleted_quizes} quizes ({deleted_rows} rows) in {duration * 1000:.1f} ms")
+        metrics.record_purge(application, duration, deleted_quizes, deleted_rows)
+        cache.invalidate_quiz_cache(application)
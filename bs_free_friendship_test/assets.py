@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import os
+import gzip
+import hashlib
+import mimetypes
+import dataclasses
+
+import flask as fl
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+g_blueprint = fl.Blueprint("assets", __name__, url_prefix="/assets")
+
+_MAX_AGE = 365 * 24 * 3600
+
+
+@dataclasses.dataclass(slots=True, frozen=True)
+class Asset:
+    mimetype: str
+    etag: str
+    data: bytes
+    gzip_data: bytes | None
+    brotli_data: bytes | None
+
+
+def initialize_assets(application: fl.Flask):
+    # File name to fingerprinted file name, and fingerprinted file name to its contents
+    manifest: dict[str, str] = {}
+    assets: dict[str, Asset] = {}
+
+    for directory, _, file_names in os.walk(application.static_folder):
+        for file_name in file_names:
+            path = os.path.join(directory, file_name)
+            name = os.path.relpath(path, application.static_folder).replace(os.sep, "/")
+
+            with open(path, "rb") as file:
+                data = file.read()
+
+            digest = hashlib.sha256(data).hexdigest()[:16]
+            root, extension = os.path.splitext(name)
+            fingerprinted_name = f"{root}.{digest}{extension}"
+
+            manifest[name] = fingerprinted_name
+            assets[fingerprinted_name] = Asset(
+                mimetypes.guess_type(name)[0] or "application/octet-stream",
+                digest,
+                data,
+                _smaller(data, gzip.compress(data, compresslevel=9, mtime=0)),
+                _smaller(data, brotli.compress(data)) if brotli is not None else None
+            )
+
+    application.extensions["assets_manifest"] = manifest
+    application.extensions["assets"] = assets
+    application.add_template_global(asset_url_for)
+
+
+def asset_url_for(filename: str) -> str:
+    fingerprinted_name = fl.current_app.extensions["assets_manifest"].get(filename)
+
+    # Files added after startup are still reachable, just not cached for long
+    if fingerprinted_name is None:
+        return fl.url_for("static", filename=filename)
+
+    return fl.url_for("assets._asset", filename=fingerprinted_name)
+
+
+@g_blueprint.route("/<path:filename>")
+def _asset(filename):
+    asset = fl.current_app.extensions["assets"].get(filename)
+
+    if asset is None:
+        fl.abort(404)
+
+    if asset.etag in fl.request.if_none_match:
+        response = fl.Response(status=304)
+    elif asset.brotli_data is not None and fl.request.accept_encodings["br"]:
+        response = fl.Response(asset.brotli_data, mimetype=asset.mimetype)
+        response.content_encoding = "br"
+    elif asset.gzip_data is not None and fl.request.accept_encodings["gzip"]:
+        response = fl.Response(asset.gzip_data, mimetype=asset.mimetype)
+        response.content_encoding = "gzip"
+    else:
+        response = fl.Response(asset.data, mimetype=asset.mimetype)
+
+    # The name changes with the contents, so the response is valid forever
+    response.set_etag(asset.etag)
+    response.vary.add("Accept-Encoding")
+    response.cache_control.public = True
+    response.cache_control.max_age = _MAX_AGE
+    response.cache_control.immutable = True
+
+    return response
+
+
+def _smaller(data: bytes, compressed_data: bytes) -> bytes | None:
+    return compressed_data if len(compressed_data) < len(data) else None
@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+import collections
+import threading
+import time
+from typing import Any, Hashable
+
+import flask as fl
+
+
+class LruTtlCache:
+    def __init__(self, size: int, ttl: float):
+        self._size = size
+        self._ttl = ttl
+        self._entries: collections.OrderedDict[Hashable, tuple[float, Any]] = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, key: Hashable) -> Any | None:
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+
+                self._misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self._hits += 1
+
+            return entry[1]
+
+    def put(self, key: Hashable, value: Any):
+        if self._size <= 0:
+            return
+
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self._ttl, value)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self._size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def statistics(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "size": self._size,
+                "entries": len(self._entries),
+                "hits": self._hits,
+                "misses": self._misses
+            }
+
+
+def initialize_quiz_cache(application: fl.Flask):
+    application.extensions["quiz_cache"] = LruTtlCache(application.config["QUIZ_CACHE_SIZE"], application.config["QUIZ_CACHE_TTL"])
+
+
+def get_quiz_cache() -> LruTtlCache:
+    return fl.current_app.extensions["quiz_cache"]
+
+
+def get_quiz_cache_statistics(application: fl.Flask) -> dict[str, int]:
+    return application.extensions["quiz_cache"].statistics()
+
+
+def invalidate_quiz_cache(application: fl.Flask):
+    application.extensions["quiz_cache"].clear()
@@ -4,6 +4,7 @@ import flask as fl
 import click
 
 from . import database
+from . import common
 
 
 @click.command("initialize-database")
@@ -12,3 +13,34 @@ def command_initialize_database():
         database.initialize_database(fl.current_app)
     except database.DatabaseError as err:
         print(err, file=sys.stderr)
+
+
+@click.command("migrate-database")
+def command_migrate_database():
+    try:
+        applied = database.migrate_database(fl.current_app)
+    except database.DatabaseError as err:
+        print(err, file=sys.stderr)
+    else:
+        for name in applied:
+            print(f"Applied {name}")
+
+        if not applied:
+            print("Database is up to date")
+
+        # Migrated completed quizes only show up in the results once they are scored
+        _backfill_scores()
+
+
+@click.command("backfill-scores")
+def command_backfill_scores():
+    _backfill_scores()
+
+
+def _backfill_scores():
+    try:
+        count = common.backfill_completed_quiz_scores()
+    except database.DatabaseError as err:
+        print(err, file=sys.stderr)
+    else:
+        print(f"Scored {count} completed quizes")
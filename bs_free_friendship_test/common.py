@@ -1,40 +1,149 @@
-import uuid
+import base64
+import binascii
 import random
-from typing import Any
+import dataclasses
+from typing import Any, Callable
 
 from . import database
+from . import storage
 from . import static
+from . import scoring
+from . import cache
+from . import notification
 
 
-def _error_select(err: database.sqlite3.Error) -> database.DatabaseError:
-    return database.DatabaseError(err.sqlite_errorcode, f"Could not select from table: {err}")
+_SESSION_CURSORS = "question_cursors"
+_SESSION_CURSORS_MAX = 8
 
 
-def _error_insert(err: database.sqlite3.Error) -> database.DatabaseError:
-    return database.DatabaseError(err.sqlite_errorcode, f"Could not insert into table: {err}")
+@dataclasses.dataclass(slots=True)
+class QuizState:
+    quiz_id: int
+    creator_name: str
+    shuffled_question_indices: list[int]
+    current_question_index: int  # Index in the shuffled list
+    answered_question_indices: set[int]
 
+    @property
+    def question_count(self) -> int:
+        return len(self.answered_question_indices)
 
-def _error_update(err: database.sqlite3.Error) -> database.DatabaseError:
-    return database.DatabaseError(err.sqlite_errorcode, f"Could not update table: {err}")
 
+@dataclasses.dataclass(slots=True, frozen=True)
+class FinishedQuiz:
+    quiz_id: int
+    public_token: str
+    creator_name: str
+    shuffled_question_indices: tuple[int, ...]
+    current_question_index: int
+    question_answers: tuple[tuple[int, int], ...]
 
-def _error_delete(err: database.sqlite3.Error) -> database.DatabaseError:
-    return database.DatabaseError(err.sqlite_errorcode, f"Could not delete from table: {err}")
+
+@dataclasses.dataclass(slots=True)
+class CompletedQuizState:
+    completed_quiz_id: int
+    quiz_id: int
+    friend_name: str
+    creator_name: str
+    question_indices: list[int]  # The questions the creator answered
+    current_question_index: int  # Index in the list above
+    answered_question_indices: set[int]
+
+    @property
+    def question_count(self) -> int:
+        return len(self.answered_question_indices)
 
 
 def _error_find_entity(id_: Any) -> database.DatabaseError:
-    return database.DatabaseError(None, f"Could not find entity with ID {id_}")
+    return database.NotFoundError(f"Could not find entity with ID {id_}")
 
 
-def create_new_id() -> str:
-    return str(uuid.uuid4().hex)
+def encode_token(token: bytes) -> str:
+    return base64.urlsafe_b64encode(token).rstrip(b"=").decode("ascii")
 
 
-def get_form_answers(form) -> tuple[int, list[str]]:
+def _decode_token(token: str) -> bytes | None:
+    try:
+        # Links made before tokens were introduced carry the same 16 bytes as hexadecimal
+        if len(token) == 32:
+            return bytes.fromhex(token)
+        if len(token) == 22:
+            return base64.b64decode(token + "==", altchars=b"-_", validate=True)
+    except (ValueError, binascii.Error):
+        pass
+
+    return None
+
+
+def get_form_answers(form) -> tuple[int, int]:
     question_index = int(form["question_index"])
-    answers = [str(static.G_QUESTIONS[question_index].answers.index(value)) for (key, value) in form.items() if key.startswith("question_answer")]
+    answers = [static.G_QUESTIONS[question_index].answers.index(value) for (key, value) in form.items() if key.startswith("question_answer")]
+
+    return question_index, scoring.answer_mask(answers)
+
+
+def get_json_answers(data: Any) -> list[tuple[int, int]]:
+    # Expects a list of {"question_index": int, "answers": [int, ...]}, with the answers as indices
+    if not isinstance(data, list) or len(data) != 20:
+        raise ValueError("Expected exactly 20 question answers")
+
+    question_answers: list[tuple[int, int]] = []
+    question_indices: set[int] = set()
+
+    for item in data:
+        if not isinstance(item, dict):
+            raise ValueError("Expected an object for every question answer")
+
+        question_index = item.get("question_index")
+        answers = item.get("answers")
+
+        if type(question_index) is not int or not 0 <= question_index < len(static.G_QUESTIONS):
+            raise ValueError(f"Invalid question index {question_index!r}")
 
-    return question_index, answers
+        if question_index in question_indices:
+            raise ValueError(f"Duplicate question index {question_index}")
+
+        question = static.G_QUESTIONS[question_index]
+
+        if not isinstance(answers, list) or not answers or (question.single_type and len(answers) != 1):
+            raise ValueError(f"Invalid number of answers for question {question_index}")
+
+        if any(type(answer) is not int or not 0 <= answer < len(question.answers) for answer in answers):
+            raise ValueError(f"Invalid answer for question {question_index}")
+
+        question_indices.add(question_index)
+        question_answers.append((question_index, scoring.answer_mask(answers)))
+
+    return question_answers
+
+
+def get_json_questions(question_indices: list[int]) -> list[dict[str, Any]]:
+    return [
+        {
+            "question_index": question_index,
+            "question": static.G_QUESTIONS[question_index].question,
+            "question_quiz": static.G_QUESTIONS[question_index].question_quiz,
+            "single_type": static.G_QUESTIONS[question_index].single_type,
+            "answers": static.G_QUESTIONS[question_index].answers
+        }
+        for question_index in question_indices
+    ]
+
+
+def json_error(fl, err: Exception):
+    if isinstance(err, database.NotFoundError):
+        status = 404
+    elif isinstance(err, database.PoolExhaustedError):
+        status = 503
+    elif isinstance(err, database.DatabaseError):
+        if err.error_code in (database.sqlite3.SQLITE_CONSTRAINT_TRIGGER, database.sqlite3.SQLITE_CONSTRAINT_UNIQUE):
+            status = 400
+        else:
+            status = 500
+    else:
+        status = 400
+
+    return fl.jsonify(error=str(err)), status
 
 
 def redirect_to_create_start(fl):
@@ -42,349 +151,336 @@ def redirect_to_create_start(fl):
 
 
 def create_new_quiz(creator_name: str) -> str:
-    db = database.open_database()
+    new_token, new_public_token = storage.get_storage().create_quiz_tokens()
+
+    storage.get_storage().insert_quiz(new_token, new_public_token, creator_name, _shuffle_question_indices(), [])
+
+    return encode_token(new_token)
 
-    new_id = create_new_id()
-    new_public_id = create_new_id()
-    question_indices = list(map(str, range(len(static.G_QUESTIONS))))
+
+def create_new_completed_quiz(friend_name: str, quiz_id: int) -> str:
+    new_token = storage.get_storage().create_completed_quiz_token(quiz_id)
+
+    storage.get_storage().insert_completed_quiz(new_token, friend_name, quiz_id, [], None)
+
+    return encode_token(new_token)
+
+
+def create_new_answered_quiz(creator_name: str, question_answers: list[tuple[int, int]]) -> tuple[str, str]:
+    new_token, new_public_token = storage.get_storage().create_quiz_tokens()
+
+    storage.get_storage().insert_quiz(new_token, new_public_token, creator_name, _shuffle_question_indices(), question_answers)
+
+    return encode_token(new_token), encode_token(new_public_token)
+
+
+def create_new_answered_completed_quiz(friend_name: str, quiz_id: int, question_answers: list[tuple[int, int]]) -> tuple[str, float]:
+    quiz_question_answers = get_quiz_question_answers(quiz_id)
+
+    if len(quiz_question_answers) != 20:
+        raise ValueError("Quiz is not ready")
+
+    if {question_index for question_index, _ in question_answers} != {question_index for question_index, _ in quiz_question_answers}:
+        raise ValueError("Question answers don't match the quiz's questions")
+
+    new_token = storage.get_storage().create_completed_quiz_token(quiz_id)
+    score = scoring.score(scoring.compile_quiz(quiz_question_answers, static.G_QUESTIONS), question_answers)
+
+    _, completion_number = storage.get_storage().insert_completed_quiz(new_token, friend_name, quiz_id, question_answers, score)
+
+    # The storage trims the name the same way
+    notification.publish_quiz_result(quiz_id, completion_number, friend_name.strip(" "), score)
+
+    return encode_token(new_token), score
+
+
+def _shuffle_question_indices() -> list[int]:
+    question_indices = list(range(len(static.G_QUESTIONS)))
     random.shuffle(question_indices)
 
-    try:
-        db.execute(
-            "INSERT INTO Quiz (Id, PublicId, CreatorName, ShuffledQuestionIndices, CurrentQuestionIndex, CreationTimeStamp) "
-            "VALUES (?, ?, ?, ?, ?, UNIXEPOCH())",
-            (new_id, new_public_id, creator_name, ",".join(question_indices), 0)
-        )
-        db.commit()
-    except db.Error as err:
-        raise _error_insert(err)
+    return question_indices
 
-    return new_id
 
+def get_quiz_id_from_token(quiz_token: str) -> int:
+    return _get_id_from_token(storage.get_storage().get_quiz_id_from_token, quiz_token)
 
-def create_new_completed_quiz(friend_name: str, quiz_id: str) -> str:
-    db = database.open_database()
 
-    new_id = create_new_id()
+def get_quiz_id_from_public_token(public_quiz_token: str) -> int:
+    finished_quiz = cache.get_quiz_cache().get(("public", _decode_token(public_quiz_token)))
 
-    try:
-        db.execute(
-            "INSERT INTO CompletedQuiz (Id, FriendName, CurrentQuestionIndex, QuizId) VALUES (?, ?, ?, ?)",
-            (new_id, friend_name, 0, quiz_id)
-        )
-        db.commit()
-    except db.Error as err:
-        raise _error_insert(err)
+    if finished_quiz is not None:
+        return finished_quiz.quiz_id
 
-    return new_id
+    return _get_id_from_token(storage.get_storage().get_quiz_id_from_public_token, public_quiz_token)
 
 
-def get_quiz_id_from_public_id(public_quiz_id: str) -> str:
-    db = database.open_database()
+def get_completed_quiz_id_from_token(completed_quiz_token: str) -> int:
+    return _get_id_from_token(storage.get_storage().get_completed_quiz_id_from_token, completed_quiz_token)
 
-    try:
-        result = db.execute("SELECT Id FROM Quiz WHERE PublicId = ?", (public_quiz_id,)).fetchone()
-    except db.Error as err:
-        raise _error_select(err)
 
-    if result is None:
-        raise _error_find_entity(public_quiz_id)
+def _get_id_from_token(get_id: Callable[[bytes], int | None], token: str) -> int:
+    decoded_token = _decode_token(token)
 
-    return result[0]
+    if decoded_token is None:
+        raise _error_find_entity(token)
 
+    id_ = get_id(decoded_token)
 
-def get_quiz_data(quiz_id: str) -> tuple[str, str, list[int], int]:
-    db = database.open_database()
+    if id_ is None:
+        raise _error_find_entity(token)
 
-    try:
-        result = db.execute("SELECT * FROM Quiz WHERE Id = ?", (quiz_id,)).fetchone()
-    except db.Error as err:
-        raise _error_select(err)
+    return id_
+
+
+def get_quiz_data(quiz_id: int) -> tuple[str, str, list[int], int]:
+    finished_quiz = cache.get_quiz_cache().get(("id", quiz_id))
+
+    if finished_quiz is not None:
+        return finished_quiz.public_token, finished_quiz.creator_name, list(finished_quiz.shuffled_question_indices), finished_quiz.current_question_index
+
+    result = storage.get_storage().get_quiz(quiz_id)
 
     if result is None:
         raise _error_find_entity(quiz_id)
 
-    return result["PublicId"], result["CreatorName"], list(map(int, result["ShuffledQuestionIndices"].split(","))), result["CurrentQuestionIndex"]
+    public_token, creator_name, shuffled_question_indices, current_question_index, question_count = result
 
+    # Once all questions are answered, the quiz doesn't change anymore
+    if question_count == 20:
+        _cache_finished_quiz(FinishedQuiz(
+            quiz_id,
+            encode_token(public_token),
+            creator_name,
+            tuple(shuffled_question_indices),
+            current_question_index,
+            tuple(storage.get_storage().get_quiz_question_answers(quiz_id))
+        ), public_token)
 
-def get_completed_quiz_data(completed_quiz_id: str) -> tuple[str, int, str]:
-    db = database.open_database()
+    return encode_token(public_token), creator_name, shuffled_question_indices, current_question_index
 
-    try:
-        result = db.execute("SELECT * FROM CompletedQuiz WHERE Id = ?", (completed_quiz_id,)).fetchone()
-    except db.Error as err:
-        raise _error_select(err)
+
+def _cache_finished_quiz(finished_quiz: FinishedQuiz, public_token: bytes):
+    quiz_cache = cache.get_quiz_cache()
+    quiz_cache.put(("id", finished_quiz.quiz_id), finished_quiz)
+    quiz_cache.put(("public", public_token), finished_quiz)
+
+
+def get_completed_quiz_data(completed_quiz_id: int) -> tuple[str, int, int]:
+    result = storage.get_storage().get_completed_quiz(completed_quiz_id)
 
     if result is None:
         raise _error_find_entity(completed_quiz_id)
 
-    return result["FriendName"], result["CurrentQuestionIndex"], result["QuizId"]
+    return result[0], result[1], result[2]
 
 
-def get_quiz_question_count(quiz_id: str) -> int:
-    db = database.open_database()
+def load_quiz_state(quiz_token: str) -> QuizState:
+    decoded_token = _decode_token(quiz_token)
 
-    try:
-        result = db.execute(
-            "SELECT COUNT(*) FROM QuestionAnswer JOIN QuizQuestionAnswer ON QuestionAnswer.Id = QuizQuestionAnswer.QuestionAnswerId "
-            "JOIN Quiz ON QuizQuestionAnswer.QuizId = Quiz.Id WHERE Quiz.Id = ?",
-            (quiz_id,)
-        ).fetchone()
-    except db.Error as err:
-        raise _error_select(err)
+    if decoded_token is None:
+        raise _error_find_entity(quiz_token)
+
+    result = storage.get_storage().load_quiz_state(decoded_token)
 
     if result is None:
-        raise _error_find_entity(quiz_id)
+        raise _error_find_entity(quiz_token)
 
-    return result[0]
+    return QuizState(*result)
 
 
-def get_completed_quiz_question_count(completed_quiz_id: str) -> int:
-    db = database.open_database()
+def load_completed_quiz_state(completed_quiz_token: str) -> CompletedQuizState:
+    decoded_token = _decode_token(completed_quiz_token)
 
-    try:
-        result = db.execute(
-            "SELECT COUNT(*) FROM QuestionAnswer JOIN CompletedQuizQuestionAnswer ON QuestionAnswer.Id = CompletedQuizQuestionAnswer.QuestionAnswerId "
-            "JOIN CompletedQuiz ON CompletedQuizQuestionAnswer.CompletedQuizId = CompletedQuiz.Id WHERE CompletedQuiz.Id = ?",
-            (completed_quiz_id,)
-        ).fetchone()
-    except db.Error as err:
-        raise _error_select(err)
+    if decoded_token is None:
+        raise _error_find_entity(completed_quiz_token)
+
+    result = storage.get_storage().load_completed_quiz_state(decoded_token)
 
     if result is None:
-        raise _error_find_entity(completed_quiz_id)
+        raise _error_find_entity(completed_quiz_token)
 
-    return result[0]
+    return CompletedQuizState(*result)
 
 
-def get_quiz_question_answer_indices(quiz_id: str) -> list[int]:
-    db = database.open_database()
+def get_quiz_question_count(quiz_id: int) -> int:
+    if cache.get_quiz_cache().get(("id", quiz_id)) is not None:
+        return 20
 
-    try:
-        result = db.execute(
-            "SELECT QuestionIndex FROM QuestionAnswer JOIN QuizQuestionAnswer ON QuestionAnswer.Id = QuizQuestionAnswer.QuestionAnswerId "
-            "JOIN Quiz ON QuizQuestionAnswer.QuizId = Quiz.Id WHERE Quiz.Id = ? ORDER BY QuestionIndex ASC",
-            (quiz_id,)
-        ).fetchall()
-    except db.Error as err:
-        raise _error_select(err)
+    result = storage.get_storage().get_quiz(quiz_id)
 
     if result is None:
         raise _error_find_entity(quiz_id)
 
-    return list(map(lambda x: x[0], result))
+    return result[4]
 
 
-def get_completed_quiz_question_answer_indices(completed_quiz_id: str) -> list[int]:
-    db = database.open_database()
+def get_quiz_question_answers(quiz_id: int) -> list[tuple[int, int]]:
+    finished_quiz = cache.get_quiz_cache().get(("id", quiz_id))
 
-    try:
-        result = db.execute(
-            "SELECT QuestionIndex FROM QuestionAnswer JOIN CompletedQuizQuestionAnswer ON QuestionAnswer.Id = CompletedQuizQuestionAnswer.QuestionAnswerId "
-            "JOIN CompletedQuiz ON CompletedQuizQuestionAnswer.CompletedQuizId = CompletedQuiz.Id WHERE CompletedQuiz.Id = ? ORDER BY QuestionIndex ASC",
-            (completed_quiz_id,)
-        ).fetchall()
-    except db.Error as err:
-        raise _error_select(err)
+    if finished_quiz is not None:
+        return list(finished_quiz.question_answers)
 
-    if result is None:
-        raise _error_find_entity(completed_quiz_id)
+    return storage.get_storage().get_quiz_question_answers(quiz_id)
 
-    return list(map(lambda x: x[0], result))
 
+def get_completed_quiz_question_answers(completed_quiz_id: int) -> list[tuple[int, int]]:
+    return storage.get_storage().get_completed_quiz_question_answers(completed_quiz_id)
 
-def get_quiz_question_answers(quiz_id: str) -> list[tuple[int, list[int]]]:
-    db = database.open_database()
 
-    try:
-        result = db.execute(
-            "SELECT QuestionIndex, AnswerIndices FROM QuestionAnswer JOIN QuizQuestionAnswer ON QuestionAnswer.Id = QuizQuestionAnswer.QuestionAnswerId "
-            "JOIN Quiz ON QuizQuestionAnswer.QuizId = Quiz.Id WHERE Quiz.Id = ? ORDER BY QuestionIndex ASC",
-            (quiz_id,)
-        ).fetchall()
-    except db.Error as err:
-        raise _error_select(err)
+def add_quiz_question_answer(state: QuizState, question_index: int, answer_mask: int):
+    answered_question_indices = state.answered_question_indices | {question_index}
+    current_question_index = _next_question_index(state.shuffled_question_indices, state.current_question_index, answered_question_indices)
 
-    if result is None:
-        raise _error_find_entity(quiz_id)
+    storage.get_storage().add_quiz_question_answer(state.quiz_id, question_index, answer_mask, current_question_index)
 
-    return list(map(lambda x: (x[0], list(map(int, x[1].split(",")))), result))
+    state.answered_question_indices = answered_question_indices
+    state.current_question_index = current_question_index
 
 
-def get_completed_quiz_question_answers(completed_quiz_id: str) -> list[tuple[int, list[int]]]:
-    db = database.open_database()
+def add_completed_quiz_question_answer(state: CompletedQuizState, question_index: int, answer_mask: int):
+    answered_question_indices = state.answered_question_indices | {question_index}
+    current_question_index = _next_question_index(state.question_indices, state.current_question_index, answered_question_indices)
 
-    try:
-        result = db.execute(
-            "SELECT QuestionIndex, AnswerIndices FROM QuestionAnswer JOIN CompletedQuizQuestionAnswer ON QuestionAnswer.Id = CompletedQuizQuestionAnswer.QuestionAnswerId "
-            "JOIN CompletedQuiz ON CompletedQuizQuestionAnswer.CompletedQuizId = CompletedQuiz.Id WHERE CompletedQuiz.Id = ? ORDER BY QuestionIndex ASC",
-            (completed_quiz_id,)
-        ).fetchall()
-    except db.Error as err:
-        raise _error_select(err)
+    # A completed quiz never changes afterwards, so it is scored once together with its last answer
+    # Which answer is the last one is only known inside the write, as concurrent requests may add others
+    # The creator's answers are final, so the cached ones save reading them there
+    finished_quiz = cache.get_quiz_cache().get(("id", state.quiz_id))
 
-    if result is None:
-        raise _error_find_entity(completed_quiz_id)
+    result = storage.get_storage().add_completed_quiz_question_answer(
+        state.completed_quiz_id,
+        question_index,
+        answer_mask,
+        current_question_index,
+        state.quiz_id,
+        list(finished_quiz.question_answers) if finished_quiz is not None else None
+    )
 
-    return list(map(lambda x: (x[0], list(map(int, x[1].split(",")))), result))
+    if result is not None:
+        score, completion_number = result
+        notification.publish_quiz_result(state.quiz_id, completion_number, state.friend_name, score)
 
+    state.answered_question_indices = answered_question_indices
+    state.current_question_index = current_question_index
 
-def add_quiz_question_answer(quiz_id: str, question_index: int, answer_indices: list[str]):
-    db = database.open_database()
 
-    try:
-        result = db.execute(
-            "INSERT INTO QuestionAnswer (QuestionIndex, AnswerIndices) VALUES (?, ?) RETURNING Id",
-            (question_index, ",".join(answer_indices))
-        ).fetchone()
-        db.execute("INSERT INTO QuizQuestionAnswer (QuizId, QuestionAnswerId) VALUES (?, ?)", (quiz_id, result[0]))
-        db.commit()
-    except db.Error as err:
-        raise _error_insert(err)
+def next_quiz_question(state: QuizState, persist: bool = True):
+    current_question_index = _next_question_index(state.shuffled_question_indices, state.current_question_index, state.answered_question_indices)
 
+    if current_question_index != state.current_question_index:
+        if persist:
+            _update_quiz_current_question_index(state.quiz_id, current_question_index)
 
-def add_completed_quiz_question_answer(completed_quiz_id: str, question_index: int, answer_indices: list[str]):
-    db = database.open_database()
+        state.current_question_index = current_question_index
 
-    try:
-        result = db.execute(
-            "INSERT INTO QuestionAnswer (QuestionIndex, AnswerIndices) VALUES (?, ?) RETURNING Id",
-            (question_index, ",".join(answer_indices))
-        ).fetchone()
-        db.execute("INSERT INTO CompletedQuizQuestionAnswer (CompletedQuizId, QuestionAnswerId) VALUES (?, ?)", (completed_quiz_id, result[0]))
-        db.commit()
-    except db.Error as err:
-        raise _error_insert(err)
 
+def next_completed_quiz_question(state: CompletedQuizState, persist: bool = True):
+    current_question_index = _next_question_index(state.question_indices, state.current_question_index, state.answered_question_indices)
 
-def next_quiz_question(quiz_id: str):
-    _, _, shuffled_question_indices, current_question_index = get_quiz_data(quiz_id)
-    current_question_indices = get_quiz_question_answer_indices(quiz_id)
+    if current_question_index != state.current_question_index:
+        if persist:
+            _update_completed_quiz_current_question_index(state.completed_quiz_id, current_question_index)
 
-    initial = current_question_index
+        state.current_question_index = current_question_index
 
-    while True:
-        current_question_index = (current_question_index + 1) % len(static.G_QUESTIONS)
-        question_index = shuffled_question_indices[current_question_index]
 
-        if question_index not in current_question_indices:
-            _update_quiz_current_question_index(quiz_id, current_question_index)
-            break
+def load_session_cursor(fl, token: str, state: QuizState | CompletedQuizState) -> bool:
+    if not fl.current_app.config["SESSION_QUESTION_CURSOR"]:
+        return False
 
-        if current_question_index == initial:
-            break
+    current_question_index = fl.session.get(_SESSION_CURSORS, {}).get(token)
+    question_indices = state.shuffled_question_indices if isinstance(state, QuizState) else state.question_indices
+
+    # The database cursor still applies when the session has none, or an outdated one
+    if (
+        type(current_question_index) is int
+        and 0 <= current_question_index < len(question_indices)
+        and question_indices[current_question_index] not in state.answered_question_indices
+    ):
+        state.current_question_index = current_question_index
+
+    return True
+
+
+def store_session_cursor(fl, token: str, state: QuizState | CompletedQuizState):
+    cursors = dict(fl.session.get(_SESSION_CURSORS, {}))
+    cursors.pop(token, None)
+    cursors[token] = state.current_question_index
+
+    # Keep the cookie small, only the most recent quizes matter
+    while len(cursors) > _SESSION_CURSORS_MAX:
+        del cursors[next(iter(cursors))]
 
+    fl.session[_SESSION_CURSORS] = cursors
 
-def next_completed_quiz_question(completed_quiz_id: str):
-    _, current_question_index, quiz_id = get_completed_quiz_data(completed_quiz_id)
-    current_question_indices = get_completed_quiz_question_answer_indices(completed_quiz_id)
-    question_indices = get_quiz_question_answer_indices(quiz_id)
 
+def _next_question_index(question_indices: list[int], current_question_index: int, answered_question_indices: set[int]) -> int:
     initial = current_question_index
 
     while True:
-        current_question_index = (current_question_index + 1) % 20
-        question_index = question_indices[current_question_index]
+        current_question_index = (current_question_index + 1) % len(question_indices)
 
-        if question_index not in current_question_indices:
-            _update_completed_quiz_current_question_index(completed_quiz_id, current_question_index)
-            break
+        if question_indices[current_question_index] not in answered_question_indices:
+            return current_question_index
 
         if current_question_index == initial:
-            break
+            return initial
 
 
-def _update_quiz_current_question_index(quiz_id: str, current_question_index: int):
-    db = database.open_database()
+def _update_quiz_current_question_index(quiz_id: int, current_question_index: int):
+    storage.get_storage().update_quiz_current_question_index(quiz_id, current_question_index)
 
-    try:
-        db.execute("UPDATE Quiz SET CurrentQuestionIndex = ? WHERE Id = ?", (current_question_index, quiz_id))
-        db.commit()
-    except db.Error as err:
-        raise _error_update(err)
-
-
-def _update_completed_quiz_current_question_index(completed_quiz_id: str, current_question_index: int):
-    db = database.open_database()
 
-    try:
-        db.execute("UPDATE CompletedQuiz SET CurrentQuestionIndex = ? WHERE Id = ?", (current_question_index, completed_quiz_id))
-        db.commit()
-    except db.Error as err:
-        raise _error_update(err)
+def _update_completed_quiz_current_question_index(completed_quiz_id: int, current_question_index: int):
+    storage.get_storage().update_completed_quiz_current_question_index(completed_quiz_id, current_question_index)
 
 
-def get_quiz_score(completed_quiz_id: str) -> float:
-    _, _, quiz_id = get_completed_quiz_data(completed_quiz_id)
+def get_quiz_score(completed_quiz_id: int) -> float:
+    return get_quiz_score_ex(completed_quiz_id)[0]
 
-    quiz_question_answers = get_quiz_question_answers(quiz_id)
-    completed_quiz_question_answers = get_completed_quiz_question_answers(completed_quiz_id)
 
-    max_score = _get_quiz_max_score(quiz_question_answers)
-    score = 0
+# Also tells whether the score is final, which it is once stored
+def get_quiz_score_ex(completed_quiz_id: int) -> tuple[float, bool]:
+    result = storage.get_storage().get_completed_quiz(completed_quiz_id)
 
-    for question_answer in completed_quiz_question_answers:
-        score += _get_quiz_question_score(question_answer, quiz_question_answers)
+    if result is None:
+        raise _error_find_entity(completed_quiz_id)
 
-    assert score <= max_score
+    _, _, quiz_id, score = result
 
-    return float(score * 100) / float(max_score)
+    if score is not None:
+        return score, True
 
+    return _compute_quiz_score(completed_quiz_id, quiz_id), False
 
-def _get_quiz_max_score(quiz_question_answers: list[tuple[int, list[int]]]) -> int:
-    max_score = 0
 
-    for question_answer in quiz_question_answers:
-        if static.G_QUESTIONS[question_answer[0]].single_type:
-            max_score += 1
-        else:
-            max_score += len(question_answer[1])
+def _compute_quiz_score(completed_quiz_id: int, quiz_id: int) -> float:
+    quiz_question_answers = get_quiz_question_answers(quiz_id)
+    completed_quiz_question_answers = get_completed_quiz_question_answers(completed_quiz_id)
 
-    return max_score
+    return scoring.score(scoring.compile_quiz(quiz_question_answers, static.G_QUESTIONS), completed_quiz_question_answers)
 
 
-def _get_quiz_question_score(completed_quiz_question_answer: tuple[int, list[int]], quiz_question_answers: list[tuple[int, list[int]]]) -> int:
-    for question_answer in quiz_question_answers:
-        if question_answer[0] != completed_quiz_question_answer[0]:
-            continue
+def get_quiz_results(quiz_id: int, after_completion_number: int = 0) -> list[tuple[int, str, float]]:
+    return storage.get_storage().get_quiz_results(quiz_id, after_completion_number)
 
-        if static.G_QUESTIONS[question_answer[0]].single_type:
-            return int(question_answer[1][0] == completed_quiz_question_answer[1][0])
-        else:
-            score = 0
-            for i in range(len(static.G_QUESTIONS[question_answer[0]].answers)):
-                if i in question_answer[1] and i in completed_quiz_question_answer[1]:
-                    score += 1
-                elif not (i not in question_answer[1] and i not in completed_quiz_question_answer[1]):
-                    score -= 1
-            return max(score, 0)
 
-    assert False
+def backfill_completed_quiz_scores() -> int:
+    scores: list[tuple[int, float]] = []
 
+    for quiz_id, completed_quizes in storage.get_storage().get_unscored_completed_quizes().items():
+        completed_quizes = {id_: answers for id_, answers in completed_quizes.items() if len(answers) == 20}
 
-def get_quiz_completed_quizes(quiz_id: str) -> list[tuple[str, str]]:
-    db = database.open_database()
+        if not completed_quizes:
+            continue
 
-    try:
-        result = db.execute(
-            "SELECT Id, FriendName FROM CompletedQuiz as InitialCompletedQuiz WHERE QuizId = ? AND "
-            "(SELECT COUNT(*) FROM QuestionAnswer JOIN CompletedQuizQuestionAnswer ON QuestionAnswer.Id = CompletedQuizQuestionAnswer.QuestionAnswerId "
-            "JOIN CompletedQuiz ON CompletedQuizQuestionAnswer.CompletedQuizId = CompletedQuiz.Id WHERE CompletedQuiz.Id = InitialCompletedQuiz.Id) = 20 "
-            "ORDER BY FriendName ASC",
-            (quiz_id,)
-        ).fetchall()
-    except db.Error as err:
-        raise _error_select(err)
+        key = scoring.compile_quiz(get_quiz_question_answers(quiz_id), static.G_QUESTIONS)
+        scores.extend((id_, scoring.score(key, answers)) for id_, answers in completed_quizes.items())
 
-    if result is None:
-        raise _error_find_entity(quiz_id)
+    storage.get_storage().update_completed_quiz_scores(scores)
 
-    return list(map(lambda x: (x[0], x[1]), result))
+    return len(scores)
 
 
-def delete_quizes_older_than(db: database.sqlite3.Connection, hours: int):
-    try:
-        db.execute("DELETE FROM Quiz WHERE UNIXEPOCH() - CreationTimeStamp > ?", (hours * 3600,))
-        db.commit()
-    except db.Error as err:
-        raise _error_delete(err)
+# As completion number and friend name
+def get_quiz_completed_quizes(quiz_id: int) -> list[tuple[int, str]]:
+    return [(completion_number, friend_name) for completion_number, friend_name, _ in get_quiz_results(quiz_id)]
@@ -1,12 +1,20 @@
+import json
+import time
+import queue
+
 import flask as fl
 
 from . import database
 from . import static
 from . import common
+from . import notification
+from . import fragment
 
 
 g_blueprint = fl.Blueprint("create", __name__, url_prefix="/create")
 
+_RESULTS_STREAM_RETRY = 5000  # Milliseconds the browser waits before reconnecting
+
 
 @g_blueprint.route("/start", methods=("GET", "POST"))
 def _start():
@@ -14,20 +22,28 @@ def _start():
         creator_name = fl.request.form["creator_name"]
 
         try:
-            quiz_id = common.create_new_quiz(creator_name)
+            quiz_token = common.create_new_quiz(creator_name)
         except database.DatabaseError as err:
             fl.flash(str(err))
 
             if err.error_code != database.sqlite3.SQLITE_CONSTRAINT_TRIGGER:
                 common.redirect_to_create_start(fl)
         else:
-            return fl.redirect(fl.url_for("create._form", _method="GET", quiz_id=quiz_id))
+            return fl.redirect(fl.url_for("create._form", _method="GET", quiz_token=quiz_token))
 
     return fl.render_template("create/start.html")
 
 
-@g_blueprint.route("/form/<quiz_id>", methods=("GET", "POST"))
-def _form(quiz_id):
+@g_blueprint.route("/form/<quiz_token>", methods=("GET", "POST"))
+def _form(quiz_token):
+    try:
+        state = common.load_quiz_state(quiz_token)
+    except database.DatabaseError as err:
+        fl.flash(str(err))
+        return common.redirect_to_create_start(fl)
+
+    session_cursor = common.load_session_cursor(fl, quiz_token, state)
+
     if fl.request.method == "POST":
         question_index, answers = common.get_form_answers(fl.request.form)
 
@@ -35,60 +51,174 @@ def _form(quiz_id):
             fl.flash("You must either submit an answer or skip the question")
         else:
             try:
-                common.add_quiz_question_answer(quiz_id, question_index, answers)
-                common.next_quiz_question(quiz_id)
+                common.add_quiz_question_answer(state, question_index, answers)
             except database.DatabaseError as err:
                 fl.flash(str(err))
 
-                if err.error_code != database.sqlite3.SQLITE_CONSTRAINT_TRIGGER:
+                if err.error_code not in (database.sqlite3.SQLITE_CONSTRAINT_TRIGGER, database.sqlite3.SQLITE_CONSTRAINT_UNIQUE):
                     common.redirect_to_create_start(fl)
+            else:
+                if session_cursor:
+                    common.store_session_cursor(fl, quiz_token, state)
 
-    try:
-        _, creator_name, shuffled_question_indices, current_question_index = common.get_quiz_data(quiz_id)
-        question_count = common.get_quiz_question_count(quiz_id)
-    except database.DatabaseError as err:
-        fl.flash(str(err))
-        return common.redirect_to_create_start(fl)
+    assert state.question_count <= 20
 
-    assert question_count <= 20
+    if state.question_count == 20:
+        return fl.redirect(fl.url_for("create._done", _method="GET", quiz_token=quiz_token))
 
-    if question_count == 20:
-        return fl.redirect(fl.url_for("create._done", _method="GET", quiz_id=quiz_id))
+    question_index = state.shuffled_question_indices[state.current_question_index]
 
     return fl.render_template(
         "create/form.html",
-        creator_name=creator_name,
-        question_count=question_count,
-        question=static.G_QUESTIONS[shuffled_question_indices[current_question_index]],
-        question_index=shuffled_question_indices[current_question_index],
-        quiz_id=quiz_id
+        creator_name=state.creator_name,
+        question_count=state.question_count,
+        question=static.G_QUESTIONS[question_index],
+        question_fragment=fragment.get_question_fragment("create", question_index),
+        question_index=question_index,
+        quiz_token=quiz_token
     )
 
 
-@g_blueprint.route("/form/<quiz_id>/skip", methods=("POST",))
-def _form_skip(quiz_id):
+@g_blueprint.route("/form/<quiz_token>/skip", methods=("POST",))
+def _form_skip(quiz_token):
+    try:
+        state = common.load_quiz_state(quiz_token)
+    except database.DatabaseError as err:
+        fl.flash(str(err))
+        return common.redirect_to_create_start(fl)
+
+    # In session mode, skipping only moves the cursor kept in the signed cookie
+    session_cursor = common.load_session_cursor(fl, quiz_token, state)
+
     try:
-        common.next_quiz_question(quiz_id)
+        common.next_quiz_question(state, not session_cursor)
     except database.DatabaseError as err:
         fl.flash(str(err))
         return common.redirect_to_create_start(fl)
 
-    return fl.redirect(fl.url_for("create._form", _method="GET", quiz_id=quiz_id))
+    if session_cursor:
+        common.store_session_cursor(fl, quiz_token, state)
+
+    return fl.redirect(fl.url_for("create._form", _method="GET", quiz_token=quiz_token))
 
 
-@g_blueprint.route("/done/<quiz_id>")
-def _done(quiz_id):
+@g_blueprint.route("/done/<quiz_token>")
+def _done(quiz_token):
     results: list[tuple[str, int]] = []
+    last_completion_number = 0
 
     try:
-        public_quiz_id, creator_name, _, _ = common.get_quiz_data(quiz_id)
-        quiz_completed_quizes = common.get_quiz_completed_quizes(quiz_id)
+        quiz_id = common.get_quiz_id_from_token(quiz_token)
+        public_quiz_token, creator_name, _, _ = common.get_quiz_data(quiz_id)
+        quiz_results = common.get_quiz_results(quiz_id)
 
-        for quiz in quiz_completed_quizes:
-            quiz_score = common.get_quiz_score(quiz[0])
-            results.append((quiz[1], int(quiz_score)))
+        for completion_number, friend_name, quiz_score in quiz_results:
+            results.append((friend_name, int(quiz_score)))
+            last_completion_number = max(last_completion_number, completion_number)
     except database.DatabaseError as err:
         fl.flash(str(err))
         return common.redirect_to_create_start(fl)
 
-    return fl.render_template("create/done.html", creator_name=creator_name, public_quiz_id=public_quiz_id, results=results)
+    return fl.render_template(
+        "create/done.html",
+        creator_name=creator_name,
+        public_quiz_token=public_quiz_token,
+        results=results,
+        events_url=fl.url_for("create._events", quiz_token=quiz_token, after=last_completion_number)
+    )
+
+
+# Streams friends' results as they complete the quiz, starting after the given completion number
+# Completion numbers follow the order friends finish in, unlike IDs, which follow the order they start in
+@g_blueprint.route("/events/<quiz_token>")
+def _events(quiz_token):
+    try:
+        after_completion_number = int(fl.request.headers.get("Last-Event-ID") or fl.request.args.get("after", 0))
+    except ValueError:
+        after_completion_number = 0
+
+    try:
+        quiz_id = common.get_quiz_id_from_token(quiz_token)
+    except database.DatabaseError as err:
+        return str(err), 404
+
+    broker = notification.get_results_broker()
+    subscriber = broker.subscribe(quiz_id)
+
+    if subscriber is None:
+        return "Too many result streams", 503
+
+    # Subscribed first, so that nothing completing in between is lost
+    try:
+        missed_results = common.get_quiz_results(quiz_id, after_completion_number)
+    except database.DatabaseError as err:
+        broker.unsubscribe(quiz_id, subscriber)
+        return str(err), 500
+
+    timeout = fl.current_app.config["RESULTS_STREAM_TIMEOUT"]
+    heartbeat = fl.current_app.config["RESULTS_STREAM_HEARTBEAT"]
+
+    # The request's database connection is released before streaming starts
+    def stream():
+        sent: set[int] = set()
+
+        try:
+            yield f"retry: {_RESULTS_STREAM_RETRY}\n\n"
+
+            for result in missed_results:
+                sent.add(result[0])
+                yield _result_event(result)
+
+            # Streams end now and then, the browser reconnects with the last event id
+            deadline = time.monotonic() + timeout
+
+            while (remaining := deadline - time.monotonic()) > 0:
+                try:
+                    result = subscriber.get(timeout=min(heartbeat, remaining))
+                except queue.Empty:
+                    yield ": heartbeat\n\n"
+                    continue
+
+                if result[0] not in sent:
+                    sent.add(result[0])
+                    yield _result_event(result)
+        finally:
+            broker.unsubscribe(quiz_id, subscriber)
+
+    response = fl.Response(stream(), mimetype="text/event-stream")
+    response.cache_control.no_cache = True
+    response.headers["X-Accel-Buffering"] = "no"
+
+    return response
+
+
+@g_blueprint.route("/api/questions")
+def _api_questions():
+    return fl.jsonify(questions=common.get_json_questions(list(range(len(static.G_QUESTIONS)))))
+
+
+# Creates a quiz with all of its answers at once, for clients running the form themselves
+@g_blueprint.route("/api/submit", methods=("POST",))
+def _api_submit():
+    data = fl.request.get_json(silent=True)
+
+    if not isinstance(data, dict) or not isinstance(data.get("creator_name"), str):
+        return common.json_error(fl, ValueError("Expected a creator name and question answers"))
+
+    try:
+        question_answers = common.get_json_answers(data.get("answers"))
+        quiz_token, public_quiz_token = common.create_new_answered_quiz(data["creator_name"], question_answers)
+    except (ValueError, database.DatabaseError) as err:
+        return common.json_error(fl, err)
+
+    return fl.jsonify(
+        quiz_token=quiz_token,
+        public_quiz_token=public_quiz_token,
+        done_url=fl.url_for("create._done", quiz_token=quiz_token)
+    ), 201
+
+
+def _result_event(result: tuple[int, str, float]) -> str:
+    completion_number, friend_name, quiz_score = result
+
+    return f"id: {completion_number}\nevent: result\ndata: {json.dumps({'friend_name': friend_name, 'score': int(quiz_score)})}\n\n"
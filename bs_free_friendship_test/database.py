@@ -1,8 +1,15 @@
 import sqlite3
 import re
+import os
+import time
+import queue
+import threading
+from typing import Any, Callable
 
 import flask as fl
 
+from . import metrics
+
 
 class DatabaseError(Exception):
     def __init__(self, error_code: int | None, *args: object):
@@ -10,39 +17,426 @@ class DatabaseError(Exception):
         self.error_code = error_code
 
 
-def open_database_ex(application: fl.Flask) -> sqlite3.Connection:
-    return _create_connection(application.config["DATABASE"])
+class NotFoundError(DatabaseError):
+    def __init__(self, *args: object):
+        super().__init__(None, *args)
+
+
+class PoolExhaustedError(DatabaseError):
+    def __init__(self, *args: object):
+        super().__init__(None, *args)
+
+
+class ConnectionPool:
+    def __init__(self, application: fl.Flask, database_path: str):
+        self._database_path = database_path
+        self._size = application.config["DATABASE_POOL_SIZE"]
+        self._timeout = application.config["DATABASE_POOL_TIMEOUT"]
+        self._pragmas = _get_pragmas(application)
+        self._connections: queue.LifoQueue[sqlite3.Connection] = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._checkouts = 0
+        self._waits = 0
+
+    def acquire(self) -> sqlite3.Connection:
+        try:
+            connection = self._connections.get_nowait()
+        except queue.Empty:
+            connection = self._create_or_wait()
+
+        with self._lock:
+            self._checkouts += 1
+
+        return connection
+
+    def release(self, connection: sqlite3.Connection):
+        try:
+            # Never hand out a connection with a pending transaction
+            connection.rollback()
+        except sqlite3.Error:
+            connection.close()
+
+            with self._lock:
+                self._created -= 1
+
+            return
+
+        self._connections.put(connection)
+
+    def close(self):
+        while True:
+            try:
+                connection = self._connections.get_nowait()
+            except queue.Empty:
+                break
+
+            connection.close()
+
+            with self._lock:
+                self._created -= 1
+
+    def statistics(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "size": self._size,
+                "created": self._created,
+                "idle": self._connections.qsize(),
+                "checkouts": self._checkouts,
+                "waits": self._waits
+            }
+
+    def _create_or_wait(self) -> sqlite3.Connection:
+        with self._lock:
+            create = self._created < self._size
+
+            if create:
+                self._created += 1
+            else:
+                self._waits += 1
+
+        if create:
+            try:
+                return _create_connection(self._database_path, self._pragmas)
+            except sqlite3.Error as err:
+                with self._lock:
+                    self._created -= 1
+
+                raise DatabaseError(err.sqlite_errorcode, f"Could not open database: {err}")
+
+        try:
+            return self._connections.get(timeout=self._timeout)
+        except queue.Empty:
+            raise PoolExhaustedError("Could not acquire database connection: pool exhausted")
+
+
+class _WriteRequest:
+    __slots__ = ("operation", "statistics", "result", "error", "done")
+
+    def __init__(self, operation: Callable[[sqlite3.Connection], Any]):
+        self.operation = operation
+        self.statistics = metrics.get_request_statistics()  # Of the submitting request, which waits meanwhile
+        self.result: Any = None
+        self.error: Exception | None = None
+        self.done = threading.Event()
+
+
+class GroupCommitWriter:
+    def __init__(self, application: fl.Flask, database_path: str):
+        self._database_path = database_path
+        self._window = application.config["DATABASE_GROUP_COMMIT_WINDOW"]
+        self._batch_size = application.config["DATABASE_GROUP_COMMIT_BATCH_SIZE"]
+        self._pragmas = _get_pragmas(application)
+        self._connection: sqlite3.Connection | None = None
+        self._requests: queue.Queue[_WriteRequest | None] = queue.Queue()
+        self._lock = threading.Lock()
+        self._batches = 0
+        self._writes = 0
+        self._thread = threading.Thread(target=self._run, name="database-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, operation: Callable[[sqlite3.Connection], Any]) -> Any:
+        request = _WriteRequest(operation)
+        self._requests.put(request)
+        request.done.wait()
+
+        if request.error is not None:
+            raise request.error
+
+        return request.result
+
+    def close(self):
+        self._requests.put(None)
+        self._thread.join()
+
+    def statistics(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "batches": self._batches,
+                "writes": self._writes
+            }
+
+    def _run(self):
+        while True:
+            request = self._requests.get()
+
+            if request is None:
+                break
+
+            batch = [request]
+            deadline = time.monotonic() + self._window
+            stop = False
+
+            # Writes queued up during the previous commit, or arriving within the window, are committed together
+            while len(batch) < self._batch_size:
+                try:
+                    request = self._requests.get(timeout=max(deadline - time.monotonic(), 0.0))
+                except queue.Empty:
+                    break
+
+                if request is None:
+                    stop = True
+                    break
+
+                batch.append(request)
+
+            self._write_batch(batch)
+
+            if stop:
+                break
+
+        if self._connection is not None:
+            self._connection.close()
+
+    def _write_batch(self, batch: list[_WriteRequest]):
+        try:
+            if self._connection is None:
+                self._connection = _create_connection(self._database_path, self._pragmas)
+
+            self._connection.execute("BEGIN IMMEDIATE")
+
+            # Every operation gets a savepoint, so that its errors only undo its own changes
+            for request in batch:
+                self._connection.execute("SAVEPOINT write")
+
+                # The operation's statements count towards its request, the shared ones don't
+                metrics.set_request_statistics(request.statistics)
+
+                try:
+                    request.result = request.operation(self._connection)
+                except Exception as err:
+                    request.error = err
+                    self._connection.execute("ROLLBACK TO write")
+                finally:
+                    metrics.set_request_statistics(None)
+
+                self._connection.execute("RELEASE write")
+
+            self._connection.commit()
+        except sqlite3.Error as err:
+            if self._connection is not None and self._connection.in_transaction:
+                try:
+                    self._connection.rollback()
+                except sqlite3.Error:
+                    self._connection.close()
+                    self._connection = None
+
+            for request in batch:
+                if request.error is None:
+                    request.result = None
+                    request.error = err
+        finally:
+            with self._lock:
+                self._batches += 1
+                self._writes += len(batch)
+
+            for request in batch:
+                request.done.set()
+
+
+def get_database_paths(application: fl.Flask) -> list[str]:
+    database_path = application.config["DATABASE"]
+    shards = application.config["DATABASE_SHARDS"]
+
+    if shards == 1:
+        return [database_path]
+
+    root, extension = os.path.splitext(database_path)
+
+    return [f"{root}-{shard}{extension}" for shard in range(shards)]
+
 
+def get_shard_count() -> int:
+    return fl.current_app.config["DATABASE_SHARDS"]
 
-def open_database() -> sqlite3.Connection:
+
+def shard_of_id(id_: int) -> int:
+    return id_ % get_shard_count()
+
+
+def shard_of_token(token: bytes) -> int:
+    return int.from_bytes(token[:8], "big") % get_shard_count()
+
+
+def shard_id_parameters(shard: int) -> tuple[int, int]:
+    # For "(SELECT IFNULL(MAX(seq), ?) + ? FROM sqlite_sequence WHERE name = 'Table')", which allocates
+    # the ids of a shard as its index plus multiples of the shard count, so that shard_of_id() finds them again
+    # The sequence is the highest id ever used, so the ids of deleted rows are never reused, which the
+    # quiz cache of every process relies on
+    # With a single shard, that is the same id SQLite's AUTOINCREMENT picks by itself
+    return shard, get_shard_count()
+
+
+def initialize_pool(application: fl.Flask):
+    application.extensions["database_pools"] = [ConnectionPool(application, path) for path in get_database_paths(application)]
+
+
+def get_pool_statistics(application: fl.Flask) -> dict[str, int]:
+    return _sum_statistics([pool.statistics() for pool in application.extensions["database_pools"]])
+
+
+def initialize_writer(application: fl.Flask):
+    if application.config["DATABASE_GROUP_COMMIT"]:
+        application.extensions["database_writers"] = [GroupCommitWriter(application, path) for path in get_database_paths(application)]
+    else:
+        application.extensions.pop("database_writers", None)
+
+
+def get_writer_statistics(application: fl.Flask) -> dict[str, int] | None:
+    writers = application.extensions.get("database_writers")
+
+    return _sum_statistics([writer.statistics() for writer in writers]) if writers is not None else None
+
+
+def run_write(operation: Callable[[sqlite3.Connection], Any], shard: int = 0) -> Any:
+    # The operation must not commit or roll back, that is done here or by the writer thread
+    writers = fl.current_app.extensions.get("database_writers")
+
+    if writers is not None:
+        return writers[shard].submit(operation)
+
+    db = open_database(shard)
+
+    try:
+        result = operation(db)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    return result
+
+
+def open_database_ex(application: fl.Flask, shard: int = 0) -> sqlite3.Connection:
+    return _create_connection(get_database_paths(application)[shard], _get_pragmas(application))
+
+
+def open_database(shard: int = 0) -> sqlite3.Connection:
     # Stupid syntax
-    if "database" not in fl.g:
-        fl.g.database = open_database_ex(fl.current_app)
+    if "databases" not in fl.g:
+        fl.g.databases = {}
+
+    if shard not in fl.g.databases:
+        fl.g.databases[shard] = _get_pool(fl.current_app, shard).acquire()
 
-    return fl.g.database
+    return fl.g.databases[shard]
 
 
 def close_database(_=None):
-    database = fl.g.pop("database", None)
+    databases = fl.g.pop("databases", {})
 
-    if database is not None:
-        database.close()
+    for shard, database in databases.items():
+        _get_pool(fl.current_app, shard).release(database)
 
 
 def initialize_database(application: fl.Flask):
-    with open_database_ex(application) as db:
-        with fl.current_app.open_resource("schema.sql") as file:
+    with application.open_resource("schema.sql") as file:
+        script = file.read().decode("utf8")
+
+    for shard in range(application.config["DATABASE_SHARDS"]):
+        with open_database_ex(application, shard) as db:
             try:
-                db.executescript(file.read().decode("utf8"))
+                db.executescript(script)
             except db.Error as err:
                 raise DatabaseError(err.sqlite_errorcode, f"Could not execute script: {err}")
             except Exception as err:
                 raise DatabaseError(None, f"Could not execute script: {err}")
 
 
-def _create_connection(database_path: str) -> sqlite3.Connection:
-    connection = sqlite3.connect(database_path, detect_types=sqlite3.PARSE_DECLTYPES)
+def migrate_database(application: fl.Flask) -> list[str]:
+    applied: list[str] = []
+    database_paths = get_database_paths(application)
+
+    for shard, database_path in enumerate(database_paths):
+        # Shards are migrated one after the other, tell them apart when there are more
+        prefix = f"{os.path.basename(database_path)}: " if len(database_paths) > 1 else ""
+
+        applied.extend(prefix + name for name in _migrate_shard(application, shard))
+
+    return applied
+
+
+def _migrate_shard(application: fl.Flask, shard: int) -> list[str]:
+    applied: list[str] = []
+
+    with open_database_ex(application, shard) as db:
+        _create_migration_functions(db)
+
+        try:
+            version = db.execute("PRAGMA user_version").fetchone()[0]
+        except db.Error as err:
+            raise DatabaseError(err.sqlite_errorcode, f"Could not read schema version: {err}")
+
+        for migration_version, name in _get_migrations(application):
+            if migration_version <= version:
+                continue
+
+            with application.open_resource(os.path.join("migrations", name)) as file:
+                script = file.read().decode("utf8")
+
+            # Each migration either applies completely, together with its version, or not at all
+            try:
+                db.executescript(f"BEGIN;\n{script}\nPRAGMA user_version = {migration_version};\nCOMMIT;")
+            except db.Error as err:
+                db.rollback()
+                raise DatabaseError(err.sqlite_errorcode, f"Could not apply migration {name}: {err}")
+
+            applied.append(name)
+
+    return applied
+
+
+def _get_migrations(application: fl.Flask) -> list[tuple[int, str]]:
+    migrations = []
+
+    for name in os.listdir(os.path.join(application.root_path, "migrations")):
+        if name.endswith(".sql"):
+            migrations.append((int(name.split("_", 1)[0]), name))
+
+    return sorted(migrations)
+
+
+def _create_migration_functions(db: sqlite3.Connection):
+    # Older schemas validate lists with a regular expression, and their rows need converting
+    db.create_function("regexp", 2, lambda y, x: re.match(y, x) is not None, deterministic=True)
+    db.create_function("indices_to_blob", 1, lambda x: bytes(map(int, x.split(","))), deterministic=True)
+    db.create_function("indices_to_mask", 1, lambda x: sum(1 << int(i) for i in set(x.split(","))), deterministic=True)
+    db.create_function("hex_to_blob", 1, lambda x: bytes.fromhex(x), deterministic=True)
+
+
+def _get_pool(application: fl.Flask, shard: int) -> ConnectionPool:
+    return application.extensions["database_pools"][shard]
+
+
+def _sum_statistics(statistics: list[dict[str, int]]) -> dict[str, int]:
+    # Shards are reported together
+    return {key: sum(shard_statistics[key] for shard_statistics in statistics) for key in statistics[0]}
+
+
+def _get_pragmas(application: fl.Flask) -> list[str]:
+    return [
+        "PRAGMA journal_mode = WAL",
+        "PRAGMA synchronous = NORMAL",
+        f"PRAGMA busy_timeout = {int(application.config['DATABASE_BUSY_TIMEOUT'])}",
+        f"PRAGMA mmap_size = {int(application.config['DATABASE_MMAP_SIZE'])}",
+        f"PRAGMA cache_size = {int(application.config['DATABASE_CACHE_SIZE'])}"
+    ]
+
+
+def _create_connection(database_path: str, pragmas: list[str]) -> sqlite3.Connection:
+    # Pooled connections are handed between the server's threads, but only ever used by one at a time
+    connection = sqlite3.connect(
+        database_path,
+        detect_types=sqlite3.PARSE_DECLTYPES,
+        check_same_thread=False,
+        factory=metrics.InstrumentedConnection
+    )
     connection.row_factory = sqlite3.Row
-    connection.create_function("regexp", 2, lambda y, x: re.match(y, x) is not None)
+
+    for pragma in pragmas:
+        connection.execute(pragma)
+
+    # Count only the statements the application issues
+    connection.set_trace_callback(metrics.trace_statement)
 
     return connection
@@ -0,0 +1,28 @@
+import flask as fl
+import markupsafe
+
+from . import question
+from . import static
+
+# Form template variant to the question text it shows
+_VARIANTS = {
+    "create": "question",
+    "quiz": "question_quiz"
+}
+
+
+def initialize_question_fragments(application: fl.Flask):
+    # Questions never change while running, so their markup is rendered only once
+    with application.app_context():
+        application.extensions["question_fragments"] = {
+            variant: [render_question_fragment(variant, question_) for question_ in static.G_QUESTIONS]
+            for variant in _VARIANTS
+        }
+
+
+def render_question_fragment(variant: str, question_: question.Question) -> markupsafe.Markup:
+    return markupsafe.Markup(fl.render_template("question.html", question=question_, question_text=getattr(question_, _VARIANTS[variant])))
+
+
+def get_question_fragment(variant: str, question_index: int) -> markupsafe.Markup:
+    return fl.current_app.extensions["question_fragments"][variant][question_index]
@@ -0,0 +1,51 @@
+from __future__ import annotations
+
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+# Exclusive lock on a file, held by at most one process at a time
+# The operating system drops it when the holding process dies, so another one can take over
+class LeaderLock:
+    def __init__(self, path: str):
+        self._path = path
+        self._file = None
+        self._lock = threading.Lock()
+
+    def acquire(self) -> bool:
+        with self._lock:
+            if self._file is not None:
+                return True
+
+            # Without flock every process considers itself the leader
+            if fcntl is None:
+                return True
+
+            file = open(self._path, "a")
+
+            try:
+                fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                file.close()
+                return False
+
+            self._file = file
+
+            return True
+
+    def release(self):
+        with self._lock:
+            if self._file is None:
+                return
+
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+
+    def is_leader(self) -> bool:
+        with self._lock:
+            return self._file is not None or fcntl is None
@@ -0,0 +1,531 @@
+from __future__ import annotations
+
+import os
+import time
+import atexit
+import pickle
+import tempfile
+import threading
+from typing import Any
+
+import flask as fl
+
+from . import database
+from . import scoring
+from . import static
+from . import storage
+
+_SNAPSHOT_VERSION = 2
+
+
+class _Quiz:
+    __slots__ = (
+        "id",
+        "token",
+        "public_token",
+        "creator_name",
+        "shuffled_question_indices",
+        "current_question_index",
+        "creation_time_stamp",
+        "question_answers",
+        "completed_quiz_ids",
+        "completion_count"
+    )
+
+    def __init__(self, id_: int, token: bytes, public_token: bytes, creator_name: str, shuffled_question_indices: bytes, creation_time_stamp: int):
+        self.id = id_
+        self.token = token
+        self.public_token = public_token
+        self.creator_name = creator_name
+        self.shuffled_question_indices = shuffled_question_indices  # One byte per index
+        self.current_question_index = 0
+        self.creation_time_stamp = creation_time_stamp
+        self.question_answers: dict[int, int] = {}  # Question index to answer bitmask
+        self.completed_quiz_ids: list[int] = []
+        self.completion_count = 0  # The number given to the last completed quiz
+
+
+class _CompletedQuiz:
+    __slots__ = ("id", "token", "friend_name", "quiz_id", "current_question_index", "question_answers", "score", "completion_number")
+
+    def __init__(self, id_: int, token: bytes, friend_name: str, quiz_id: int):
+        self.id = id_
+        self.token = token
+        self.friend_name = friend_name
+        self.quiz_id = quiz_id
+        self.current_question_index = 0
+        self.question_answers: dict[int, int] = {}
+        self.score: float | None = None  # Set once, when completed
+        self.completion_number: int | None = None  # Set together with the score
+
+
+class MemoryStorage(storage.Storage):
+    # Everything lives in this process, optionally written to a snapshot file from time to time
+    # One lock guards all of it, as every operation is only a few dictionary lookups
+    # Only for a single server process: others would neither see its data nor keep their snapshots apart
+
+    shared = False
+
+    def __init__(self, application: fl.Flask):
+        self._snapshot_path: str | None = application.config["STORAGE_SNAPSHOT"]
+        self._snapshot_interval: float = application.config["STORAGE_SNAPSHOT_INTERVAL"]
+        self._logger = application.logger
+        self._lock = threading.Lock()
+        self._quizes: dict[int, _Quiz] = {}  # In creation order
+        self._quizes_by_token: dict[bytes, _Quiz] = {}
+        self._quizes_by_public_token: dict[bytes, _Quiz] = {}
+        self._completed_quizes: dict[int, _CompletedQuiz] = {}
+        self._completed_quizes_by_token: dict[bytes, _CompletedQuiz] = {}
+        self._next_quiz_id = 1
+        self._next_completed_quiz_id = 1
+        self._changes = 0  # Since the last snapshot
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+        if self._snapshot_path is not None:
+            self._load_snapshot()
+
+            if self._snapshot_interval > 0.0:
+                self._thread = threading.Thread(target=self._run, name="storage-snapshot", daemon=True)
+                self._thread.start()
+
+            atexit.register(self.close)
+
+    def insert_quiz(
+        self,
+        token: bytes,
+        public_token: bytes,
+        creator_name: str,
+        shuffled_question_indices: list[int],
+        question_answers: list[tuple[int, int]]
+    ):
+        creator_name = _validate_name(creator_name)
+        _validate_question_answers({}, question_answers)
+
+        with self._lock:
+            if token in self._quizes_by_token or public_token in self._quizes_by_public_token:
+                raise _error_unique("Quiz.Token")
+
+            quiz = _Quiz(self._next_quiz_id, token, public_token, creator_name, bytes(shuffled_question_indices), int(time.time()))
+            quiz.question_answers.update(question_answers)
+
+            self._quizes[quiz.id] = quiz
+            self._quizes_by_token[token] = quiz
+            self._quizes_by_public_token[public_token] = quiz
+            self._next_quiz_id += 1
+            self._changes += 1
+
+    def insert_completed_quiz(
+        self,
+        token: bytes,
+        friend_name: str,
+        quiz_id: int,
+        question_answers: list[tuple[int, int]],
+        score: float | None
+    ) -> tuple[int, int | None]:
+        friend_name = _validate_name(friend_name)
+        _validate_question_answers({}, question_answers)
+
+        with self._lock:
+            quiz = _get_record(self._quizes, quiz_id)
+
+            if token in self._completed_quizes_by_token:
+                raise _error_unique("CompletedQuiz.Token")
+
+            completed_quiz = _CompletedQuiz(self._next_completed_quiz_id, token, friend_name, quiz_id)
+            completed_quiz.question_answers.update(question_answers)
+
+            if score is not None:
+                _complete_completed_quiz(quiz, completed_quiz, score)
+
+            self._completed_quizes[completed_quiz.id] = completed_quiz
+            self._completed_quizes_by_token[token] = completed_quiz
+            quiz.completed_quiz_ids.append(completed_quiz.id)
+            self._next_completed_quiz_id += 1
+            self._changes += 1
+
+            return completed_quiz.id, completed_quiz.completion_number
+
+    def get_quiz_id_from_token(self, token: bytes) -> int | None:
+        with self._lock:
+            quiz = self._quizes_by_token.get(token)
+
+            return quiz.id if quiz is not None else None
+
+    def get_quiz_id_from_public_token(self, public_token: bytes) -> int | None:
+        with self._lock:
+            quiz = self._quizes_by_public_token.get(public_token)
+
+            return quiz.id if quiz is not None else None
+
+    def get_completed_quiz_id_from_token(self, token: bytes) -> int | None:
+        with self._lock:
+            completed_quiz = self._completed_quizes_by_token.get(token)
+
+            return completed_quiz.id if completed_quiz is not None else None
+
+    def get_quiz(self, quiz_id: int) -> tuple[bytes, str, list[int], int, int] | None:
+        with self._lock:
+            quiz = self._quizes.get(quiz_id)
+
+            if quiz is None:
+                return None
+
+            return (
+                quiz.public_token,
+                quiz.creator_name,
+                list(quiz.shuffled_question_indices),
+                quiz.current_question_index,
+                len(quiz.question_answers)
+            )
+
+    def get_completed_quiz(self, completed_quiz_id: int) -> tuple[str, int, int, float | None] | None:
+        with self._lock:
+            completed_quiz = self._completed_quizes.get(completed_quiz_id)
+
+            if completed_quiz is None:
+                return None
+
+            return completed_quiz.friend_name, completed_quiz.current_question_index, completed_quiz.quiz_id, completed_quiz.score
+
+    def load_quiz_state(self, token: bytes) -> tuple[int, str, list[int], int, set[int]] | None:
+        with self._lock:
+            quiz = self._quizes_by_token.get(token)
+
+            if quiz is None:
+                return None
+
+            return (
+                quiz.id,
+                quiz.creator_name,
+                list(quiz.shuffled_question_indices),
+                quiz.current_question_index,
+                set(quiz.question_answers)
+            )
+
+    def load_completed_quiz_state(self, token: bytes) -> tuple[int, int, str, str, list[int], int, set[int]] | None:
+        with self._lock:
+            completed_quiz = self._completed_quizes_by_token.get(token)
+
+            if completed_quiz is None:
+                return None
+
+            quiz = self._quizes[completed_quiz.quiz_id]
+
+            if not quiz.question_answers:
+                return None
+
+            return (
+                completed_quiz.id,
+                quiz.id,
+                completed_quiz.friend_name,
+                quiz.creator_name,
+                sorted(quiz.question_answers),
+                completed_quiz.current_question_index,
+                set(completed_quiz.question_answers)
+            )
+
+    def get_quiz_question_answers(self, quiz_id: int) -> list[tuple[int, int]]:
+        with self._lock:
+            quiz = self._quizes.get(quiz_id)
+
+            return sorted(quiz.question_answers.items()) if quiz is not None else []
+
+    def get_completed_quiz_question_answers(self, completed_quiz_id: int) -> list[tuple[int, int]]:
+        with self._lock:
+            completed_quiz = self._completed_quizes.get(completed_quiz_id)
+
+            return sorted(completed_quiz.question_answers.items()) if completed_quiz is not None else []
+
+    def add_quiz_question_answer(self, quiz_id: int, question_index: int, answer_mask: int, current_question_index: int):
+        with self._lock:
+            quiz = _get_record(self._quizes, quiz_id)
+            _validate_question_answers(quiz.question_answers, [(question_index, answer_mask)])
+
+            quiz.question_answers[question_index] = answer_mask
+            quiz.current_question_index = current_question_index
+            self._changes += 1
+
+    def add_completed_quiz_question_answer(
+        self,
+        completed_quiz_id: int,
+        question_index: int,
+        answer_mask: int,
+        current_question_index: int,
+        quiz_id: int,
+        quiz_question_answers: list[tuple[int, int]] | None
+    ) -> tuple[float, int] | None:
+        with self._lock:
+            completed_quiz = _get_record(self._completed_quizes, completed_quiz_id)
+            _validate_question_answers(completed_quiz.question_answers, [(question_index, answer_mask)])
+
+            completed_quiz.question_answers[question_index] = answer_mask
+            completed_quiz.current_question_index = current_question_index
+            self._changes += 1
+
+            # Decided under the lock, which orders concurrent answers
+            if len(completed_quiz.question_answers) == 20:
+                quiz = self._quizes[completed_quiz.quiz_id]
+                quiz_key = scoring.compile_quiz(sorted(quiz.question_answers.items()), static.G_QUESTIONS)
+                _complete_completed_quiz(quiz, completed_quiz, scoring.score(quiz_key, sorted(completed_quiz.question_answers.items())))
+
+                return completed_quiz.score, completed_quiz.completion_number
+
+            return None
+
+    def update_quiz_current_question_index(self, quiz_id: int, current_question_index: int):
+        with self._lock:
+            _get_record(self._quizes, quiz_id).current_question_index = current_question_index
+            self._changes += 1
+
+    def update_completed_quiz_current_question_index(self, completed_quiz_id: int, current_question_index: int):
+        with self._lock:
+            _get_record(self._completed_quizes, completed_quiz_id).current_question_index = current_question_index
+            self._changes += 1
+
+    def get_quiz_results(self, quiz_id: int, after_completion_number: int) -> list[tuple[int, str, float]]:
+        with self._lock:
+            quiz = self._quizes.get(quiz_id)
+
+            if quiz is None:
+                return []
+
+            completed_quizes = [self._completed_quizes[completed_quiz_id] for completed_quiz_id in quiz.completed_quiz_ids]
+            results = [
+                (completed_quiz.completion_number, completed_quiz.friend_name, completed_quiz.score)
+                for completed_quiz in completed_quizes
+                if completed_quiz.score is not None and completed_quiz.completion_number > after_completion_number
+            ]
+
+        return sorted(results, key=lambda x: (x[1], x[0]))
+
+    def get_unscored_completed_quizes(self) -> dict[int, dict[int, list[tuple[int, int]]]]:
+        quizes: dict[int, dict[int, list[tuple[int, int]]]] = {}
+
+        # Completed quizes are scored as they finish, so this only finds the unfinished ones
+        with self._lock:
+            for completed_quiz in self._completed_quizes.values():
+                if completed_quiz.score is None and completed_quiz.question_answers:
+                    completed_quizes = quizes.setdefault(completed_quiz.quiz_id, {})
+                    completed_quizes[completed_quiz.id] = sorted(completed_quiz.question_answers.items())
+
+        return quizes
+
+    def update_completed_quiz_scores(self, scores: list[tuple[int, float]]):
+        with self._lock:
+            for completed_quiz_id, score in scores:
+                completed_quiz = _get_record(self._completed_quizes, completed_quiz_id)
+                _complete_completed_quiz(self._quizes[completed_quiz.quiz_id], completed_quiz, score)
+
+            self._changes += len(scores)
+
+    def delete_quizes_older_than(self, hours: int, batch_size: int) -> tuple[int, int]:
+        cutoff = int(time.time()) - hours * 3600
+        deleted_quizes = 0
+        deleted_rows = 0
+
+        # Quizes are kept in creation order, so the old ones are at the front
+        # Each batch holds the lock only briefly, like a transaction per batch does with SQLite
+        while True:
+            with self._lock:
+                batch = []
+
+                for quiz in self._quizes.values():
+                    if quiz.creation_time_stamp >= cutoff or len(batch) == batch_size:
+                        break
+
+                    batch.append(quiz)
+
+                for quiz in batch:
+                    deleted_rows += self._delete_quiz(quiz)
+
+                self._changes += len(batch)
+
+            deleted_quizes += len(batch)
+
+            if len(batch) < batch_size:
+                break
+
+        return deleted_quizes, deleted_rows
+
+    def snapshot(self):
+        with self._lock:
+            if self._changes == 0:
+                return
+
+            # Copied as plain tuples while locked, written out after
+            state = (
+                _SNAPSHOT_VERSION,
+                self._next_quiz_id,
+                self._next_completed_quiz_id,
+                [
+                    (
+                        quiz.id,
+                        quiz.token,
+                        quiz.public_token,
+                        quiz.creator_name,
+                        quiz.shuffled_question_indices,
+                        quiz.current_question_index,
+                        quiz.creation_time_stamp,
+                        tuple(quiz.question_answers.items())
+                    )
+                    for quiz in self._quizes.values()
+                ],
+                [
+                    (
+                        completed_quiz.id,
+                        completed_quiz.token,
+                        completed_quiz.friend_name,
+                        completed_quiz.quiz_id,
+                        completed_quiz.current_question_index,
+                        tuple(completed_quiz.question_answers.items()),
+                        completed_quiz.score,
+                        completed_quiz.completion_number
+                    )
+                    for completed_quiz in self._completed_quizes.values()
+                ]
+            )
+            self._changes = 0
+
+        # Replacing the file keeps the previous snapshot whole until the new one is
+        # The temporary file is unique, so that it is never written by two threads or processes at once
+        directory, name = os.path.split(os.path.abspath(self._snapshot_path))
+        descriptor, temporary_path = tempfile.mkstemp(prefix=f"{name}.", suffix=".tmp", dir=directory)
+
+        try:
+            with os.fdopen(descriptor, "wb") as file:
+                pickle.dump(state, file, protocol=pickle.HIGHEST_PROTOCOL)
+
+            os.replace(temporary_path, self._snapshot_path)
+        except BaseException:
+            os.unlink(temporary_path)
+            raise
+
+    def close(self):
+        if self._snapshot_path is None or self._stop.is_set():
+            return
+
+        self._stop.set()
+
+        if self._thread is not None:
+            self._thread.join()
+
+        self.snapshot()
+
+    def _run(self):
+        while not self._stop.wait(self._snapshot_interval):
+            try:
+                self.snapshot()
+            except (OSError, pickle.PickleError) as err:
+                self._logger.error(f"Error writing storage snapshot: {err}")
+
+    # Unpickling runs arbitrary code, so the snapshot must only ever be written by this application
+    def _load_snapshot(self):
+        try:
+            with open(self._snapshot_path, "rb") as file:
+                state = pickle.load(file)
+        except FileNotFoundError:
+            return
+
+        # Version 1 had no completion numbers, those are given in ID order then
+        if state[0] == 1:
+            state = (_SNAPSHOT_VERSION, *state[1:4], [(*completed_quiz, None) for completed_quiz in state[4]])
+
+        if state[0] != _SNAPSHOT_VERSION:
+            raise database.DatabaseError(None, f"Could not load storage snapshot: unknown version {state[0]}")
+
+        _, self._next_quiz_id, self._next_completed_quiz_id, quizes, completed_quizes = state
+
+        for id_, token, public_token, creator_name, shuffled_question_indices, current_question_index, creation_time_stamp, question_answers in quizes:
+            quiz = _Quiz(id_, token, public_token, creator_name, shuffled_question_indices, creation_time_stamp)
+            quiz.current_question_index = current_question_index
+            quiz.question_answers.update(question_answers)
+
+            self._quizes[id_] = quiz
+            self._quizes_by_token[token] = quiz
+            self._quizes_by_public_token[public_token] = quiz
+
+        for id_, token, friend_name, quiz_id, current_question_index, question_answers, score, completion_number in completed_quizes:
+            quiz = self._quizes[quiz_id]
+            completed_quiz = _CompletedQuiz(id_, token, friend_name, quiz_id)
+            completed_quiz.current_question_index = current_question_index
+            completed_quiz.question_answers.update(question_answers)
+
+            if score is not None:
+                if completion_number is None:
+                    _complete_completed_quiz(quiz, completed_quiz, score)
+                else:
+                    completed_quiz.score = score
+                    completed_quiz.completion_number = completion_number
+                    quiz.completion_count = max(quiz.completion_count, completion_number)
+
+            self._completed_quizes[id_] = completed_quiz
+            self._completed_quizes_by_token[token] = completed_quiz
+            quiz.completed_quiz_ids.append(id_)
+
+    def _delete_quiz(self, quiz: _Quiz) -> int:
+        # Counted like the rows SQLite would delete, an answer being two of them
+        rows = 1 + 2 * len(quiz.question_answers)
+
+        for completed_quiz_id in quiz.completed_quiz_ids:
+            completed_quiz = self._completed_quizes.pop(completed_quiz_id)
+            del self._completed_quizes_by_token[completed_quiz.token]
+            rows += 1 + 2 * len(completed_quiz.question_answers)
+
+        del self._quizes[quiz.id]
+        del self._quizes_by_token[quiz.token]
+        del self._quizes_by_public_token[quiz.public_token]
+
+        return rows
+
+
+def _complete_completed_quiz(quiz: _Quiz, completed_quiz: _CompletedQuiz, score: float):
+    quiz.completion_count += 1
+    completed_quiz.score = score
+    completed_quiz.completion_number = quiz.completion_count
+
+
+def _get_record(records: dict[int, Any], id_: int) -> Any:
+    record = records.get(id_)
+
+    if record is None:
+        raise database.NotFoundError(f"Could not find entity with ID {id_}")
+
+    return record
+
+
+def _error_unique(column: str) -> database.DatabaseError:
+    return database.DatabaseError(database.sqlite3.SQLITE_CONSTRAINT_UNIQUE, f"Could not insert into table: UNIQUE constraint failed: {column}")
+
+
+def _error_check(constraint: str) -> database.DatabaseError:
+    return database.DatabaseError(database.sqlite3.SQLITE_CONSTRAINT_CHECK, f"Could not insert into table: CHECK constraint failed: {constraint}")
+
+
+# The same rules as the schema, so that both backends reject the same input the same way
+def _validate_name(name: str) -> str:
+    name = name.strip(" ")
+
+    if not 1 <= len(name) <= 18:
+        raise database.DatabaseError(database.sqlite3.SQLITE_CONSTRAINT_TRIGGER, "Could not insert into table: Invalid name")
+
+    return name
+
+
+def _validate_question_answers(question_answers: dict[int, int], new_question_answers: list[tuple[int, int]]):
+    question_indices = set(question_answers)
+
+    for question_index, answer_mask in new_question_answers:
+        if question_index < 0:
+            raise _error_check("QuestionIndex >= 0")
+
+        if type(answer_mask) is not int or answer_mask <= 0:
+            raise _error_check("AnswerMask > 0")
+
+        if question_index in question_indices:
+            raise database.DatabaseError(database.sqlite3.SQLITE_CONSTRAINT_UNIQUE, "Could not insert into table: Duplicate question answer")
+
+        question_indices.add(question_index)
+
+    if len(question_indices) > 20:
+        raise _error_check("QuestionCount BETWEEN 0 AND 20")
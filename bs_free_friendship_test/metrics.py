@@ -0,0 +1,333 @@
+from __future__ import annotations
+
+import hmac
+import time
+import sqlite3
+import threading
+
+import flask as fl
+
+g_blueprint = fl.Blueprint("metrics", __name__)
+
+_PREFIX = "bs_free_friendship_test"
+_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+_STATEMENT_BUCKETS = (0, 1, 2, 4, 8, 16, 32, 64, 128)
+_PURGE_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0)
+
+# The statistics of the request being handled by this thread, if any
+_g_local = threading.local()
+
+
+class _RequestStatistics:
+    __slots__ = ("begin", "status", "statements", "sql_time", "slowest_time", "slowest_statement")
+
+    def __init__(self):
+        self.begin = time.perf_counter()
+        self.status = 500  # Until a response is made
+        self.statements = 0
+        self.sql_time = 0.0
+        self.slowest_time = 0.0
+        self.slowest_statement = ""
+
+    # The statement's duration so far decides the slowest one, as its fetches are timed separately
+    def add(self, statement: str, duration: float, statement_duration: float):
+        self.sql_time += duration
+
+        if statement_duration > self.slowest_time:
+            self.slowest_time = statement_duration
+            self.slowest_statement = statement
+
+
+class Counter:
+    def __init__(self, name: str, help_: str, label_names: tuple[str, ...] = ()):
+        self._name = name
+        self._help = help_
+        self._label_names = label_names
+        self._values: dict[tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def increment(self, labels: tuple[str, ...] = (), amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self._name} {self._help}", f"# TYPE {self._name} counter"]
+
+        with self._lock:
+            # Without labels there is exactly one series, which exists from the start
+            if not self._label_names and not self._values:
+                lines.append(f"{self._name} 0")
+
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self._name}{_format_labels(self._label_names, labels)} {_format_value(value)}")
+
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_: str, buckets: tuple[float, ...], label_names: tuple[str, ...] = ()):
+        self._name = name
+        self._help = help_
+        self._buckets = buckets
+        self._label_names = label_names
+        self._values: dict[tuple[str, ...], tuple[list[int], list[float]]] = {}  # Bucket counts and [sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, labels: tuple[str, ...] = ()):
+        with self._lock:
+            counts, totals = self._values.setdefault(labels, ([0] * len(self._buckets), [0.0, 0.0]))
+
+            for i, bound in enumerate(self._buckets):
+                if value <= bound:
+                    counts[i] += 1
+
+            totals[0] += value
+            totals[1] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self._name} {self._help}", f"# TYPE {self._name} histogram"]
+        label_names = self._label_names + ("le",)
+
+        with self._lock:
+            for labels, (counts, totals) in sorted(self._values.items()):
+                for bound, count in zip(self._buckets, counts):
+                    lines.append(f"{self._name}_bucket{_format_labels(label_names, labels + (_format_value(bound),))} {count}")
+
+                lines.append(f"{self._name}_bucket{_format_labels(label_names, labels + ('+Inf',))} {int(totals[1])}")
+                lines.append(f"{self._name}_sum{_format_labels(self._label_names, labels)} {_format_value(totals[0])}")
+                lines.append(f"{self._name}_count{_format_labels(self._label_names, labels)} {int(totals[1])}")
+
+        return lines
+
+
+class Metrics:
+    def __init__(self):
+        self.requests = Counter(f"{_PREFIX}_requests_total", "Requests handled", ("endpoint", "method", "status"))
+        self.request_duration = Histogram(
+            f"{_PREFIX}_request_duration_seconds", "Time to build a response", _LATENCY_BUCKETS, ("endpoint", "method")
+        )
+        self.request_statements = Histogram(
+            f"{_PREFIX}_request_sql_statements",
+            "SQL statements per request, trigger statements and those run by the group commit writer included",
+            _STATEMENT_BUCKETS,
+            ("endpoint",)
+        )
+        self.request_sql_duration = Histogram(
+            f"{_PREFIX}_request_sql_duration_seconds",
+            "Time spent in SQLite per request, group commits excluded, as their batches are shared",
+            _LATENCY_BUCKETS,
+            ("endpoint",)
+        )
+        self.slow_requests = Counter(f"{_PREFIX}_slow_requests_total", "Requests over the slow request threshold", ("endpoint",))
+        self.purge_duration = Histogram(f"{_PREFIX}_purge_duration_seconds", "Time to purge expired quizes", _PURGE_BUCKETS)
+        self.purge_deleted_quizes = Counter(f"{_PREFIX}_purge_deleted_quizes_total", "Expired quizes deleted")
+        self.purge_deleted_rows = Counter(f"{_PREFIX}_purge_deleted_rows_total", "Rows deleted by purges, cascades included")
+        self.purge_errors = Counter(f"{_PREFIX}_purge_errors_total", "Purges that failed")
+
+
+# Connections created by the database module time their statements for the current request
+# The trace callback only reports statements as they start, so it is used for counting
+class InstrumentedConnection(sqlite3.Connection):
+    def execute(self, sql: str, parameters=(), /) -> sqlite3.Cursor:
+        if getattr(_g_local, "request", None) is None:
+            return super().execute(sql, parameters)
+
+        return self.cursor(InstrumentedCursor).execute(sql, parameters)
+
+    def commit(self):
+        statistics = getattr(_g_local, "request", None)
+
+        if statistics is None:
+            return super().commit()
+
+        begin = time.perf_counter()
+
+        try:
+            return super().commit()
+        finally:
+            duration = time.perf_counter() - begin
+            statistics.add("COMMIT", duration, duration)
+
+
+# SQLite produces the rows of a query as they are fetched, so the fetches count towards the statement as well
+class InstrumentedCursor(sqlite3.Cursor):
+    def execute(self, sql: str, parameters=(), /) -> sqlite3.Cursor:
+        self._statement = sql
+        self._duration = 0.0
+
+        return self._timed(super().execute, sql, parameters)
+
+    def fetchone(self):
+        return self._timed(super().fetchone)
+
+    def fetchmany(self, *args):
+        return self._timed(super().fetchmany, *args)
+
+    def fetchall(self):
+        return self._timed(super().fetchall)
+
+    def __next__(self):
+        return self._timed(super().__next__)
+
+    def _timed(self, function, *args):
+        statistics = getattr(_g_local, "request", None)
+
+        if statistics is None or not hasattr(self, "_statement"):
+            return function(*args)
+
+        begin = time.perf_counter()
+
+        try:
+            return function(*args)
+        finally:
+            duration = time.perf_counter() - begin
+            self._duration += duration
+            statistics.add(self._statement, duration, self._duration)
+
+
+# Hands the statistics of the request to the thread running its statements, such as the group commit writer
+def get_request_statistics() -> _RequestStatistics | None:
+    return getattr(_g_local, "request", None)
+
+
+def set_request_statistics(statistics: _RequestStatistics | None):
+    _g_local.request = statistics
+
+
+def trace_statement(_statement: str):
+    statistics = getattr(_g_local, "request", None)
+
+    if statistics is not None:
+        statistics.statements += 1
+
+
+def initialize_metrics(application: fl.Flask):
+    application.extensions["metrics"] = Metrics()
+    application.before_request(_begin_request)
+    application.after_request(_record_status)
+    application.teardown_request(_end_request)
+
+
+# The endpoint is only served with a token, which scrapers send as a bearer token
+def is_enabled(application: fl.Flask) -> bool:
+    return application.config["METRICS_TOKEN"] is not None
+
+
+def record_purge(application: fl.Flask, duration: float, deleted_quizes: int, deleted_rows: int):
+    metrics: Metrics = application.extensions["metrics"]
+    metrics.purge_duration.observe(duration)
+    metrics.purge_deleted_quizes.increment(amount=deleted_quizes)
+    metrics.purge_deleted_rows.increment(amount=deleted_rows)
+
+
+def record_purge_error(application: fl.Flask):
+    application.extensions["metrics"].purge_errors.increment()
+
+
+@g_blueprint.route("/metrics")
+def _metrics():
+    from . import cache
+    from . import database
+
+    authorization = fl.request.headers.get("Authorization", "")
+    expected = f"Bearer {fl.current_app.config['METRICS_TOKEN']}"
+
+    if not hmac.compare_digest(authorization.encode(), expected.encode()):
+        fl.abort(401)
+
+    metrics: Metrics = fl.current_app.extensions["metrics"]
+    lines: list[str] = []
+
+    for metric in (
+        metrics.requests,
+        metrics.request_duration,
+        metrics.request_statements,
+        metrics.request_sql_duration,
+        metrics.slow_requests,
+        metrics.purge_duration,
+        metrics.purge_deleted_quizes,
+        metrics.purge_deleted_rows,
+        metrics.purge_errors
+    ):
+        lines.extend(metric.render())
+
+    lines.extend(_render_statistics("database_pool", database.get_pool_statistics(fl.current_app), ("checkouts", "waits")))
+    lines.extend(_render_statistics("quiz_cache", cache.get_quiz_cache_statistics(fl.current_app), ("hits", "misses")))
+
+    writer_statistics = database.get_writer_statistics(fl.current_app)
+
+    if writer_statistics is not None:
+        lines.extend(_render_statistics("database_writer", writer_statistics, ("batches", "writes")))
+
+    return fl.Response("\n".join(lines) + "\n", mimetype="text/plain; version=0.0.4")
+
+
+def _begin_request():
+    _g_local.request = _RequestStatistics()
+
+
+def _record_status(response: fl.Response) -> fl.Response:
+    statistics: _RequestStatistics | None = getattr(_g_local, "request", None)
+
+    if statistics is not None:
+        statistics.status = response.status_code
+
+    return response
+
+
+# Runs even when the request raised, unlike after_request
+def _end_request(_=None):
+    statistics: _RequestStatistics | None = getattr(_g_local, "request", None)
+    _g_local.request = None
+
+    if statistics is None:
+        return
+
+    duration = time.perf_counter() - statistics.begin
+    endpoint = fl.request.endpoint or "<unknown>"
+    metrics: Metrics = fl.current_app.extensions["metrics"]
+
+    metrics.requests.increment((endpoint, fl.request.method, str(statistics.status)))
+    metrics.request_duration.observe(duration, (endpoint, fl.request.method))
+    metrics.request_statements.observe(statistics.statements, (endpoint,))
+    metrics.request_sql_duration.observe(statistics.sql_time, (endpoint,))
+
+    if duration >= fl.current_app.config["SLOW_REQUEST_THRESHOLD"]:
+        metrics.slow_requests.increment((endpoint,))
+        fl.current_app.logger.warning(
+            f"Slow request {fl.request.method} {fl.request.path}: {duration * 1000:.1f} ms, "
+            f"{statistics.statements} statements, {statistics.sql_time * 1000:.1f} ms in SQLite, "
+            f"slowest {statistics.slowest_time * 1000:.1f} ms: {' '.join(statistics.slowest_statement.split())}"
+        )
+
+
+# The counters only ever increase, everything else is a gauge
+def _render_statistics(name: str, statistics: dict[str, int], counters: tuple[str, ...]) -> list[str]:
+    lines = []
+
+    for key, value in statistics.items():
+        if key in counters:
+            metric_name = f"{_PREFIX}_{name}_{key}_total"
+            lines.extend([f"# TYPE {metric_name} counter", f"{metric_name} {_format_value(value)}"])
+        else:
+            metric_name = f"{_PREFIX}_{name}_{key}"
+            lines.extend([f"# TYPE {metric_name} gauge", f"{metric_name} {_format_value(value)}"])
+
+    return lines
+
+
+def _format_labels(label_names: tuple[str, ...], labels: tuple[str, ...]) -> str:
+    if not label_names:
+        return ""
+
+    pairs = ",".join(f'{name}="{_escape_label(value)}"' for name, value in zip(label_names, labels))
+
+    return f"{{{pairs}}}"
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+import os
+import gzip
+import hashlib
+from typing import Any, Callable, Iterable
+
+import flask as fl
+import werkzeug.http
+import werkzeug.wsgi
+import werkzeug.datastructures
+
+_COMPRESSIBLE_MIMETYPES = ("text/html", "application/json")
+
+
+# Buffers HTML and JSON responses to give them an ETag, answer If-None-Match and gzip them
+# Anything else, like streams, passes through untouched
+class CompressionMiddleware:
+    def __init__(self, wsgi_app: Callable, minimum_size: int, level: int):
+        self._wsgi_app = wsgi_app
+        self._minimum_size = minimum_size
+        self._level = level
+
+    def __call__(self, environ: dict[str, Any], start_response: Callable) -> Iterable[bytes]:
+        captured: dict[str, Any] = {}
+        body: list[bytes] = []
+
+        def capture(status: str, headers: list[tuple[str, str]], exc_info=None):
+            captured["status"] = status
+            captured["headers"] = headers
+            captured["exc_info"] = exc_info
+
+            return body.append
+
+        app_iter = self._wsgi_app(environ, capture)
+        headers = werkzeug.datastructures.Headers(captured["headers"])
+
+        if not self._should_buffer(environ, captured["status"], headers):
+            start_response(captured["status"], captured["headers"], captured["exc_info"])
+
+            if body:
+                return werkzeug.wsgi.ClosingIterator(body + list(app_iter), getattr(app_iter, "close", None))
+
+            return app_iter
+
+        try:
+            data = b"".join(body) + b"".join(app_iter)
+        finally:
+            if hasattr(app_iter, "close"):
+                app_iter.close()
+
+        # Weak, as the same validator is used for the plain and the compressed bytes
+        if "ETag" not in headers:
+            headers["ETag"] = werkzeug.http.quote_etag(hashlib.sha256(data).hexdigest()[:16], weak=True)
+
+        headers["Vary"] = _add_vary(headers.get("Vary"), "Accept-Encoding")
+
+        if werkzeug.http.parse_etags(environ.get("HTTP_IF_NONE_MATCH")).contains_weak(werkzeug.http.unquote_etag(headers["ETag"])[0]):
+            start_response("304 Not Modified", _not_modified_headers(headers))
+            return []
+
+        accept_encodings = werkzeug.http.parse_accept_header(environ.get("HTTP_ACCEPT_ENCODING"))
+
+        if len(data) >= self._minimum_size and accept_encodings["gzip"]:
+            data = gzip.compress(data, compresslevel=self._level)
+            headers["Content-Encoding"] = "gzip"
+
+        headers["Content-Length"] = str(len(data))
+        start_response(captured["status"], headers.to_wsgi_list(), captured["exc_info"])
+
+        return [data]
+
+    @staticmethod
+    def _should_buffer(environ: dict[str, Any], status: str, headers: werkzeug.datastructures.Headers) -> bool:
+        return (
+            environ["REQUEST_METHOD"] == "GET"
+            and status.startswith("200")
+            and "Content-Encoding" not in headers
+            and headers.get("Content-Type", "").split(";")[0].strip() in _COMPRESSIBLE_MIMETYPES
+        )
+
+
+def initialize_page_version(application: fl.Flask):
+    # Pages only stay the same as long as their templates, questions and the assets they link to do
+    digest = hashlib.sha256()
+
+    for directory, _, file_names in sorted(os.walk(os.path.join(application.root_path, application.template_folder))):
+        for file_name in sorted(file_names):
+            with open(os.path.join(directory, file_name), "rb") as file:
+                digest.update(file.read())
+
+    with application.open_resource("questions.json") as file:
+        digest.update(file.read())
+
+    # The fingerprinted names change with the contents, and the previous ones stop being served
+    for name, fingerprinted_name in sorted(application.extensions["assets_manifest"].items()):
+        digest.update(f"{name}\0{fingerprinted_name}\0".encode())
+
+    application.extensions["page_version"] = digest.hexdigest()
+
+
+def immutable_etag(*parts: str) -> str:
+    return hashlib.sha256("\0".join((fl.current_app.extensions["page_version"],) + parts).encode()).hexdigest()[:16]
+
+
+def is_not_modified(etag: str) -> bool:
+    return fl.request.if_none_match.contains_weak(etag)
+
+
+def not_modified(etag: str) -> fl.Response:
+    response = fl.Response(status=304)
+    response.set_etag(etag, weak=True)
+
+    return response
+
+
+def make_immutable_response(etag: str, body: str) -> fl.Response:
+    response = fl.make_response(body)
+    response.set_etag(etag, weak=True)
+
+    return response
+
+
+def _add_vary(vary: str | None, header: str) -> str:
+    values = werkzeug.http.parse_set_header(vary)
+    values.add(header)
+
+    return values.to_header()
+
+
+def _not_modified_headers(headers: werkzeug.datastructures.Headers) -> list[tuple[str, str]]:
+    return [(key, value) for key, value in headers.to_wsgi_list() if key in ("ETag", "Vary", "Cache-Control", "Set-Cookie")]
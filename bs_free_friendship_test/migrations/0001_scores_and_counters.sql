@@ -0,0 +1,21 @@
+-- Store scores and answer counters instead of recomputing them
+
+ALTER TABLE Quiz ADD COLUMN QuestionCount INTEGER NOT NULL DEFAULT 0 CHECK (QuestionCount BETWEEN 0 AND 20);
+ALTER TABLE CompletedQuiz ADD COLUMN Score REAL;
+ALTER TABLE CompletedQuiz ADD COLUMN Completed INTEGER NOT NULL DEFAULT 0 CHECK (Completed IN (0, 1));
+ALTER TABLE CompletedQuiz ADD COLUMN QuestionCount INTEGER NOT NULL DEFAULT 0 CHECK (QuestionCount BETWEEN 0 AND 20);
+
+UPDATE Quiz SET QuestionCount = (SELECT COUNT(*) FROM QuizQuestionAnswer WHERE QuizId = Quiz.Id);
+UPDATE CompletedQuiz SET QuestionCount = (SELECT COUNT(*) FROM CompletedQuizQuestionAnswer WHERE CompletedQuizId = CompletedQuiz.Id);
+
+CREATE INDEX IF NOT EXISTS CompletedQuizFinished ON CompletedQuiz (QuizId, Completed, FriendName);
+
+CREATE TRIGGER IF NOT EXISTS CountQuizQuestionAnswers AFTER INSERT ON QuizQuestionAnswer
+BEGIN
+    UPDATE Quiz SET QuestionCount = QuestionCount + 1 WHERE Id = NEW.QuizId;
+END;
+
+CREATE TRIGGER IF NOT EXISTS CountCompletedQuizQuestionAnswers AFTER INSERT ON CompletedQuizQuestionAnswer
+BEGIN
+    UPDATE CompletedQuiz SET QuestionCount = QuestionCount + 1 WHERE Id = NEW.CompletedQuizId;
+END;
@@ -0,0 +1,5 @@
+-- Indexes for the expiry purge and the cascading delete triggers
+
+CREATE INDEX IF NOT EXISTS QuizCreationTimeStamp ON Quiz (CreationTimeStamp);
+CREATE INDEX IF NOT EXISTS QuizQuestionAnswerQuestionAnswerId ON QuizQuestionAnswer (QuestionAnswerId);
+CREATE INDEX IF NOT EXISTS CompletedQuizQuestionAnswerQuestionAnswerId ON CompletedQuizQuestionAnswer (QuestionAnswerId);
@@ -0,0 +1,14 @@
+-- Enforce one answer per question with unique indexes instead of triggers
+
+-- Added columns cannot be NOT NULL here, but every insert provides them
+ALTER TABLE QuizQuestionAnswer ADD COLUMN QuestionIndex INTEGER;
+ALTER TABLE CompletedQuizQuestionAnswer ADD COLUMN QuestionIndex INTEGER;
+
+UPDATE QuizQuestionAnswer SET QuestionIndex = (SELECT QuestionIndex FROM QuestionAnswer WHERE Id = QuestionAnswerId);
+UPDATE CompletedQuizQuestionAnswer SET QuestionIndex = (SELECT QuestionIndex FROM QuestionAnswer WHERE Id = QuestionAnswerId);
+
+DROP TRIGGER IF EXISTS AvoidDuplicateQuestionAnswers;
+DROP TRIGGER IF EXISTS AvoidDuplicateCompletedQuestionAnswers;
+
+CREATE UNIQUE INDEX IF NOT EXISTS QuizQuestionAnswerQuestionIndex ON QuizQuestionAnswer (QuizId, QuestionIndex);
+CREATE UNIQUE INDEX IF NOT EXISTS CompletedQuizQuestionAnswerQuestionIndex ON CompletedQuizQuestionAnswer (CompletedQuizId, QuestionIndex);
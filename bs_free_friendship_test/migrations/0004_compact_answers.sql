@@ -0,0 +1,70 @@
+-- Store the shuffled question order as one byte per index and answers as bitmasks
+-- SQLite cannot change column types, so both tables are rebuilt, together with what depends on them
+
+DROP TRIGGER IF EXISTS CountQuizQuestionAnswers;
+DROP TRIGGER IF EXISTS DeleteQuizQuestionAnswer;
+DROP TRIGGER IF EXISTS DeleteCompletedQuizQuestionAnswer;
+
+CREATE TABLE NewQuiz (
+    Id TEXT NOT NULL PRIMARY KEY,
+    PublicId TEXT NOT NULL UNIQUE,  -- Not primary key
+    CreatorName TEXT NOT NULL CHECK (LENGTH(TRIM(CreatorName)) BETWEEN 1 AND 18),
+    ShuffledQuestionIndices BLOB NOT NULL CHECK (TYPEOF(ShuffledQuestionIndices) = 'blob' AND LENGTH(ShuffledQuestionIndices) > 0),  -- One byte per index
+    CurrentQuestionIndex INTEGER NOT NULL CHECK (CurrentQuestionIndex >= 0),  -- Index in the shuffled list
+    CreationTimeStamp INTEGER NOT NULL,
+    QuestionCount INTEGER NOT NULL DEFAULT 0 CHECK (QuestionCount BETWEEN 0 AND 20)  -- Maintained by trigger
+);
+
+INSERT INTO NewQuiz (Id, PublicId, CreatorName, ShuffledQuestionIndices, CurrentQuestionIndex, CreationTimeStamp, QuestionCount)
+SELECT Id, PublicId, CreatorName, INDICES_TO_BLOB(ShuffledQuestionIndices), CurrentQuestionIndex, CreationTimeStamp, QuestionCount FROM Quiz;
+
+DROP TABLE Quiz;
+ALTER TABLE NewQuiz RENAME TO Quiz;
+
+CREATE TABLE NewQuestionAnswer (
+    Id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT,
+    QuestionIndex INTEGER NOT NULL CHECK (QuestionIndex >= 0),
+    AnswerMask INTEGER NOT NULL CHECK (TYPEOF(AnswerMask) = 'integer' AND AnswerMask > 0)  -- Bit i is set when answer i is chosen
+);
+
+INSERT INTO NewQuestionAnswer (Id, QuestionIndex, AnswerMask)
+SELECT Id, QuestionIndex, INDICES_TO_MASK(AnswerIndices) FROM QuestionAnswer;
+
+DROP TABLE QuestionAnswer;
+ALTER TABLE NewQuestionAnswer RENAME TO QuestionAnswer;
+
+CREATE INDEX IF NOT EXISTS QuizCreationTimeStamp ON Quiz (CreationTimeStamp);
+
+CREATE TRIGGER IF NOT EXISTS CountQuizQuestionAnswers AFTER INSERT ON QuizQuestionAnswer
+BEGIN
+    UPDATE Quiz SET QuestionCount = QuestionCount + 1 WHERE Id = NEW.QuizId;
+END;
+
+CREATE TRIGGER IF NOT EXISTS DeleteQuiz BEFORE DELETE ON Quiz
+BEGIN
+    DELETE FROM QuizQuestionAnswer WHERE QuizId = OLD.Id;
+    DELETE FROM CompletedQuiz WHERE QuizId = OLD.Id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS DeleteQuizQuestionAnswer BEFORE DELETE ON QuizQuestionAnswer
+BEGIN
+    DELETE FROM QuestionAnswer WHERE Id = OLD.QuestionAnswerId;
+END;
+
+CREATE TRIGGER IF NOT EXISTS DeleteCompletedQuizQuestionAnswer BEFORE DELETE ON CompletedQuizQuestionAnswer
+BEGIN
+    DELETE FROM QuestionAnswer WHERE Id = OLD.QuestionAnswerId;
+END;
+
+CREATE TRIGGER IF NOT EXISTS SanitizeQuizInsert AFTER INSERT ON Quiz
+BEGIN
+    UPDATE Quiz SET CreatorName = TRIM(NEW.CreatorName) WHERE Id = NEW.Id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS ValidateQuizInsert BEFORE INSERT ON Quiz
+BEGIN
+    SELECT CASE
+        WHEN LENGTH(TRIM(NEW.CreatorName)) NOT BETWEEN 1 AND 18
+        THEN RAISE(ABORT, "Invalid name")
+    END;
+END;
@@ -0,0 +1,146 @@
+-- Use integer keys internally and 16 byte tokens in URLs
+-- The old IDs were hexadecimal UUIDs, which become the tokens, so existing links keep working
+
+DROP TRIGGER IF EXISTS CountQuizQuestionAnswers;
+DROP TRIGGER IF EXISTS CountCompletedQuizQuestionAnswers;
+DROP TRIGGER IF EXISTS DeleteQuiz;
+DROP TRIGGER IF EXISTS DeleteCompletedQuiz;
+DROP TRIGGER IF EXISTS DeleteQuizQuestionAnswer;
+DROP TRIGGER IF EXISTS DeleteCompletedQuizQuestionAnswer;
+DROP TRIGGER IF EXISTS SanitizeQuizInsert;
+DROP TRIGGER IF EXISTS ValidateQuizInsert;
+DROP TRIGGER IF EXISTS SanitizeCompletedQuizInsert;
+DROP TRIGGER IF EXISTS ValidateCompletedQuizInsert;
+
+CREATE TABLE NewQuiz (
+    Id INTEGER NOT NULL PRIMARY KEY,  -- Internal only, URLs use the tokens
+    Token BLOB NOT NULL UNIQUE CHECK (TYPEOF(Token) = 'blob' AND LENGTH(Token) = 16),
+    PublicToken BLOB NOT NULL UNIQUE CHECK (TYPEOF(PublicToken) = 'blob' AND LENGTH(PublicToken) = 16),
+    CreatorName TEXT NOT NULL CHECK (LENGTH(TRIM(CreatorName)) BETWEEN 1 AND 18),
+    ShuffledQuestionIndices BLOB NOT NULL CHECK (TYPEOF(ShuffledQuestionIndices) = 'blob' AND LENGTH(ShuffledQuestionIndices) > 0),  -- One byte per index
+    CurrentQuestionIndex INTEGER NOT NULL CHECK (CurrentQuestionIndex >= 0),  -- Index in the shuffled list
+    CreationTimeStamp INTEGER NOT NULL,
+    QuestionCount INTEGER NOT NULL DEFAULT 0 CHECK (QuestionCount BETWEEN 0 AND 20)  -- Maintained by trigger
+);
+
+CREATE TABLE NewCompletedQuiz (
+    Id INTEGER NOT NULL PRIMARY KEY,  -- Internal only, URLs use the token
+    Token BLOB NOT NULL UNIQUE CHECK (TYPEOF(Token) = 'blob' AND LENGTH(Token) = 16),
+    FriendName TEXT NOT NULL CHECK (LENGTH(TRIM(FriendName)) BETWEEN 1 AND 18),
+    CurrentQuestionIndex INTEGER NOT NULL CHECK (CurrentQuestionIndex BETWEEN 0 AND 20 - 1),  -- Index in the list (20)
+    QuizId INTEGER NOT NULL,
+    QuestionCount INTEGER NOT NULL DEFAULT 0 CHECK (QuestionCount BETWEEN 0 AND 20),  -- Maintained by trigger
+    Score REAL,  -- Computed once, when the last question is answered
+    Completed INTEGER NOT NULL DEFAULT 0 CHECK (Completed IN (0, 1)),
+
+    FOREIGN KEY (QuizId) REFERENCES Quiz (Id)
+);
+
+CREATE TABLE NewQuizQuestionAnswer (
+    QuizId INTEGER NOT NULL,
+    QuestionAnswerId INTEGER NOT NULL,
+    QuestionIndex INTEGER NOT NULL,  -- Copy of QuestionAnswer.QuestionIndex, for uniqueness
+
+    PRIMARY KEY (QuizId, QuestionAnswerId),
+    UNIQUE (QuizId, QuestionIndex),
+    FOREIGN KEY (QuizId) REFERENCES Quiz (Id),
+    FOREIGN KEY (QuestionAnswerId) REFERENCES QuestionAnswer (Id)
+);
+
+CREATE TABLE NewCompletedQuizQuestionAnswer (
+    CompletedQuizId INTEGER NOT NULL,
+    QuestionAnswerId INTEGER NOT NULL,
+    QuestionIndex INTEGER NOT NULL,  -- Copy of QuestionAnswer.QuestionIndex, for uniqueness
+
+    PRIMARY KEY (CompletedQuizId, QuestionAnswerId),
+    UNIQUE (CompletedQuizId, QuestionIndex),
+    FOREIGN KEY (CompletedQuizId) REFERENCES CompletedQuiz (Id),
+    FOREIGN KEY (QuestionAnswerId) REFERENCES QuestionAnswer (Id)
+);
+
+INSERT INTO NewQuiz (Token, PublicToken, CreatorName, ShuffledQuestionIndices, CurrentQuestionIndex, CreationTimeStamp, QuestionCount)
+SELECT HEX_TO_BLOB(Id), HEX_TO_BLOB(PublicId), CreatorName, ShuffledQuestionIndices, CurrentQuestionIndex, CreationTimeStamp, QuestionCount FROM Quiz;
+
+INSERT INTO NewCompletedQuiz (Token, FriendName, CurrentQuestionIndex, QuizId, QuestionCount, Score, Completed)
+SELECT HEX_TO_BLOB(CompletedQuiz.Id), FriendName, CompletedQuiz.CurrentQuestionIndex, NewQuiz.Id, CompletedQuiz.QuestionCount, Score, Completed
+FROM CompletedQuiz JOIN NewQuiz ON NewQuiz.Token = HEX_TO_BLOB(CompletedQuiz.QuizId);
+
+INSERT INTO NewQuizQuestionAnswer (QuizId, QuestionAnswerId, QuestionIndex)
+SELECT NewQuiz.Id, QuestionAnswerId, QuestionIndex
+FROM QuizQuestionAnswer JOIN NewQuiz ON NewQuiz.Token = HEX_TO_BLOB(QuizQuestionAnswer.QuizId);
+
+INSERT INTO NewCompletedQuizQuestionAnswer (CompletedQuizId, QuestionAnswerId, QuestionIndex)
+SELECT NewCompletedQuiz.Id, QuestionAnswerId, QuestionIndex
+FROM CompletedQuizQuestionAnswer JOIN NewCompletedQuiz ON NewCompletedQuiz.Token = HEX_TO_BLOB(CompletedQuizQuestionAnswer.CompletedQuizId);
+
+DROP TABLE Quiz;
+DROP TABLE CompletedQuiz;
+DROP TABLE QuizQuestionAnswer;
+DROP TABLE CompletedQuizQuestionAnswer;
+
+ALTER TABLE NewQuiz RENAME TO Quiz;
+ALTER TABLE NewCompletedQuiz RENAME TO CompletedQuiz;
+ALTER TABLE NewQuizQuestionAnswer RENAME TO QuizQuestionAnswer;
+ALTER TABLE NewCompletedQuizQuestionAnswer RENAME TO CompletedQuizQuestionAnswer;
+
+CREATE INDEX IF NOT EXISTS CompletedQuizFinished ON CompletedQuiz (QuizId, Completed, FriendName);
+CREATE INDEX IF NOT EXISTS QuizCreationTimeStamp ON Quiz (CreationTimeStamp);
+CREATE INDEX IF NOT EXISTS QuizQuestionAnswerQuestionAnswerId ON QuizQuestionAnswer (QuestionAnswerId);
+CREATE INDEX IF NOT EXISTS CompletedQuizQuestionAnswerQuestionAnswerId ON CompletedQuizQuestionAnswer (QuestionAnswerId);
+
+CREATE TRIGGER IF NOT EXISTS CountQuizQuestionAnswers AFTER INSERT ON QuizQuestionAnswer
+BEGIN
+    UPDATE Quiz SET QuestionCount = QuestionCount + 1 WHERE Id = NEW.QuizId;
+END;
+
+CREATE TRIGGER IF NOT EXISTS CountCompletedQuizQuestionAnswers AFTER INSERT ON CompletedQuizQuestionAnswer
+BEGIN
+    UPDATE CompletedQuiz SET QuestionCount = QuestionCount + 1 WHERE Id = NEW.CompletedQuizId;
+END;
+
+CREATE TRIGGER IF NOT EXISTS DeleteQuiz BEFORE DELETE ON Quiz
+BEGIN
+    DELETE FROM QuizQuestionAnswer WHERE QuizId = OLD.Id;
+    DELETE FROM CompletedQuiz WHERE QuizId = OLD.Id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS DeleteCompletedQuiz BEFORE DELETE ON CompletedQuiz
+BEGIN
+    DELETE FROM CompletedQuizQuestionAnswer WHERE CompletedQuizId = OLD.Id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS DeleteQuizQuestionAnswer BEFORE DELETE ON QuizQuestionAnswer
+BEGIN
+    DELETE FROM QuestionAnswer WHERE Id = OLD.QuestionAnswerId;
+END;
+
+CREATE TRIGGER IF NOT EXISTS DeleteCompletedQuizQuestionAnswer BEFORE DELETE ON CompletedQuizQuestionAnswer
+BEGIN
+    DELETE FROM QuestionAnswer WHERE Id = OLD.QuestionAnswerId;
+END;
+
+CREATE TRIGGER IF NOT EXISTS SanitizeQuizInsert AFTER INSERT ON Quiz
+BEGIN
+    UPDATE Quiz SET CreatorName = TRIM(NEW.CreatorName) WHERE Id = NEW.Id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS ValidateQuizInsert BEFORE INSERT ON Quiz
+BEGIN
+    SELECT CASE
+        WHEN LENGTH(TRIM(NEW.CreatorName)) NOT BETWEEN 1 AND 18
+        THEN RAISE(ABORT, "Invalid name")
+    END;
+END;
+
+CREATE TRIGGER IF NOT EXISTS SanitizeCompletedQuizInsert AFTER INSERT ON CompletedQuiz
+BEGIN
+    UPDATE CompletedQuiz SET FriendName = TRIM(NEW.FriendName) WHERE Id = NEW.Id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS ValidateCompletedQuizInsert BEFORE INSERT ON CompletedQuiz
+BEGIN
+    SELECT CASE
+        WHEN LENGTH(TRIM(NEW.FriendName)) NOT BETWEEN 1 AND 18
+        THEN RAISE(ABORT, "Invalid name")
+    END;
+END;
@@ -0,0 +1,111 @@
+-- Never reuse the IDs of deleted quizes and completed quizes, as processes cache finished quizes by ID
+-- AUTOINCREMENT keeps the highest ID ever used in sqlite_sequence, the new IDs are allocated from there
+
+DROP TRIGGER IF EXISTS CountQuizQuestionAnswers;
+DROP TRIGGER IF EXISTS CountCompletedQuizQuestionAnswers;
+DROP TRIGGER IF EXISTS DeleteQuiz;
+DROP TRIGGER IF EXISTS DeleteCompletedQuiz;
+DROP TRIGGER IF EXISTS DeleteQuizQuestionAnswer;
+DROP TRIGGER IF EXISTS DeleteCompletedQuizQuestionAnswer;
+DROP TRIGGER IF EXISTS SanitizeQuizInsert;
+DROP TRIGGER IF EXISTS ValidateQuizInsert;
+DROP TRIGGER IF EXISTS SanitizeCompletedQuizInsert;
+DROP TRIGGER IF EXISTS ValidateCompletedQuizInsert;
+
+CREATE TABLE NewQuiz (
+    Id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT,  -- Internal only, URLs use the tokens
+    Token BLOB NOT NULL UNIQUE CHECK (TYPEOF(Token) = 'blob' AND LENGTH(Token) = 16),
+    PublicToken BLOB NOT NULL UNIQUE CHECK (TYPEOF(PublicToken) = 'blob' AND LENGTH(PublicToken) = 16),
+    CreatorName TEXT NOT NULL CHECK (LENGTH(TRIM(CreatorName)) BETWEEN 1 AND 18),
+    ShuffledQuestionIndices BLOB NOT NULL CHECK (TYPEOF(ShuffledQuestionIndices) = 'blob' AND LENGTH(ShuffledQuestionIndices) > 0),  -- One byte per index
+    CurrentQuestionIndex INTEGER NOT NULL CHECK (CurrentQuestionIndex >= 0),  -- Index in the shuffled list
+    CreationTimeStamp INTEGER NOT NULL,
+    QuestionCount INTEGER NOT NULL DEFAULT 0 CHECK (QuestionCount BETWEEN 0 AND 20)  -- Maintained by trigger
+);
+
+CREATE TABLE NewCompletedQuiz (
+    Id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT,  -- Internal only, URLs use the token
+    Token BLOB NOT NULL UNIQUE CHECK (TYPEOF(Token) = 'blob' AND LENGTH(Token) = 16),
+    FriendName TEXT NOT NULL CHECK (LENGTH(TRIM(FriendName)) BETWEEN 1 AND 18),
+    CurrentQuestionIndex INTEGER NOT NULL CHECK (CurrentQuestionIndex BETWEEN 0 AND 20 - 1),  -- Index in the list (20)
+    QuizId INTEGER NOT NULL,
+    QuestionCount INTEGER NOT NULL DEFAULT 0 CHECK (QuestionCount BETWEEN 0 AND 20),  -- Maintained by trigger
+    Score REAL,  -- Computed once, when the last question is answered
+    Completed INTEGER NOT NULL DEFAULT 0 CHECK (Completed IN (0, 1)),
+
+    FOREIGN KEY (QuizId) REFERENCES Quiz (Id)
+);
+
+INSERT INTO NewQuiz (Id, Token, PublicToken, CreatorName, ShuffledQuestionIndices, CurrentQuestionIndex, CreationTimeStamp, QuestionCount)
+SELECT Id, Token, PublicToken, CreatorName, ShuffledQuestionIndices, CurrentQuestionIndex, CreationTimeStamp, QuestionCount FROM Quiz;
+
+INSERT INTO NewCompletedQuiz (Id, Token, FriendName, CurrentQuestionIndex, QuizId, QuestionCount, Score, Completed)
+SELECT Id, Token, FriendName, CurrentQuestionIndex, QuizId, QuestionCount, Score, Completed FROM CompletedQuiz;
+
+DROP TABLE Quiz;
+DROP TABLE CompletedQuiz;
+
+ALTER TABLE NewQuiz RENAME TO Quiz;
+ALTER TABLE NewCompletedQuiz RENAME TO CompletedQuiz;
+
+CREATE INDEX IF NOT EXISTS CompletedQuizFinished ON CompletedQuiz (QuizId, Completed, FriendName);
+CREATE INDEX IF NOT EXISTS QuizCreationTimeStamp ON Quiz (CreationTimeStamp);
+CREATE INDEX IF NOT EXISTS QuizQuestionAnswerQuestionAnswerId ON QuizQuestionAnswer (QuestionAnswerId);
+CREATE INDEX IF NOT EXISTS CompletedQuizQuestionAnswerQuestionAnswerId ON CompletedQuizQuestionAnswer (QuestionAnswerId);
+
+CREATE TRIGGER IF NOT EXISTS CountQuizQuestionAnswers AFTER INSERT ON QuizQuestionAnswer
+BEGIN
+    UPDATE Quiz SET QuestionCount = QuestionCount + 1 WHERE Id = NEW.QuizId;
+END;
+
+CREATE TRIGGER IF NOT EXISTS CountCompletedQuizQuestionAnswers AFTER INSERT ON CompletedQuizQuestionAnswer
+BEGIN
+    UPDATE CompletedQuiz SET QuestionCount = QuestionCount + 1 WHERE Id = NEW.CompletedQuizId;
+END;
+
+CREATE TRIGGER IF NOT EXISTS DeleteQuiz BEFORE DELETE ON Quiz
+BEGIN
+    DELETE FROM QuizQuestionAnswer WHERE QuizId = OLD.Id;
+    DELETE FROM CompletedQuiz WHERE QuizId = OLD.Id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS DeleteCompletedQuiz BEFORE DELETE ON CompletedQuiz
+BEGIN
+    DELETE FROM CompletedQuizQuestionAnswer WHERE CompletedQuizId = OLD.Id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS DeleteQuizQuestionAnswer BEFORE DELETE ON QuizQuestionAnswer
+BEGIN
+    DELETE FROM QuestionAnswer WHERE Id = OLD.QuestionAnswerId;
+END;
+
+CREATE TRIGGER IF NOT EXISTS DeleteCompletedQuizQuestionAnswer BEFORE DELETE ON CompletedQuizQuestionAnswer
+BEGIN
+    DELETE FROM QuestionAnswer WHERE Id = OLD.QuestionAnswerId;
+END;
+
+CREATE TRIGGER IF NOT EXISTS SanitizeQuizInsert AFTER INSERT ON Quiz
+BEGIN
+    UPDATE Quiz SET CreatorName = TRIM(NEW.CreatorName) WHERE Id = NEW.Id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS ValidateQuizInsert BEFORE INSERT ON Quiz
+BEGIN
+    SELECT CASE
+        WHEN LENGTH(TRIM(NEW.CreatorName)) NOT BETWEEN 1 AND 18
+        THEN RAISE(ABORT, "Invalid name")
+    END;
+END;
+
+CREATE TRIGGER IF NOT EXISTS SanitizeCompletedQuizInsert AFTER INSERT ON CompletedQuiz
+BEGIN
+    UPDATE CompletedQuiz SET FriendName = TRIM(NEW.FriendName) WHERE Id = NEW.Id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS ValidateCompletedQuizInsert BEFORE INSERT ON CompletedQuiz
+BEGIN
+    SELECT CASE
+        WHEN LENGTH(TRIM(NEW.FriendName)) NOT BETWEEN 1 AND 18
+        THEN RAISE(ABORT, "Invalid name")
+    END;
+END;
@@ -0,0 +1,13 @@
+-- Number completed quizes in the order they are completed, which the results stream resumes from
+-- IDs are given when friends start, so they don't follow that order
+-- The existing ones are numbered by ID, the order they finished in is not known
+
+ALTER TABLE CompletedQuiz ADD COLUMN CompletionNumber INTEGER;
+
+UPDATE CompletedQuiz SET CompletionNumber = (
+    SELECT COUNT(*) FROM CompletedQuiz AS Other
+    WHERE Other.QuizId = CompletedQuiz.QuizId AND Other.Completed = 1 AND Other.Id <= CompletedQuiz.Id
+)
+WHERE Completed = 1;
+
+CREATE INDEX IF NOT EXISTS CompletedQuizCompletion ON CompletedQuiz (QuizId, CompletionNumber);
@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+import queue
+import threading
+
+import flask as fl
+
+
+# Hands completed quizes to the creators watching them, within this process only
+class ResultsBroker:
+    def __init__(self, max_subscribers: int):
+        self._max_subscribers = max_subscribers
+        self._subscribers: dict[int, set[queue.SimpleQueue]] = {}
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def subscribe(self, quiz_id: int) -> queue.SimpleQueue | None:
+        with self._lock:
+            # Every subscriber holds a server thread, so don't let them take all of them
+            if self._count >= self._max_subscribers:
+                return None
+
+            subscriber: queue.SimpleQueue = queue.SimpleQueue()
+            self._subscribers.setdefault(quiz_id, set()).add(subscriber)
+            self._count += 1
+
+            return subscriber
+
+    def unsubscribe(self, quiz_id: int, subscriber: queue.SimpleQueue):
+        with self._lock:
+            subscribers = self._subscribers.get(quiz_id)
+
+            if subscribers is None or subscriber not in subscribers:
+                return
+
+            subscribers.remove(subscriber)
+            self._count -= 1
+
+            if not subscribers:
+                del self._subscribers[quiz_id]
+
+    def publish(self, quiz_id: int, result: tuple[int, str, float]):
+        with self._lock:
+            subscribers = list(self._subscribers.get(quiz_id, ()))
+
+        for subscriber in subscribers:
+            subscriber.put(result)
+
+
+def initialize_results_broker(application: fl.Flask):
+    application.extensions["results_broker"] = ResultsBroker(application.config["RESULTS_STREAM_MAX"])
+
+
+def get_results_broker() -> ResultsBroker:
+    return fl.current_app.extensions["results_broker"]
+
+
+def publish_quiz_result(quiz_id: int, completion_number: int, friend_name: str, score: float):
+    get_results_broker().publish(quiz_id, (completion_number, friend_name, score))
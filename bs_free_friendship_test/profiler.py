@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import io
+import os
+import re
+import hmac
+import time
+import random
+import pstats
+import cProfile
+import threading
+from typing import Any, Callable, Iterable
+
+import flask as fl
+
+
+# Profiles a sampled fraction of requests, and those carrying the secret header
+# Only installed when enabled, so otherwise requests don't go through it at all
+class ProfilerMiddleware:
+    def __init__(self, wsgi_app: Callable, directory: str, sample_rate: float, secret: str | None, header: str, top: int):
+        self._wsgi_app = wsgi_app
+        self._directory = directory
+        self._sample_rate = sample_rate
+        self._secret = secret
+        self._environ_header = "HTTP_" + header.upper().replace("-", "_")
+        self._top = top
+
+        # Only one profiler can be active in the process at a time
+        self._lock = threading.Lock()
+
+        os.makedirs(self._directory, exist_ok=True)
+
+    def __call__(self, environ: dict[str, Any], start_response: Callable) -> Iterable[bytes]:
+        if not self._should_profile(environ) or not self._lock.acquire(blocking=False):
+            return self._wsgi_app(environ, start_response)
+
+        profile = cProfile.Profile()
+
+        try:
+            begin = time.perf_counter()
+            profile.enable()
+
+            try:
+                result = self._wsgi_app(environ, start_response)
+            finally:
+                profile.disable()
+
+            duration = time.perf_counter() - begin
+        finally:
+            self._lock.release()
+
+        self._write(profile, environ, duration)
+
+        return result
+
+    def _should_profile(self, environ: dict[str, Any]) -> bool:
+        if self._secret is not None:
+            value = environ.get(self._environ_header)
+
+            if value is not None and hmac.compare_digest(value.encode(), self._secret.encode()):
+                return True
+
+        return self._sample_rate > 0.0 and random.random() < self._sample_rate
+
+    def _write(self, profile: cProfile.Profile, environ: dict[str, Any], duration: float):
+        path = re.sub(r"[^\w-]+", "_", environ.get("PATH_INFO", "")).strip("_") or "index"
+        now = time.time()
+        name = f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}-{int(now * 1000) % 1000:03d}-{environ['REQUEST_METHOD']}-{path[:60]}"
+
+        profile.dump_stats(os.path.join(self._directory, f"{name}.prof"))
+
+        summary = io.StringIO()
+        summary.write(f"{environ['REQUEST_METHOD']} {environ.get('PATH_INFO', '')} {duration * 1000:.1f} ms\n\n")
+        pstats.Stats(profile, stream=summary).sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self._top)
+
+        with open(os.path.join(self._directory, f"{name}.txt"), "w") as file:
+            file.write(summary.getvalue())
+
+
+def is_enabled(application: fl.Flask) -> bool:
+    return application.config["PROFILE_SAMPLE_RATE"] > 0.0 or application.config["PROFILE_SECRET"] is not None
+
+
+def wrap(application: fl.Flask, wsgi_app: Callable) -> ProfilerMiddleware:
+    return ProfilerMiddleware(
+        wsgi_app,
+        os.path.join(application.instance_path, "profiles"),
+        application.config["PROFILE_SAMPLE_RATE"],
+        application.config["PROFILE_SECRET"],
+        application.config["PROFILE_HEADER"],
+        application.config["PROFILE_TOP"]
+    )
@@ -3,34 +3,42 @@ import flask as fl
 from . import database
 from . import static
 from . import common
+from . import fragment
+from . import middleware
 
 
 g_blueprint = fl.Blueprint("quiz", __name__, url_prefix="/quiz")
 
 
-@g_blueprint.route("/start/<public_quiz_id>", methods=("GET", "POST"))
-def _start(public_quiz_id):
+@g_blueprint.route("/start/<public_quiz_token>", methods=("GET", "POST"))
+def _start(public_quiz_token):
+    # Only a finished quiz gets a page, and that never changes, as long as the quiz isn't deleted
+    # Finished quizes are cached, so checking that it is still there is cheap
+    etag = middleware.immutable_etag("quiz.start", public_quiz_token)
+
+    try:
+        quiz_id = common.get_quiz_id_from_public_token(public_quiz_token)
+    except database.DatabaseError as err:
+        fl.flash(str(err))
+        return common.redirect_to_create_start(fl)
+
+    if fl.request.method == "GET" and middleware.is_not_modified(etag):
+        return middleware.not_modified(etag)
+
     if fl.request.method == "POST":
         friend_name = fl.request.form["friend_name"]
 
         try:
-            quiz_id = common.get_quiz_id_from_public_id(public_quiz_id)
-        except database.DatabaseError as err:
-            fl.flash(str(err))
-            return common.redirect_to_create_start(fl)
-
-        try:
-            completed_quiz_id = common.create_new_completed_quiz(friend_name, quiz_id)
+            completed_quiz_token = common.create_new_completed_quiz(friend_name, quiz_id)
         except database.DatabaseError as err:
             fl.flash(str(err))
 
             if err.error_code != database.sqlite3.SQLITE_CONSTRAINT_TRIGGER:
                 common.redirect_to_create_start(fl)
         else:
-            return fl.redirect(fl.url_for("quiz._form", _method="GET", completed_quiz_id=completed_quiz_id))
+            return fl.redirect(fl.url_for("quiz._form", _method="GET", completed_quiz_token=completed_quiz_token))
 
     try:
-        quiz_id = common.get_quiz_id_from_public_id(public_quiz_id)
         question_count = common.get_quiz_question_count(quiz_id)
         _, creator_name, _, _ = common.get_quiz_data(quiz_id)
     except database.DatabaseError as err:
@@ -41,11 +49,19 @@ def _start(public_quiz_id):
         fl.flash("Quiz is not ready")
         return common.redirect_to_create_start(fl)
 
-    return fl.render_template("quiz/start.html", creator_name=creator_name)
+    return middleware.make_immutable_response(etag, fl.render_template("quiz/start.html", creator_name=creator_name))
+
+
+@g_blueprint.route("/form/<completed_quiz_token>", methods=("GET", "POST"))
+def _form(completed_quiz_token):
+    try:
+        state = common.load_completed_quiz_state(completed_quiz_token)
+    except database.DatabaseError as err:
+        fl.flash(str(err))
+        return common.redirect_to_create_start(fl)
 
+    session_cursor = common.load_session_cursor(fl, completed_quiz_token, state)
 
-@g_blueprint.route("/form/<completed_quiz_id>", methods=("GET", "POST"))
-def _form(completed_quiz_id):
     if fl.request.method == "POST":
         question_index, answers = common.get_form_answers(fl.request.form)
 
@@ -53,58 +69,124 @@ def _form(completed_quiz_id):
             fl.flash("You must either submit an answer or skip the question")
         else:
             try:
-                common.add_completed_quiz_question_answer(completed_quiz_id, question_index, answers)
-                common.next_completed_quiz_question(completed_quiz_id)
+                common.add_completed_quiz_question_answer(state, question_index, answers)
             except database.DatabaseError as err:
                 fl.flash(str(err))
 
-                if err.error_code != database.sqlite3.SQLITE_CONSTRAINT_TRIGGER:
+                if err.error_code not in (database.sqlite3.SQLITE_CONSTRAINT_TRIGGER, database.sqlite3.SQLITE_CONSTRAINT_UNIQUE):
                     common.redirect_to_create_start(fl)
+            else:
+                if session_cursor:
+                    common.store_session_cursor(fl, completed_quiz_token, state)
 
-    try:
-        friend_name, current_question_index, quiz_id = common.get_completed_quiz_data(completed_quiz_id)
-        question_count = common.get_completed_quiz_question_count(completed_quiz_id)
-        question_indices = common.get_quiz_question_answer_indices(quiz_id)
-        _, creator_name, _, _ = common.get_quiz_data(quiz_id)
-    except database.DatabaseError as err:
-        fl.flash(str(err))
-        return common.redirect_to_create_start(fl)
+    assert state.question_count <= 20
 
-    assert question_count <= 20
+    if state.question_count == 20:
+        return fl.redirect(fl.url_for("quiz._done", _method="GET", completed_quiz_token=completed_quiz_token))
 
-    if question_count == 20:
-        return fl.redirect(fl.url_for("quiz._done", _method="GET", completed_quiz_id=completed_quiz_id))
+    question_index = state.question_indices[state.current_question_index]
 
     return fl.render_template(
         "quiz/form.html",
-        creator_name=creator_name,
-        friend_name=friend_name,
-        question_count=question_count,
-        question=static.G_QUESTIONS[question_indices[current_question_index]],
-        question_index=question_indices[current_question_index],
-        completed_quiz_id=completed_quiz_id
+        creator_name=state.creator_name,
+        friend_name=state.friend_name,
+        question_count=state.question_count,
+        question=static.G_QUESTIONS[question_index],
+        question_fragment=fragment.get_question_fragment("quiz", question_index),
+        question_index=question_index,
+        completed_quiz_token=completed_quiz_token
     )
 
 
-@g_blueprint.route("/form/<completed_quiz_id>/skip", methods=("POST",))
-def _form_skip(completed_quiz_id):
+@g_blueprint.route("/form/<completed_quiz_token>/skip", methods=("POST",))
+def _form_skip(completed_quiz_token):
     try:
-        common.next_completed_quiz_question(completed_quiz_id)
+        state = common.load_completed_quiz_state(completed_quiz_token)
     except database.DatabaseError as err:
         fl.flash(str(err))
         return common.redirect_to_create_start(fl)
 
-    return fl.redirect(fl.url_for("quiz._form", _method="GET", completed_quiz_id=completed_quiz_id))
+    # In session mode, skipping only moves the cursor kept in the signed cookie
+    session_cursor = common.load_session_cursor(fl, completed_quiz_token, state)
 
+    try:
+        common.next_completed_quiz_question(state, not session_cursor)
+    except database.DatabaseError as err:
+        fl.flash(str(err))
+        return common.redirect_to_create_start(fl)
+
+    if session_cursor:
+        common.store_session_cursor(fl, completed_quiz_token, state)
+
+    return fl.redirect(fl.url_for("quiz._form", _method="GET", completed_quiz_token=completed_quiz_token))
+
+
+@g_blueprint.route("/done/<completed_quiz_token>")
+def _done(completed_quiz_token):
+    # The results of a completed quiz never change, as long as it isn't deleted
+    etag = middleware.immutable_etag("quiz.done", completed_quiz_token)
+
+    try:
+        completed_quiz_id = common.get_completed_quiz_id_from_token(completed_quiz_token)
+    except database.DatabaseError as err:
+        fl.flash(str(err))
+        return common.redirect_to_create_start(fl)
+
+    if middleware.is_not_modified(etag):
+        return middleware.not_modified(etag)
 
-@g_blueprint.route("/done/<completed_quiz_id>")
-def _done(completed_quiz_id):
     try:
         friend_name, _, quiz_id = common.get_completed_quiz_data(completed_quiz_id)
-        quiz_score = common.get_quiz_score(completed_quiz_id)
+        quiz_score, completed = common.get_quiz_score_ex(completed_quiz_id)
         _, creator_name, _, _ = common.get_quiz_data(quiz_id)
     except database.DatabaseError as err:
         fl.flash(str(err))
         return common.redirect_to_create_start(fl)
 
-    return fl.render_template("quiz/done.html", creator_name=creator_name, friend_name=friend_name, quiz_score=int(quiz_score))
+    page = fl.render_template("quiz/done.html", creator_name=creator_name, friend_name=friend_name, quiz_score=int(quiz_score))
+
+    if completed:
+        return middleware.make_immutable_response(etag, page)
+
+    return page
+
+
+# Answers a quiz all at once, for clients running the form themselves
+@g_blueprint.route("/api/<public_quiz_token>", methods=("GET", "POST"))
+def _api(public_quiz_token):
+    try:
+        quiz_id = common.get_quiz_id_from_public_token(public_quiz_token)
+    except database.DatabaseError as err:
+        return common.json_error(fl, err)
+
+    if fl.request.method == "GET":
+        try:
+            _, creator_name, _, _ = common.get_quiz_data(quiz_id)
+            question_answers = common.get_quiz_question_answers(quiz_id)
+        except database.DatabaseError as err:
+            return common.json_error(fl, err)
+
+        if len(question_answers) < 20:
+            return common.json_error(fl, ValueError("Quiz is not ready"))
+
+        return fl.jsonify(
+            creator_name=creator_name,
+            questions=common.get_json_questions([question_index for question_index, _ in question_answers])
+        )
+
+    data = fl.request.get_json(silent=True)
+
+    if not isinstance(data, dict) or not isinstance(data.get("friend_name"), str):
+        return common.json_error(fl, ValueError("Expected a friend name and question answers"))
+
+    try:
+        question_answers = common.get_json_answers(data.get("answers"))
+        completed_quiz_token, quiz_score = common.create_new_answered_completed_quiz(data["friend_name"], quiz_id, question_answers)
+    except (ValueError, database.DatabaseError) as err:
+        return common.json_error(fl, err)
+
+    return fl.jsonify(
+        completed_quiz_token=completed_quiz_token,
+        score=quiz_score,
+        done_url=fl.url_for("quiz._done", completed_quiz_token=completed_quiz_token)
+    ), 201
@@ -4,8 +4,8 @@ DROP TABLE IF EXISTS QuestionAnswer;
 DROP TABLE IF EXISTS QuizQuestionAnswer;
 DROP TABLE IF EXISTS CompletedQuizQuestionAnswer;
 
-DROP TRIGGER IF EXISTS AvoidDuplicateQuestionAnswers;
-DROP TRIGGER IF EXISTS AvoidDuplicateCompletedQuestionAnswers;
+DROP TRIGGER IF EXISTS CountQuizQuestionAnswers;
+DROP TRIGGER IF EXISTS CountCompletedQuizQuestionAnswers;
 
 DROP TRIGGER IF EXISTS DeleteQuiz;
 DROP TRIGGER IF EXISTS DeleteCompletedQuiz;
@@ -18,19 +18,26 @@ DROP TRIGGER IF EXISTS SanitizeCompletedQuizInsert;
 DROP TRIGGER IF EXISTS ValidateCompletedQuizInsert;
 
 CREATE TABLE Quiz (
-    Id TEXT NOT NULL PRIMARY KEY,
-    PublicId TEXT NOT NULL UNIQUE,  -- Not primary key
+    Id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT,  -- Internal only, URLs use the tokens
+    Token BLOB NOT NULL UNIQUE CHECK (TYPEOF(Token) = 'blob' AND LENGTH(Token) = 16),
+    PublicToken BLOB NOT NULL UNIQUE CHECK (TYPEOF(PublicToken) = 'blob' AND LENGTH(PublicToken) = 16),
     CreatorName TEXT NOT NULL CHECK (LENGTH(TRIM(CreatorName)) BETWEEN 1 AND 18),
-    ShuffledQuestionIndices TEXT NOT NULL CHECK (ShuffledQuestionIndices REGEXP "^[0-9]+(,[0-9]+)*$"),  -- Comma separated list of indices
+    ShuffledQuestionIndices BLOB NOT NULL CHECK (TYPEOF(ShuffledQuestionIndices) = 'blob' AND LENGTH(ShuffledQuestionIndices) > 0),  -- One byte per index
     CurrentQuestionIndex INTEGER NOT NULL CHECK (CurrentQuestionIndex >= 0),  -- Index in the shuffled list
-    CreationTimeStamp INTEGER NOT NULL
+    CreationTimeStamp INTEGER NOT NULL,
+    QuestionCount INTEGER NOT NULL DEFAULT 0 CHECK (QuestionCount BETWEEN 0 AND 20)  -- Maintained by trigger
 );
 
 CREATE TABLE CompletedQuiz (
-    Id TEXT NOT NULL PRIMARY KEY,
+    Id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT,  -- Internal only, URLs use the token
+    Token BLOB NOT NULL UNIQUE CHECK (TYPEOF(Token) = 'blob' AND LENGTH(Token) = 16),
     FriendName TEXT NOT NULL CHECK (LENGTH(TRIM(FriendName)) BETWEEN 1 AND 18),
     CurrentQuestionIndex INTEGER NOT NULL CHECK (CurrentQuestionIndex BETWEEN 0 AND 20 - 1),  -- Index in the list (20)
-    QuizId TEXT NOT NULL,
+    QuizId INTEGER NOT NULL,
+    QuestionCount INTEGER NOT NULL DEFAULT 0 CHECK (QuestionCount BETWEEN 0 AND 20),  -- Maintained by trigger
+    Score REAL,  -- Computed once, when the last question is answered
+    Completed INTEGER NOT NULL DEFAULT 0 CHECK (Completed IN (0, 1)),
+    CompletionNumber INTEGER,  -- Order among the quiz's completed quizes, from 1, set together with the score
 
     FOREIGN KEY (QuizId) REFERENCES Quiz (Id)
 );
@@ -38,51 +45,45 @@ CREATE TABLE CompletedQuiz (
 CREATE TABLE QuestionAnswer (
     Id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT,
     QuestionIndex INTEGER NOT NULL CHECK (QuestionIndex >= 0),
-    AnswerIndices TEXT NOT NULL CHECK (AnswerIndices REGEXP "^[0-9]+(,[0-9]+)*$")  -- Comma separated list of indices
+    AnswerMask INTEGER NOT NULL CHECK (TYPEOF(AnswerMask) = 'integer' AND AnswerMask > 0)  -- Bit i is set when answer i is chosen
 );
 
 CREATE TABLE QuizQuestionAnswer (
-    QuizId TEXT NOT NULL,
+    QuizId INTEGER NOT NULL,
     QuestionAnswerId INTEGER NOT NULL,
+    QuestionIndex INTEGER NOT NULL,  -- Copy of QuestionAnswer.QuestionIndex, for uniqueness
 
     PRIMARY KEY (QuizId, QuestionAnswerId),
+    UNIQUE (QuizId, QuestionIndex),
     FOREIGN KEY (QuizId) REFERENCES Quiz (Id),
     FOREIGN KEY (QuestionAnswerId) REFERENCES QuestionAnswer (Id)
 );
 
 CREATE TABLE CompletedQuizQuestionAnswer (
-    CompletedQuizId TEXT NOT NULL,
+    CompletedQuizId INTEGER NOT NULL,
     QuestionAnswerId INTEGER NOT NULL,
+    QuestionIndex INTEGER NOT NULL,  -- Copy of QuestionAnswer.QuestionIndex, for uniqueness
 
     PRIMARY KEY (CompletedQuizId, QuestionAnswerId),
+    UNIQUE (CompletedQuizId, QuestionIndex),
     FOREIGN KEY (CompletedQuizId) REFERENCES CompletedQuiz (Id),
     FOREIGN KEY (QuestionAnswerId) REFERENCES QuestionAnswer (Id)
 );
 
-CREATE TRIGGER IF NOT EXISTS AvoidDuplicateQuestionAnswers AFTER INSERT ON QuizQuestionAnswer
+CREATE INDEX IF NOT EXISTS CompletedQuizFinished ON CompletedQuiz (QuizId, Completed, FriendName);
+CREATE INDEX IF NOT EXISTS CompletedQuizCompletion ON CompletedQuiz (QuizId, CompletionNumber);
+CREATE INDEX IF NOT EXISTS QuizCreationTimeStamp ON Quiz (CreationTimeStamp);
+CREATE INDEX IF NOT EXISTS QuizQuestionAnswerQuestionAnswerId ON QuizQuestionAnswer (QuestionAnswerId);
+CREATE INDEX IF NOT EXISTS CompletedQuizQuestionAnswerQuestionAnswerId ON CompletedQuizQuestionAnswer (QuestionAnswerId);
+
+CREATE TRIGGER IF NOT EXISTS CountQuizQuestionAnswers AFTER INSERT ON QuizQuestionAnswer
 BEGIN
-    SELECT CASE
-        WHEN
-            (
-                SELECT COUNT(*) FROM QuestionAnswer JOIN QuizQuestionAnswer ON QuestionAnswer.Id = QuizQuestionAnswer.QuestionAnswerId
-                WHERE QuizQuestionAnswer.QuizId = NEW.QuizId GROUP BY QuestionIndex HAVING COUNT(QuestionIndex) > 1
-            ) > 1
-        THEN
-            RAISE(ABORT, "Duplicate question answer")
-    END;
+    UPDATE Quiz SET QuestionCount = QuestionCount + 1 WHERE Id = NEW.QuizId;
 END;
 
-CREATE TRIGGER IF NOT EXISTS AvoidDuplicateCompletedQuestionAnswers AFTER INSERT ON CompletedQuizQuestionAnswer
+CREATE TRIGGER IF NOT EXISTS CountCompletedQuizQuestionAnswers AFTER INSERT ON CompletedQuizQuestionAnswer
 BEGIN
-    SELECT CASE
-        WHEN
-            (
-                SELECT COUNT(*) FROM QuestionAnswer JOIN CompletedQuizQuestionAnswer ON QuestionAnswer.Id = CompletedQuizQuestionAnswer.QuestionAnswerId
-                WHERE CompletedQuizQuestionAnswer.CompletedQuizId = NEW.CompletedQuizId GROUP BY QuestionIndex HAVING COUNT(QuestionIndex) > 1
-            ) > 1
-        THEN
-            RAISE(ABORT, "Duplicate question answer")
-    END;
+    UPDATE CompletedQuiz SET QuestionCount = QuestionCount + 1 WHERE Id = NEW.CompletedQuizId;
 END;
 
 CREATE TRIGGER IF NOT EXISTS DeleteQuiz BEFORE DELETE ON Quiz
@@ -131,3 +132,6 @@ BEGIN
         THEN RAISE(ABORT, "Invalid name")
     END;
 END;
+
+-- Latest migration in the migrations directory
+PRAGMA user_version = 7;
@@ -0,0 +1,52 @@
+from __future__ import annotations
+
+import dataclasses
+
+from . import question
+
+
+@dataclasses.dataclass(slots=True, frozen=True)
+class QuizKey:
+    single_type: dict[int, bool]
+    answers: dict[int, int]  # Question index to answer bitmask
+    max_score: int
+
+
+def answer_mask(answer_indices: list[int]) -> int:
+    mask = 0
+
+    for index in answer_indices:
+        mask |= 1 << index
+
+    return mask
+
+
+def compile_quiz(quiz_question_answers: list[tuple[int, int]], questions: list[question.Question]) -> QuizKey:
+    single_type: dict[int, bool] = {}
+    answers: dict[int, int] = {}
+    max_score = 0
+
+    for question_index, mask in quiz_question_answers:
+        single_type[question_index] = questions[question_index].single_type
+        answers[question_index] = mask
+
+        max_score += 1 if single_type[question_index] else mask.bit_count()
+
+    return QuizKey(single_type, answers, max_score)
+
+
+def score(key: QuizKey, completed_quiz_question_answers: list[tuple[int, int]]) -> float:
+    total = 0
+
+    for question_index, completed_mask in completed_quiz_question_answers:
+        mask = key.answers[question_index]
+
+        if key.single_type[question_index]:
+            total += int(mask == completed_mask)
+        else:
+            # Matching choices count, mismatching choices on either side subtract
+            total += max((mask & completed_mask).bit_count() - (mask ^ completed_mask).bit_count(), 0)
+
+    assert total <= key.max_score
+
+    return float(total * 100) / float(key.max_score)
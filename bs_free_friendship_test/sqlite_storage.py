@@ -0,0 +1,476 @@
+from __future__ import annotations
+
+import time
+
+import flask as fl
+
+from . import database
+from . import scoring
+from . import static
+from . import storage
+
+
+def _error_select(err: database.sqlite3.Error) -> database.DatabaseError:
+    return database.DatabaseError(err.sqlite_errorcode, f"Could not select from table: {err}")
+
+
+def _error_insert(err: database.sqlite3.Error) -> database.DatabaseError:
+    return database.DatabaseError(err.sqlite_errorcode, f"Could not insert into table: {err}")
+
+
+def _error_update(err: database.sqlite3.Error) -> database.DatabaseError:
+    return database.DatabaseError(err.sqlite_errorcode, f"Could not update table: {err}")
+
+
+def _error_delete(err: database.sqlite3.Error) -> database.DatabaseError:
+    return database.DatabaseError(err.sqlite_errorcode, f"Could not delete from table: {err}")
+
+
+def _error_insert_answer(err: database.sqlite3.Error) -> database.DatabaseError:
+    # Keep the message users saw when duplicates were rejected by a trigger
+    if err.sqlite_errorcode == database.sqlite3.SQLITE_CONSTRAINT_UNIQUE:
+        return database.DatabaseError(err.sqlite_errorcode, "Could not insert into table: Duplicate question answer")
+
+    return _error_insert(err)
+
+
+class SqliteStorage(storage.Storage):
+    def __init__(self, application: fl.Flask):
+        self._application = application
+
+    def create_quiz_tokens(self) -> tuple[bytes, bytes]:
+        token = storage.create_token()
+
+        return token, _create_token(database.shard_of_token(token))
+
+    def create_completed_quiz_token(self, quiz_id: int) -> bytes:
+        # Completed quizes are kept together with their quiz
+        return _create_token(database.shard_of_id(quiz_id))
+
+    def insert_quiz(
+        self,
+        token: bytes,
+        public_token: bytes,
+        creator_name: str,
+        shuffled_question_indices: list[int],
+        question_answers: list[tuple[int, int]]
+    ):
+        shard = database.shard_of_token(token)
+        id_parameters = database.shard_id_parameters(shard)  # The writer thread has no application context
+
+        def write(db: database.sqlite3.Connection):
+            quiz_id = db.execute(
+                "INSERT INTO Quiz (Id, Token, PublicToken, CreatorName, ShuffledQuestionIndices, CurrentQuestionIndex, CreationTimeStamp) "
+                "VALUES ((SELECT IFNULL(MAX(seq), ?) + ? FROM sqlite_sequence WHERE name = 'Quiz'), ?, ?, ?, ?, ?, UNIXEPOCH()) RETURNING Id",
+                (*id_parameters, token, public_token, creator_name, bytes(shuffled_question_indices), 0)
+            ).fetchone()[0]
+
+            _insert_question_answers(db, "INSERT INTO QuizQuestionAnswer (QuizId, QuestionAnswerId, QuestionIndex) VALUES (?, ?, ?)", quiz_id, question_answers)
+
+        try:
+            database.run_write(write, shard)
+        except database.sqlite3.Error as err:
+            raise _error_insert_answer(err)
+
+    def insert_completed_quiz(
+        self,
+        token: bytes,
+        friend_name: str,
+        quiz_id: int,
+        question_answers: list[tuple[int, int]],
+        score: float | None
+    ) -> tuple[int, int | None]:
+        shard = database.shard_of_id(quiz_id)
+        id_parameters = database.shard_id_parameters(shard)
+
+        def write(db: database.sqlite3.Connection):
+            # Foreign keys aren't enforced, so the quiz is selected to make sure that it is still there
+            result = db.execute(
+                "INSERT INTO CompletedQuiz (Id, Token, FriendName, CurrentQuestionIndex, QuizId) "
+                "SELECT (SELECT IFNULL(MAX(seq), ?) + ? FROM sqlite_sequence WHERE name = 'CompletedQuiz'), ?, ?, ?, Id "
+                "FROM Quiz WHERE Id = ? RETURNING Id",
+                (*id_parameters, token, friend_name, 0, quiz_id)
+            ).fetchone()
+
+            if result is None:
+                raise database.NotFoundError(f"Could not find entity with ID {quiz_id}")
+
+            completed_quiz_id = result[0]
+
+            _insert_question_answers(
+                db,
+                "INSERT INTO CompletedQuizQuestionAnswer (CompletedQuizId, QuestionAnswerId, QuestionIndex) VALUES (?, ?, ?)",
+                completed_quiz_id,
+                question_answers
+            )
+
+            completion_number = None
+
+            if score is not None:
+                completion_number = _complete_completed_quiz(db, completed_quiz_id, score)
+
+            return completed_quiz_id, completion_number
+
+        try:
+            return database.run_write(write, shard)
+        except database.sqlite3.Error as err:
+            raise _error_insert_answer(err)
+
+    def get_quiz_id_from_token(self, token: bytes) -> int | None:
+        return _select_id_from_token("SELECT Id FROM Quiz WHERE Token = ?", token)
+
+    def get_quiz_id_from_public_token(self, public_token: bytes) -> int | None:
+        return _select_id_from_token("SELECT Id FROM Quiz WHERE PublicToken = ?", public_token)
+
+    def get_completed_quiz_id_from_token(self, token: bytes) -> int | None:
+        return _select_id_from_token("SELECT Id FROM CompletedQuiz WHERE Token = ?", token)
+
+    def get_quiz(self, quiz_id: int) -> tuple[bytes, str, list[int], int, int] | None:
+        db = database.open_database(database.shard_of_id(quiz_id))
+
+        try:
+            result = db.execute("SELECT * FROM Quiz WHERE Id = ?", (quiz_id,)).fetchone()
+        except db.Error as err:
+            raise _error_select(err)
+
+        if result is None:
+            return None
+
+        return (
+            result["PublicToken"],
+            result["CreatorName"],
+            list(result["ShuffledQuestionIndices"]),
+            result["CurrentQuestionIndex"],
+            result["QuestionCount"]
+        )
+
+    def get_completed_quiz(self, completed_quiz_id: int) -> tuple[str, int, int, float | None] | None:
+        db = database.open_database(database.shard_of_id(completed_quiz_id))
+
+        try:
+            result = db.execute("SELECT * FROM CompletedQuiz WHERE Id = ?", (completed_quiz_id,)).fetchone()
+        except db.Error as err:
+            raise _error_select(err)
+
+        if result is None:
+            return None
+
+        return result["FriendName"], result["CurrentQuestionIndex"], result["QuizId"], result["Score"]
+
+    def load_quiz_state(self, token: bytes) -> tuple[int, str, list[int], int, set[int]] | None:
+        db = database.open_database(database.shard_of_token(token))
+
+        try:
+            result = db.execute(
+                "SELECT Quiz.Id, CreatorName, ShuffledQuestionIndices, CurrentQuestionIndex, QuizQuestionAnswer.QuestionIndex FROM Quiz "
+                "LEFT JOIN QuizQuestionAnswer ON QuizQuestionAnswer.QuizId = Quiz.Id WHERE Quiz.Token = ?",
+                (token,)
+            ).fetchall()
+        except db.Error as err:
+            raise _error_select(err)
+
+        if not result:
+            return None
+
+        return (
+            result[0][0],
+            result[0][1],
+            list(result[0][2]),
+            result[0][3],
+            {row[4] for row in result if row[4] is not None}
+        )
+
+    def load_completed_quiz_state(self, token: bytes) -> tuple[int, int, str, str, list[int], int, set[int]] | None:
+        db = database.open_database(database.shard_of_token(token))
+
+        # One row per question of the quiz, marking whether the friend answered it already
+        try:
+            result = db.execute(
+                "SELECT CompletedQuiz.Id, CompletedQuiz.QuizId, FriendName, CreatorName, CompletedQuiz.CurrentQuestionIndex, "
+                "QuizQuestionAnswer.QuestionIndex, CompletedQuizQuestionAnswer.QuestionIndex IS NOT NULL FROM CompletedQuiz "
+                "JOIN Quiz ON CompletedQuiz.QuizId = Quiz.Id "
+                "JOIN QuizQuestionAnswer ON QuizQuestionAnswer.QuizId = Quiz.Id "
+                "LEFT JOIN CompletedQuizQuestionAnswer ON CompletedQuizQuestionAnswer.CompletedQuizId = CompletedQuiz.Id "
+                "AND CompletedQuizQuestionAnswer.QuestionIndex = QuizQuestionAnswer.QuestionIndex "
+                "WHERE CompletedQuiz.Token = ? ORDER BY QuizQuestionAnswer.QuestionIndex ASC",
+                (token,)
+            ).fetchall()
+        except db.Error as err:
+            raise _error_select(err)
+
+        if not result:
+            return None
+
+        return (
+            result[0][0],
+            result[0][1],
+            result[0][2],
+            result[0][3],
+            [row[5] for row in result],
+            result[0][4],
+            {row[5] for row in result if row[6]}
+        )
+
+    def get_quiz_question_answers(self, quiz_id: int) -> list[tuple[int, int]]:
+        db = database.open_database(database.shard_of_id(quiz_id))
+
+        try:
+            return _select_quiz_question_answers(db, quiz_id)
+        except db.Error as err:
+            raise _error_select(err)
+
+    def get_completed_quiz_question_answers(self, completed_quiz_id: int) -> list[tuple[int, int]]:
+        db = database.open_database(database.shard_of_id(completed_quiz_id))
+
+        try:
+            result = _select_completed_quiz_question_answers(db, completed_quiz_id)
+        except db.Error as err:
+            raise _error_select(err)
+
+        return list(map(lambda x: (x[0], x[1]), result))
+
+    def add_quiz_question_answer(self, quiz_id: int, question_index: int, answer_mask: int, current_question_index: int):
+        def write(db: database.sqlite3.Connection):
+            result = db.execute(
+                "INSERT INTO QuestionAnswer (QuestionIndex, AnswerMask) VALUES (?, ?) RETURNING Id",
+                (question_index, answer_mask)
+            ).fetchone()
+            db.execute(
+                "INSERT INTO QuizQuestionAnswer (QuizId, QuestionAnswerId, QuestionIndex) VALUES (?, ?, ?)",
+                (quiz_id, result[0], question_index)
+            )
+            db.execute("UPDATE Quiz SET CurrentQuestionIndex = ? WHERE Id = ?", (current_question_index, quiz_id))
+
+        try:
+            database.run_write(write, database.shard_of_id(quiz_id))
+        except database.sqlite3.Error as err:
+            raise _error_insert_answer(err)
+
+    def add_completed_quiz_question_answer(
+        self,
+        completed_quiz_id: int,
+        question_index: int,
+        answer_mask: int,
+        current_question_index: int,
+        quiz_id: int,
+        quiz_question_answers: list[tuple[int, int]] | None
+    ) -> tuple[float, int] | None:
+        def write(db: database.sqlite3.Connection):
+            result = db.execute(
+                "INSERT INTO QuestionAnswer (QuestionIndex, AnswerMask) VALUES (?, ?) RETURNING Id",
+                (question_index, answer_mask)
+            ).fetchone()
+            db.execute(
+                "INSERT INTO CompletedQuizQuestionAnswer (CompletedQuizId, QuestionAnswerId, QuestionIndex) VALUES (?, ?, ?)",
+                (completed_quiz_id, result[0], question_index)
+            )
+
+            # The count includes the answers of concurrent requests committed before this transaction
+            question_count = db.execute(
+                "UPDATE CompletedQuiz SET CurrentQuestionIndex = ? WHERE Id = ? RETURNING QuestionCount",
+                (current_question_index, completed_quiz_id)
+            ).fetchone()[0]
+
+            if question_count == 20:
+                quiz_key = scoring.compile_quiz(
+                    quiz_question_answers if quiz_question_answers is not None else _select_quiz_question_answers(db, quiz_id),
+                    static.G_QUESTIONS
+                )
+                completed_quiz_question_answers = [(row[0], row[1]) for row in _select_completed_quiz_question_answers(db, completed_quiz_id)]
+                score = scoring.score(quiz_key, completed_quiz_question_answers)
+
+                return score, _complete_completed_quiz(db, completed_quiz_id, score)
+
+            return None
+
+        try:
+            return database.run_write(write, database.shard_of_id(completed_quiz_id))
+        except database.sqlite3.Error as err:
+            raise _error_insert_answer(err)
+
+    def update_quiz_current_question_index(self, quiz_id: int, current_question_index: int):
+        try:
+            database.run_write(lambda db: db.execute(
+                "UPDATE Quiz SET CurrentQuestionIndex = ? WHERE Id = ?", (current_question_index, quiz_id)
+            ), database.shard_of_id(quiz_id))
+        except database.sqlite3.Error as err:
+            raise _error_update(err)
+
+    def update_completed_quiz_current_question_index(self, completed_quiz_id: int, current_question_index: int):
+        try:
+            database.run_write(lambda db: db.execute(
+                "UPDATE CompletedQuiz SET CurrentQuestionIndex = ? WHERE Id = ?", (current_question_index, completed_quiz_id)
+            ), database.shard_of_id(completed_quiz_id))
+        except database.sqlite3.Error as err:
+            raise _error_update(err)
+
+    def get_quiz_results(self, quiz_id: int, after_completion_number: int) -> list[tuple[int, str, float]]:
+        db = database.open_database(database.shard_of_id(quiz_id))
+
+        try:
+            result = db.execute(
+                "SELECT CompletionNumber, FriendName, Score FROM CompletedQuiz "
+                "WHERE QuizId = ? AND Completed = 1 AND CompletionNumber > ? ORDER BY FriendName ASC",
+                (quiz_id, after_completion_number)
+            ).fetchall()
+        except db.Error as err:
+            raise _error_select(err)
+
+        return list(map(lambda x: (x[0], x[1], x[2]), result))
+
+    def get_unscored_completed_quizes(self) -> dict[int, dict[int, list[tuple[int, int]]]]:
+        quizes: dict[int, dict[int, list[tuple[int, int]]]] = {}
+
+        for shard in range(database.get_shard_count()):
+            db = database.open_database(shard)
+
+            try:
+                result = db.execute(
+                    "SELECT CompletedQuiz.QuizId, CompletedQuiz.Id, CompletedQuizQuestionAnswer.QuestionIndex, AnswerMask FROM CompletedQuiz "
+                    "JOIN CompletedQuizQuestionAnswer ON CompletedQuiz.Id = CompletedQuizQuestionAnswer.CompletedQuizId "
+                    "JOIN QuestionAnswer ON CompletedQuizQuestionAnswer.QuestionAnswerId = QuestionAnswer.Id "
+                    "WHERE CompletedQuiz.Completed = 0 ORDER BY CompletedQuiz.QuizId ASC, CompletedQuiz.Id ASC, CompletedQuizQuestionAnswer.QuestionIndex ASC"
+                ).fetchall()
+            except db.Error as err:
+                raise _error_select(err)
+
+            # Rows come grouped by quiz and then by completed quiz, so a single pass is enough
+            for quiz_id, completed_quiz_id, question_index, answer_mask in result:
+                completed_quizes = quizes.setdefault(quiz_id, {})
+                completed_quizes.setdefault(completed_quiz_id, []).append((question_index, answer_mask))
+
+        return quizes
+
+    def update_completed_quiz_scores(self, scores: list[tuple[int, float]]):
+        shards: set[int] = set()
+
+        for completed_quiz_id, score in scores:
+            shard = database.shard_of_id(completed_quiz_id)
+            db = database.open_database(shard)
+            shards.add(shard)
+
+            try:
+                _complete_completed_quiz(db, completed_quiz_id, score)
+            except db.Error as err:
+                raise _error_update(err)
+
+        for shard in shards:
+            db = database.open_database(shard)
+
+            try:
+                db.commit()
+            except db.Error as err:
+                raise _error_update(err)
+
+    def delete_quizes_older_than(self, hours: int, batch_size: int) -> tuple[int, int]:
+        deleted_quizes = 0
+        deleted_rows = 0
+        error: database.DatabaseError | None = None
+
+        # A failing shard doesn't keep the others from being purged
+        for shard in range(self._application.config["DATABASE_SHARDS"]):
+            with database.open_database_ex(self._application, shard) as db:
+                try:
+                    shard_deleted_quizes, shard_deleted_rows = _delete_quizes_older_than(db, hours, batch_size)
+                except database.DatabaseError as err:
+                    self._application.logger.error(f"Error deleting quizes from shard {shard}: {err}")
+                    error = err
+                else:
+                    deleted_quizes += shard_deleted_quizes
+                    deleted_rows += shard_deleted_rows
+
+        if error is not None:
+            raise error
+
+        return deleted_quizes, deleted_rows
+
+
+def _create_token(shard: int) -> bytes:
+    # The token tells which shard its quiz is in, so draw until it points to the right one
+    while True:
+        token = storage.create_token()
+
+        if database.shard_of_token(token) == shard:
+            return token
+
+
+def _select_id_from_token(query: str, token: bytes) -> int | None:
+    db = database.open_database(database.shard_of_token(token))
+
+    try:
+        result = db.execute(query, (token,)).fetchone()
+    except db.Error as err:
+        raise _error_select(err)
+
+    return result[0] if result is not None else None
+
+
+def _insert_question_answers(db: database.sqlite3.Connection, query: str, id_: int, question_answers: list[tuple[int, int]]):
+    for question_index, answer_mask in question_answers:
+        result = db.execute(
+            "INSERT INTO QuestionAnswer (QuestionIndex, AnswerMask) VALUES (?, ?) RETURNING Id",
+            (question_index, answer_mask)
+        ).fetchone()
+        db.execute(query, (id_, result[0], question_index))
+
+
+# Stores the score and numbers the completed quiz after the quiz's previously completed ones
+# Writes to a shard are serialized, so the numbers of a quiz only ever increase
+def _complete_completed_quiz(db: database.sqlite3.Connection, completed_quiz_id: int, score: float) -> int:
+    return db.execute(
+        "UPDATE CompletedQuiz SET Score = ?, Completed = 1, CompletionNumber = ("
+        "SELECT IFNULL(MAX(Other.CompletionNumber), 0) + 1 FROM CompletedQuiz AS Other WHERE Other.QuizId = CompletedQuiz.QuizId"
+        ") WHERE Id = ? RETURNING CompletionNumber",
+        (score, completed_quiz_id)
+    ).fetchone()[0]
+
+
+def _select_quiz_question_answers(db: database.sqlite3.Connection, quiz_id: int) -> list[tuple[int, int]]:
+    result = db.execute(
+        "SELECT QuizQuestionAnswer.QuestionIndex, AnswerMask FROM QuizQuestionAnswer "
+        "JOIN QuestionAnswer ON QuizQuestionAnswer.QuestionAnswerId = QuestionAnswer.Id "
+        "WHERE QuizQuestionAnswer.QuizId = ? ORDER BY QuizQuestionAnswer.QuestionIndex ASC",
+        (quiz_id,)
+    ).fetchall()
+
+    return list(map(lambda x: (x[0], x[1]), result))
+
+
+def _select_completed_quiz_question_answers(db: database.sqlite3.Connection, completed_quiz_id: int) -> list[database.sqlite3.Row]:
+    return db.execute(
+        "SELECT CompletedQuizQuestionAnswer.QuestionIndex, AnswerMask FROM CompletedQuizQuestionAnswer "
+        "JOIN QuestionAnswer ON CompletedQuizQuestionAnswer.QuestionAnswerId = QuestionAnswer.Id "
+        "WHERE CompletedQuizQuestionAnswer.CompletedQuizId = ? ORDER BY CompletedQuizQuestionAnswer.QuestionIndex ASC",
+        (completed_quiz_id,)
+    ).fetchall()
+
+
+def _delete_quizes_older_than(db: database.sqlite3.Connection, hours: int, batch_size: int) -> tuple[int, int]:
+    # Fixed cutoff, so that the comparison uses the index and every batch agrees on it
+    cutoff = int(time.time()) - hours * 3600
+    deleted_quizes = 0
+    total_changes = db.total_changes
+
+    # Each batch is its own short transaction, letting answer submissions in between
+    while True:
+        try:
+            cursor = db.execute(
+                """
+                DELETE FROM Quiz WHERE Id IN (
+                    SELECT Id FROM Quiz WHERE CreationTimeStamp < ? ORDER BY CreationTimeStamp LIMIT ?
+                )
+                """,
+                (cutoff, batch_size)
+            )
+            db.commit()
+        except db.Error as err:
+            db.rollback()
+            raise _error_delete(err)
+
+        deleted_quizes += cursor.rowcount
+
+        if cursor.rowcount < batch_size:
+            break
+
+    # Includes the rows deleted by the triggers
+    return deleted_quizes, db.total_changes - total_changes
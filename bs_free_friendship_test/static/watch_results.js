@@ -0,0 +1,24 @@
+function watch_results(events_url) {
+    if (!window.EventSource) {
+        return
+    }
+
+    const source = new EventSource(events_url)
+
+    source.addEventListener("result", (event) => {
+        const result = JSON.parse(event.data)
+        const table = document.getElementById("friends-scores-table")
+        const placeholder = document.getElementById("friends-scores-placeholder")
+
+        if (placeholder) {
+            placeholder.remove()
+        }
+
+        const row = table.insertRow()
+        const name = document.createElement("span")
+        name.className = "mono"
+        name.textContent = result.friend_name
+        row.insertCell().appendChild(name)
+        row.insertCell().textContent = result.score + "/100"
+    })
+}
@@ -0,0 +1,167 @@
+from __future__ import annotations
+
+import abc
+import secrets
+
+import flask as fl
+
+
+class Storage(abc.ABC):
+    # Where quizes and completed quizes are kept, common.py builds everything else on top
+    # Tokens are the raw bytes, missing entities are returned as None and errors are raised
+    # as database.DatabaseError, with SQLite's error codes for the constraints
+
+    shared = True  # Whether every server process sees the same data
+
+    def create_quiz_tokens(self) -> tuple[bytes, bytes]:
+        return create_token(), create_token()
+
+    def create_completed_quiz_token(self, quiz_id: int) -> bytes:
+        return create_token()
+
+    # Question answers are committed together with the quiz
+    @abc.abstractmethod
+    def insert_quiz(
+        self,
+        token: bytes,
+        public_token: bytes,
+        creator_name: str,
+        shuffled_question_indices: list[int],
+        question_answers: list[tuple[int, int]]
+    ):
+        pass
+
+    # Question answers and the score, when given, are committed together with the completed quiz
+    # Returns its ID and, with a score, its completion number
+    @abc.abstractmethod
+    def insert_completed_quiz(
+        self,
+        token: bytes,
+        friend_name: str,
+        quiz_id: int,
+        question_answers: list[tuple[int, int]],
+        score: float | None
+    ) -> tuple[int, int | None]:
+        pass
+
+    @abc.abstractmethod
+    def get_quiz_id_from_token(self, token: bytes) -> int | None:
+        pass
+
+    @abc.abstractmethod
+    def get_quiz_id_from_public_token(self, public_token: bytes) -> int | None:
+        pass
+
+    @abc.abstractmethod
+    def get_completed_quiz_id_from_token(self, token: bytes) -> int | None:
+        pass
+
+    # Public token, creator name, shuffled question indices, current question index and question count
+    @abc.abstractmethod
+    def get_quiz(self, quiz_id: int) -> tuple[bytes, str, list[int], int, int] | None:
+        pass
+
+    # Friend name, current question index, quiz ID and score, which is only there once completed
+    @abc.abstractmethod
+    def get_completed_quiz(self, completed_quiz_id: int) -> tuple[str, int, int, float | None] | None:
+        pass
+
+    # The fields of common.QuizState
+    @abc.abstractmethod
+    def load_quiz_state(self, token: bytes) -> tuple[int, str, list[int], int, set[int]] | None:
+        pass
+
+    # The fields of common.CompletedQuizState, None as well when the quiz has no answers yet
+    @abc.abstractmethod
+    def load_completed_quiz_state(self, token: bytes) -> tuple[int, int, str, str, list[int], int, set[int]] | None:
+        pass
+
+    @abc.abstractmethod
+    def get_quiz_question_answers(self, quiz_id: int) -> list[tuple[int, int]]:
+        pass
+
+    @abc.abstractmethod
+    def get_completed_quiz_question_answers(self, completed_quiz_id: int) -> list[tuple[int, int]]:
+        pass
+
+    # The answer and the move to the next question are committed together
+    @abc.abstractmethod
+    def add_quiz_question_answer(self, quiz_id: int, question_index: int, answer_mask: int, current_question_index: int):
+        pass
+
+    # When this is the completed quiz's last answer, it is scored in the same transaction and the score
+    # returned together with the completion number
+    # The creator's answers are read then, unless given
+    @abc.abstractmethod
+    def add_completed_quiz_question_answer(
+        self,
+        completed_quiz_id: int,
+        question_index: int,
+        answer_mask: int,
+        current_question_index: int,
+        quiz_id: int,
+        quiz_question_answers: list[tuple[int, int]] | None
+    ) -> tuple[float, int] | None:
+        pass
+
+    @abc.abstractmethod
+    def update_quiz_current_question_index(self, quiz_id: int, current_question_index: int):
+        pass
+
+    @abc.abstractmethod
+    def update_completed_quiz_current_question_index(self, completed_quiz_id: int, current_question_index: int):
+        pass
+
+    # Completed quizes, sorted by friend name, as completion number, friend name and score
+    # Completion numbers count a quiz's completed quizes from 1, in the order they are scored
+    @abc.abstractmethod
+    def get_quiz_results(self, quiz_id: int, after_completion_number: int) -> list[tuple[int, str, float]]:
+        pass
+
+    # The question answers of every completed quiz without a score, grouped by quiz
+    @abc.abstractmethod
+    def get_unscored_completed_quizes(self) -> dict[int, dict[int, list[tuple[int, int]]]]:
+        pass
+
+    # Completion numbers are given in the order of the scores
+    @abc.abstractmethod
+    def update_completed_quiz_scores(self, scores: list[tuple[int, float]]):
+        pass
+
+    # Runs outside of requests, returns the deleted quizes and rows, answers and completed quizes included
+    @abc.abstractmethod
+    def delete_quizes_older_than(self, hours: int, batch_size: int) -> tuple[int, int]:
+        pass
+
+    def close(self):
+        pass
+
+
+def create_token() -> bytes:
+    return secrets.token_bytes(16)
+
+
+def initialize_storage(application: fl.Flask):
+    from . import sqlite_storage
+    from . import memory_storage
+
+    backends = {
+        "sqlite": sqlite_storage.SqliteStorage,
+        "memory": memory_storage.MemoryStorage
+    }
+
+    backend = application.config["STORAGE_BACKEND"]
+
+    if backend not in backends:
+        raise ValueError(f"Unknown storage backend {backend!r}")
+
+    previous_storage = application.extensions.get("storage")
+
+    if previous_storage is not None:
+        previous_storage.close()
+
+    application.extensions["storage"] = backends[backend](application)
+
+
+def get_storage() -> Storage:
+    return fl.current_app.extensions["storage"]
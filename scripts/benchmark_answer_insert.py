@@ -0,0 +1,88 @@
+#! /usr/bin/env python3
+
+# Measures the cost of inserting the n-th answer of a quiz, with the unique index alone
+# and with the old duplicate checking triggers added back on top of it
+# Run from the repository root: python3 scripts/benchmark_answer_insert.py
+
+import os
+import sqlite3
+import tempfile
+import time
+
+QUIZES = 500
+ANSWERS = 20
+
+LEGACY_TRIGGERS = """
+CREATE TRIGGER AvoidDuplicateQuestionAnswers AFTER INSERT ON QuizQuestionAnswer
+BEGIN
+    SELECT CASE
+        WHEN
+            (
+                SELECT COUNT(*) FROM QuestionAnswer JOIN QuizQuestionAnswer ON QuestionAnswer.Id = QuizQuestionAnswer.QuestionAnswerId
+                WHERE QuizQuestionAnswer.QuizId = NEW.QuizId GROUP BY QuestionAnswer.QuestionIndex HAVING COUNT(QuestionAnswer.QuestionIndex) > 1
+            ) > 1
+        THEN
+            RAISE(ABORT, "Duplicate question answer")
+    END;
+END;
+"""
+
+
+def create_database(directory: str, name: str, legacy: bool) -> sqlite3.Connection:
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bs_free_friendship_test", "schema.sql")) as file:
+        schema = file.read()
+
+    connection = sqlite3.connect(os.path.join(directory, name))
+    connection.executescript(schema)
+
+    if legacy:
+        connection.executescript(LEGACY_TRIGGERS)
+
+    for i in range(QUIZES):
+        connection.execute(
+            "INSERT INTO Quiz (Id, Token, PublicToken, CreatorName, ShuffledQuestionIndices, CurrentQuestionIndex, CreationTimeStamp) "
+            "VALUES (?, ?, ?, ?, ?, ?, UNIXEPOCH())",
+            (i, os.urandom(16), os.urandom(16), "Creator", bytes([0]), 0)
+        )
+
+    connection.commit()
+
+    return connection
+
+
+def measure(connection: sqlite3.Connection) -> list[float]:
+    timings = []
+
+    for question_index in range(ANSWERS):
+        begin = time.perf_counter()
+
+        for i in range(QUIZES):
+            result = connection.execute(
+                "INSERT INTO QuestionAnswer (QuestionIndex, AnswerMask) VALUES (?, ?) RETURNING Id",
+                (question_index, 1)
+            ).fetchone()
+            connection.execute(
+                "INSERT INTO QuizQuestionAnswer (QuizId, QuestionAnswerId, QuestionIndex) VALUES (?, ?, ?)",
+                (i, result[0], question_index)
+            )
+
+        timings.append((time.perf_counter() - begin) / QUIZES)
+        connection.commit()
+
+    return timings
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        unique_timings = measure(create_database(directory, "unique.sqlite", False))
+        legacy_timings = measure(create_database(directory, "legacy.sqlite", True))
+
+    print(f"Average insert time of the n-th answer over {QUIZES} quizes (microseconds)")
+    print(f"{'n':>3} {'unique index':>14} {'with triggers':>14}")
+
+    for n, (unique, legacy) in enumerate(zip(unique_timings, legacy_timings), 1):
+        print(f"{n:>3} {unique * 1e6:>14.1f} {legacy * 1e6:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
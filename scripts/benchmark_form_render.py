@@ -0,0 +1,78 @@
+#! /usr/bin/env python3
+
+# Compares rendering the question forms with the question markup rendered on every
+# request against using the fragments rendered at startup
+# Run from the repository root: python3 scripts/benchmark_form_render.py
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import flask as fl
+
+from bs_free_friendship_test import create_app
+from bs_free_friendship_test import fragment
+from bs_free_friendship_test import static
+
+RENDERS = 2000
+REPEAT = 5
+
+
+def render_create_form(question_index: int, question_fragment):
+    return fl.render_template(
+        "create/form.html",
+        creator_name="Creator",
+        question_count=7,
+        question=static.G_QUESTIONS[question_index],
+        question_fragment=question_fragment,
+        question_index=question_index,
+        quiz_token="CQOQl2rC34W4wJf39Xhbdg"
+    )
+
+
+def render_quiz_form(question_index: int, question_fragment):
+    return fl.render_template(
+        "quiz/form.html",
+        creator_name="Creator",
+        friend_name="Friend",
+        question_count=7,
+        question=static.G_QUESTIONS[question_index],
+        question_fragment=question_fragment,
+        question_index=question_index,
+        completed_quiz_token="CQOQl2rC34W4wJf39Xhbdg"
+    )
+
+
+def measure(render, variant: str, cached: bool) -> float:
+    def run():
+        for i in range(RENDERS):
+            question_index = i % len(static.G_QUESTIONS)
+
+            if cached:
+                question_fragment = fragment.get_question_fragment(variant, question_index)
+            else:
+                question_fragment = fragment.render_question_fragment(variant, static.G_QUESTIONS[question_index])
+
+            render(question_index, question_fragment)
+
+    return min(timeit.repeat(run, number=1, repeat=REPEAT)) / RENDERS
+
+
+def main():
+    application = create_app()
+
+    print(f"Average render time over {RENDERS} renders (microseconds)")
+    print(f"{'route':<14} {'per request':>12} {'pre-rendered':>13}")
+
+    with application.test_request_context():
+        for route, render, variant in (("create._form", render_create_form, "create"), ("quiz._form", render_quiz_form, "quiz")):
+            before = measure(render, variant, False)
+            after = measure(render, variant, True)
+
+            print(f"{route:<14} {before * 1e6:>12.1f} {after * 1e6:>13.1f} ({before / after:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
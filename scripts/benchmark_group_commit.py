@@ -0,0 +1,101 @@
+#! /usr/bin/env python3
+
+# Measures answer submission throughput from concurrent threads, with every write
+# committing on its own and with the group commit writer thread
+# Run from the repository root: python3 scripts/benchmark_group_commit.py
+
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bs_free_friendship_test import common
+from bs_free_friendship_test import database
+from bs_free_friendship_test import static
+from temporary_application import create_temporary_app
+
+THREADS = [1, 4, 16, 32]
+QUIZES_PER_THREAD = 5
+
+
+def setup(directory: str, group_commit: bool, threads: int):
+    return create_temporary_app(
+        os.path.join(directory, f"{'group' if group_commit else 'single'}-{threads}.sqlite"),
+        DATABASE_POOL_SIZE=threads,
+        DATABASE_GROUP_COMMIT=group_commit
+    )
+
+
+def answer_quizes(application, errors: list[Exception]):
+    try:
+        for _ in range(QUIZES_PER_THREAD):
+            with application.app_context():
+                state = common.load_quiz_state(common.create_new_quiz("Creator"))
+
+                for question_index in list(state.shuffled_question_indices[:20]):
+                    question = static.G_QUESTIONS[question_index]
+                    answer_mask = 1 if question.single_type else 0b11
+                    common.add_quiz_question_answer(state, question_index, answer_mask)
+
+                # Answering twice must fail for this caller only
+                try:
+                    common.add_quiz_question_answer(state, state.shuffled_question_indices[0], 1)
+                except database.DatabaseError as err:
+                    if err.error_code != database.sqlite3.SQLITE_CONSTRAINT_UNIQUE:
+                        raise
+                else:
+                    raise RuntimeError("Duplicate answer was accepted")
+    except Exception as err:
+        errors.append(err)
+
+
+def measure(directory: str, group_commit: bool, threads: int) -> tuple[float, dict[str, int] | None]:
+    application = setup(directory, group_commit, threads)
+    errors: list[Exception] = []
+    workers = [threading.Thread(target=answer_quizes, args=(application, errors)) for _ in range(threads)]
+
+    begin = time.perf_counter()
+
+    for worker in workers:
+        worker.start()
+
+    for worker in workers:
+        worker.join()
+
+    elapsed = time.perf_counter() - begin
+
+    if errors:
+        raise errors[0]
+
+    with application.app_context():
+        count = database.open_database().execute("SELECT COUNT(*) FROM QuizQuestionAnswer").fetchone()[0]
+
+    if count != threads * QUIZES_PER_THREAD * 20:
+        raise RuntimeError(f"Expected {threads * QUIZES_PER_THREAD * 20} answers, found {count}")
+
+    # Quiz creations, answers and rejected duplicates
+    writes = threads * QUIZES_PER_THREAD * 22
+
+    return writes / elapsed, database.get_writer_statistics(application)
+
+
+def main():
+    print(f"Writes per second, {QUIZES_PER_THREAD} quizes of 20 answers per thread")
+    print(f"{'threads':>7} {'single':>10} {'group':>10} {'batches':>8} {'per batch':>10}")
+
+    with tempfile.TemporaryDirectory() as directory:
+        for threads in THREADS:
+            single, _ = measure(directory, False, threads)
+            group, statistics = measure(directory, True, threads)
+
+            print(
+                f"{threads:>7} {single:>10.0f} {group:>10.0f} {statistics['batches']:>8} "
+                f"{statistics['writes'] / statistics['batches']:>10.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+#! /usr/bin/env python3
+
+# Compares the bitmask scoring engine against the original list based scoring
+# Run from the repository root: python3 scripts/benchmark_scoring.py
+
+import os
+import sys
+import random
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bs_free_friendship_test import question
+from bs_free_friendship_test import scoring
+
+COMPLETED_QUIZES = 200
+REPEAT = 5
+
+
+def reference_score(questions, quiz_question_answers, completed_quiz_question_answers) -> float:
+    max_score = 0
+
+    for question_answer in quiz_question_answers:
+        if questions[question_answer[0]].single_type:
+            max_score += 1
+        else:
+            max_score += len(question_answer[1])
+
+    score = 0
+
+    for completed_question_answer in completed_quiz_question_answers:
+        for question_answer in quiz_question_answers:
+            if question_answer[0] != completed_question_answer[0]:
+                continue
+
+            if questions[question_answer[0]].single_type:
+                score += int(question_answer[1][0] == completed_question_answer[1][0])
+            else:
+                question_score = 0
+                for i in range(len(questions[question_answer[0]].answers)):
+                    if i in question_answer[1] and i in completed_question_answer[1]:
+                        question_score += 1
+                    elif not (i not in question_answer[1] and i not in completed_question_answer[1]):
+                        question_score -= 1
+                score += max(question_score, 0)
+
+    return float(score * 100) / float(max_score)
+
+
+def random_answers(questions, question_indices) -> list[tuple[int, list[int]]]:
+    answers = []
+
+    for question_index in question_indices:
+        count = len(questions[question_index].answers)
+
+        if questions[question_index].single_type:
+            answers.append((question_index, [random.randrange(count)]))
+        else:
+            answers.append((question_index, sorted(random.sample(range(count), random.randint(1, count)))))
+
+    return answers
+
+
+def to_masks(question_answers: list[tuple[int, list[int]]]) -> list[tuple[int, int]]:
+    return [(question_index, scoring.answer_mask(answer_indices)) for question_index, answer_indices in question_answers]
+
+
+def main():
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bs_free_friendship_test", "questions.json")) as file:
+        questions = question.load_questions(file)
+
+    random.seed(0)
+
+    question_indices = sorted(random.sample(range(len(questions)), 20))
+    quiz_question_answers = random_answers(questions, question_indices)
+    completed_quizes = [random_answers(questions, question_indices) for _ in range(COMPLETED_QUIZES)]
+
+    # Answers are stored as bitmasks, so that is what the engine gets
+    quiz_question_masks = to_masks(quiz_question_answers)
+    completed_quiz_masks = [to_masks(completed_quiz) for completed_quiz in completed_quizes]
+
+    expected = [reference_score(questions, quiz_question_answers, completed_quiz) for completed_quiz in completed_quizes]
+
+    def bitmask_scores() -> list[float]:
+        key = scoring.compile_quiz(quiz_question_masks, questions)
+
+        return [scoring.score(key, completed_quiz) for completed_quiz in completed_quiz_masks]
+
+    actual = bitmask_scores()
+
+    if expected != actual:
+        print("Scores differ from the reference implementation", file=sys.stderr)
+        sys.exit(1)
+
+    reference_time = min(timeit.repeat(
+        lambda: [reference_score(questions, quiz_question_answers, completed_quiz) for completed_quiz in completed_quizes],
+        number=1,
+        repeat=REPEAT
+    ))
+    bitmask_time = min(timeit.repeat(
+        bitmask_scores,
+        number=1,
+        repeat=REPEAT
+    ))
+
+    print(f"Scored {COMPLETED_QUIZES} completed quizes, results identical")
+    print(f"reference: {reference_time * 1000:.3f} ms")
+    print(f"bitmask:   {bitmask_time * 1000:.3f} ms ({reference_time / bitmask_time:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
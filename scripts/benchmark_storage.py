@@ -0,0 +1,130 @@
+#! /usr/bin/env python3
+
+# Compares the storage backends on the operations behind the form routes, going through
+# the storage interface directly, so that rendering and routing don't hide the difference
+# Run from the repository root: python3 scripts/benchmark_storage.py
+
+import os
+import sys
+import time
+import random
+import tempfile
+import concurrent.futures
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bs_free_friendship_test import storage
+from bs_free_friendship_test import static
+from temporary_application import create_temporary_app
+
+QUIZES = 200
+FRIENDS = 5
+THREADS = 8
+
+
+def setup(directory: str, backend: str):
+    return create_temporary_app(
+        os.path.join(directory, f"{backend}.sqlite"),
+        STORAGE_BACKEND=backend,
+        DATABASE_POOL_SIZE=THREADS
+    )
+
+
+def random_question_answers(rng: random.Random, question_indices: list[int]) -> list[tuple[int, int]]:
+    return [(question_index, 1 << rng.randrange(len(static.G_QUESTIONS[question_index].answers))) for question_index in question_indices]
+
+
+def create_quizes(application, rng: random.Random) -> list[tuple[int, list[tuple[int, int]]]]:
+    quizes = []
+
+    with application.app_context():
+        quiz_storage = storage.get_storage()
+
+        for number in range(QUIZES):
+            token, public_token = quiz_storage.create_quiz_tokens()
+            question_answers = random_question_answers(rng, sorted(rng.sample(range(len(static.G_QUESTIONS)), 20)))
+            quiz_storage.insert_quiz(token, public_token, f"Creator{number}", list(range(len(static.G_QUESTIONS))), question_answers)
+            quizes.append((quiz_storage.get_quiz_id_from_public_token(public_token), question_answers))
+
+    return quizes
+
+
+def answer_quiz(application, quiz_id: int, quiz_question_answers: list[tuple[int, int]], seed: int):
+    rng = random.Random(seed)
+
+    # One request per answer, like the form does
+    with application.app_context():
+        quiz_storage = storage.get_storage()
+        token = quiz_storage.create_completed_quiz_token(quiz_id)
+        completed_quiz_id, _ = quiz_storage.insert_completed_quiz(token, f"Friend{seed}", quiz_id, [], None)
+
+    question_answers = random_question_answers(rng, [question_index for question_index, _ in quiz_question_answers])
+
+    for number, (question_index, answer_mask) in enumerate(question_answers, 1):
+        with application.app_context():
+            quiz_storage = storage.get_storage()
+            quiz_storage.load_completed_quiz_state(token)
+            quiz_storage.add_completed_quiz_question_answer(
+                completed_quiz_id,
+                question_index,
+                answer_mask,
+                number % 20,
+                quiz_id,
+                quiz_question_answers
+            )
+
+
+def read_results(application, quizes: list[tuple[int, list[tuple[int, int]]]]):
+    with application.app_context():
+        quiz_storage = storage.get_storage()
+
+        for quiz_id, _ in quizes:
+            quiz_storage.get_quiz(quiz_id)
+            quiz_storage.get_quiz_results(quiz_id, 0)
+
+
+def measure(directory: str, backend: str) -> dict[str, float]:
+    application = setup(directory, backend)
+    rng = random.Random(0)
+    timings = {}
+
+    begin = time.perf_counter()
+    quizes = create_quizes(application, rng)
+    timings["create quiz"] = (time.perf_counter() - begin) / QUIZES
+
+    friends = [(quiz_id, question_answers, i * FRIENDS + j) for i, (quiz_id, question_answers) in enumerate(quizes) for j in range(FRIENDS)]
+
+    begin = time.perf_counter()
+
+    with concurrent.futures.ThreadPoolExecutor(THREADS) as executor:
+        for future in [executor.submit(answer_quiz, application, *friend) for friend in friends]:
+            future.result()
+
+    timings["answer question"] = (time.perf_counter() - begin) / (len(friends) * 20)
+
+    begin = time.perf_counter()
+    read_results(application, quizes)
+    timings["read results"] = (time.perf_counter() - begin) / QUIZES
+
+    application.extensions["storage"].close()
+
+    return timings
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        sqlite_timings = measure(directory, "sqlite")
+        memory_timings = measure(directory, "memory")
+
+    print(f"Average time per operation, {QUIZES} quizes, {FRIENDS} friends each, answering from {THREADS} threads (microseconds)")
+    print(f"{'operation':<16} {'sqlite':>10} {'memory':>10}")
+
+    for name in sqlite_timings:
+        sqlite_time = sqlite_timings[name]
+        memory_time = memory_timings[name]
+
+        print(f"{name:<16} {sqlite_time * 1e6:>10.1f} {memory_time * 1e6:>10.1f} ({sqlite_time / memory_time:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
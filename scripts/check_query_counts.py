@@ -0,0 +1,120 @@
+#! /usr/bin/env python3
+
+# Drives the form routes against a temporary database and fails if any of them
+# issues more SQL statements than its budget
+# Run from the repository root: python3 scripts/check_query_counts.py
+
+import os
+import re
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bs_free_friendship_test import static
+from temporary_application import create_temporary_app
+
+# Statements per request, including BEGIN, COMMIT and one entry per trigger that fires
+# The last answer of a friend's quiz also scores it, which costs two more once the quiz is cached
+BUDGETS = {
+    "GET create._form": 1,
+    "POST create._form": 8,
+    "POST create._form_skip": 4,
+    "GET quiz._form": 1,
+    "POST quiz._form": 10,
+    "POST quiz._form_skip": 4,
+    # With SESSION_QUESTION_CURSOR, skipping only reads the quiz
+    "POST create._form_skip (session cursor)": 1,
+    "POST quiz._form_skip (session cursor)": 1
+}
+
+
+class StatementCounter:
+    def __init__(self):
+        self.statements: list[str] = []
+
+    def __call__(self, statement: str):
+        self.statements.append(statement)
+
+
+def setup(directory: str, session_cursor: bool):
+    application = create_temporary_app(
+        os.path.join(directory, f"bs-free-friendship-test-{int(session_cursor)}.sqlite"),
+        DATABASE_POOL_SIZE=1,
+        SESSION_QUESTION_CURSOR=session_cursor
+    )
+
+    # With a pool of one, every request runs on this connection
+    counter = StatementCounter()
+    pool = application.extensions["database_pools"][0]
+    connection = pool.acquire()
+    connection.set_trace_callback(counter)
+    pool.release(connection)
+
+    return application, counter
+
+
+def request(client, counter: StatementCounter, results: dict[str, int], name: str, method: str, url: str, data=None):
+    counter.statements.clear()
+    response = client.open(url, method=method, data=data)
+    # Releasing the connection back to the pool rolls back, which is not part of the route
+    count = len([statement for statement in counter.statements if statement != "ROLLBACK"])
+    results[name] = max(results.get(name, 0), count)
+
+    return response
+
+
+def answer_form(client, counter: StatementCounter, results: dict[str, int], route: str, url: str, suffix: str):
+    skipped = False
+
+    while True:
+        response = request(client, counter, results, f"GET {route}{suffix}", "GET", url)
+
+        if response.status_code == 302:
+            return response.headers["Location"]
+
+        if not skipped:
+            request(client, counter, results, f"POST {route}_skip{suffix}", "POST", f"{url}/skip")
+            skipped = True
+            continue
+
+        question_index = int(re.search(r'name="question_index" value="(\d+)"', response.get_data(as_text=True)).group(1))
+        question = static.G_QUESTIONS[question_index]
+        data = {
+            "question_index": str(question_index),
+            "question_answer" if question.single_type else "question_answer0": question.answers[0]
+        }
+
+        request(client, counter, results, f"POST {route}{suffix}", "POST", url, data)
+
+
+def main():
+    results: dict[str, int] = {}
+
+    with tempfile.TemporaryDirectory() as directory:
+        for session_cursor in (False, True):
+            application, counter = setup(directory, session_cursor)
+            client = application.test_client()
+            suffix = " (session cursor)" if session_cursor else ""
+
+            url = client.post("/create/start", data={"creator_name": "Creator"}).headers["Location"]
+            done_url = answer_form(client, counter, results, "create._form", url, suffix)
+
+            public_quiz_token = re.search(r"/quiz/start/([\w-]+)", client.get(done_url).get_data(as_text=True)).group(1)
+            url = client.post(f"/quiz/start/{public_quiz_token}", data={"friend_name": "Friend"}).headers["Location"]
+            answer_form(client, counter, results, "quiz._form", url, suffix)
+
+    failed = False
+
+    for name, budget in BUDGETS.items():
+        count = results.get(name, 0)
+        status = "ok" if count <= budget else "OVER BUDGET"
+        failed = failed or count > budget
+
+        print(f"{name:<40} {count:>3} / {budget:<3} {status}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+#! /usr/bin/env python3
+
+# Drives the whole create and quiz flow against a temporary database from concurrent
+# clients, and reports latency, throughput and SQL statements per route
+# Run from the repository root: python3 scripts/load_test.py --creators 20 --friends 5 --concurrency 8
+# Compare against an earlier run with --compare previous.json
+
+import os
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+import concurrent.futures
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bs_free_friendship_test import static
+from temporary_application import create_temporary_app
+
+
+class StatementCounter:
+    def __init__(self):
+        self._local = threading.local()
+
+    # Called by SQLite in the thread running the statement, which is the request's thread
+    def __call__(self, statement: str):
+        # Releasing a connection back to the pool rolls back, which is not part of the route
+        if statement != "ROLLBACK":
+            self._local.count = getattr(self._local, "count", 0) + 1
+
+    def reset(self):
+        self._local.count = 0
+
+    def count(self) -> int:
+        return getattr(self._local, "count", 0)
+
+
+class Recorder:
+    def __init__(self, counter: StatementCounter):
+        self._counter = counter
+        self._lock = threading.Lock()
+        self.latencies: dict[str, list[float]] = {}
+        self.statements: dict[str, list[int]] = {}
+        self.errors: dict[str, int] = {}
+
+    def request(self, client, name: str, method: str, url: str, data=None):
+        self._counter.reset()
+        begin = time.perf_counter()
+        response = client.open(url, method=method, data=data)
+        latency = time.perf_counter() - begin
+        statements = self._counter.count()
+
+        with self._lock:
+            self.latencies.setdefault(name, []).append(latency)
+            self.statements.setdefault(name, []).append(statements)
+
+            if response.status_code >= 400:
+                self.errors[name] = self.errors.get(name, 0) + 1
+
+        return response
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Load test the create and quiz flows")
+    parser.add_argument("--creators", type=int, default=20, help="number of quizes created")
+    parser.add_argument("--friends", type=int, default=5, help="number of friends answering each quiz")
+    parser.add_argument("--concurrency", type=int, default=8, help="number of concurrent clients")
+    parser.add_argument("--skip-probability", type=float, default=0.2, help="chance of skipping a question")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--group-commit", action="store_true", help="enable DATABASE_GROUP_COMMIT")
+    parser.add_argument("--storage", choices=("sqlite", "memory"), default="sqlite", help="value of STORAGE_BACKEND")
+    parser.add_argument("--shards", type=int, default=1, help="value of DATABASE_SHARDS")
+    parser.add_argument("--session-cursor", action="store_true", help="enable SESSION_QUESTION_CURSOR")
+    parser.add_argument("--output", default="load_test_results.json", help="where to write the results")
+    parser.add_argument("--compare", help="results of an earlier run to compare against")
+
+    return parser.parse_args()
+
+
+def setup(directory: str, arguments: argparse.Namespace):
+    application = create_temporary_app(
+        os.path.join(directory, "bs-free-friendship-test.sqlite"),
+        STORAGE_BACKEND=arguments.storage,
+        DATABASE_POOL_SIZE=arguments.concurrency,
+        DATABASE_SHARDS=arguments.shards,
+        DATABASE_GROUP_COMMIT=arguments.group_commit,
+        SESSION_QUESTION_CURSOR=arguments.session_cursor
+    )
+
+    # Every connection the requests can get is created now, to trace all of them
+    counter = StatementCounter()
+
+    for pool in application.extensions["database_pools"]:
+        connections = [pool.acquire() for _ in range(arguments.concurrency)]
+
+        for connection in connections:
+            connection.set_trace_callback(counter)
+            pool.release(connection)
+
+    return application, counter
+
+
+def answer_form(client, recorder: Recorder, rng: random.Random, skip_probability: float, route: str, url: str) -> str:
+    while True:
+        response = recorder.request(client, f"GET {route}", "GET", url)
+
+        if response.status_code == 302:
+            return response.headers["Location"]
+
+        if rng.random() < skip_probability:
+            recorder.request(client, f"POST {route}_skip", "POST", f"{url}/skip")
+            continue
+
+        question_index = int(re.search(r'name="question_index" value="(\d+)"', response.get_data(as_text=True)).group(1))
+        question = static.G_QUESTIONS[question_index]
+        data = {"question_index": str(question_index)}
+
+        if question.single_type:
+            data["question_answer"] = rng.choice(question.answers)
+        else:
+            for answer_index in rng.sample(range(len(question.answers)), rng.randint(1, len(question.answers))):
+                data[f"question_answer{answer_index}"] = question.answers[answer_index]
+
+        recorder.request(client, f"POST {route}", "POST", url, data)
+
+
+def run_creator(application, recorder: Recorder, arguments: argparse.Namespace, number: int) -> str:
+    client = application.test_client()
+    rng = random.Random(arguments.seed * 1_000_003 + number)
+
+    url = recorder.request(client, "POST create._start", "POST", "/create/start", {"creator_name": f"Creator{number}"}).headers["Location"]
+    done_url = answer_form(client, recorder, rng, arguments.skip_probability, "create._form", url)
+    response = recorder.request(client, "GET create._done", "GET", done_url)
+
+    return re.search(r"/quiz/start/([\w-]+)", response.get_data(as_text=True)).group(1)
+
+
+def run_friend(application, recorder: Recorder, arguments: argparse.Namespace, number: int, public_quiz_token: str):
+    client = application.test_client()
+    rng = random.Random(arguments.seed * 1_000_003 + 500_000 + number)
+    start_url = f"/quiz/start/{public_quiz_token}"
+
+    recorder.request(client, "GET quiz._start", "GET", start_url)
+    url = recorder.request(client, "POST quiz._start", "POST", start_url, {"friend_name": f"Friend{number}"}).headers["Location"]
+    done_url = answer_form(client, recorder, rng, arguments.skip_probability, "quiz._form", url)
+    recorder.request(client, "GET quiz._done", "GET", done_url)
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    ordered = sorted(values)
+
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+
+def summarize(recorder: Recorder, arguments: argparse.Namespace, elapsed: float) -> dict:
+    routes = {}
+
+    for name in sorted(recorder.latencies):
+        latencies = recorder.latencies[name]
+        statements = recorder.statements[name]
+
+        routes[name] = {
+            "requests": len(latencies),
+            "errors": recorder.errors.get(name, 0),
+            "p50_ms": percentile(latencies, 0.50) * 1000,
+            "p95_ms": percentile(latencies, 0.95) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+            "statements_per_request": sum(statements) / len(statements)
+        }
+
+    requests = sum(route["requests"] for route in routes.values())
+
+    return {
+        "configuration": {
+            key: value for key, value in vars(arguments).items() if key not in ("output", "compare")
+        },
+        "elapsed_s": elapsed,
+        "requests": requests,
+        "requests_per_second": requests / elapsed,
+        "routes": routes
+    }
+
+
+def report(results: dict, previous: dict | None):
+    print(f"{results['requests']} requests in {results['elapsed_s']:.2f} s, {results['requests_per_second']:.0f} requests per second", end="")
+
+    if previous is not None:
+        print(f" (was {previous['requests_per_second']:.0f})", end="")
+
+    print()
+    print(f"{'route':<24} {'count':>6} {'errors':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'sql':>6}")
+
+    for name, route in results["routes"].items():
+        print(
+            f"{name:<24} {route['requests']:>6} {route['errors']:>6} {route['p50_ms']:>8.2f} {route['p95_ms']:>8.2f} "
+            f"{route['p99_ms']:>8.2f} {route['statements_per_request']:>6.1f}"
+        )
+
+        previous_route = previous["routes"].get(name) if previous is not None else None
+
+        if previous_route is not None:
+            print(
+                f"{'  was':<24} {previous_route['requests']:>6} {previous_route['errors']:>6} {previous_route['p50_ms']:>8.2f} "
+                f"{previous_route['p95_ms']:>8.2f} {previous_route['p99_ms']:>8.2f} {previous_route['statements_per_request']:>6.1f}"
+            )
+
+
+def main():
+    arguments = parse_arguments()
+    previous = None
+
+    if arguments.compare is not None:
+        with open(arguments.compare) as file:
+            previous = json.load(file)
+
+    with tempfile.TemporaryDirectory() as directory:
+        application, counter = setup(directory, arguments)
+        recorder = Recorder(counter)
+
+        begin = time.perf_counter()
+
+        with concurrent.futures.ThreadPoolExecutor(arguments.concurrency) as executor:
+            public_quiz_tokens = list(executor.map(
+                lambda number: run_creator(application, recorder, arguments, number),
+                range(arguments.creators)
+            ))
+
+            friends = [
+                executor.submit(run_friend, application, recorder, arguments, i * arguments.friends + j, public_quiz_token)
+                for i, public_quiz_token in enumerate(public_quiz_tokens)
+                for j in range(arguments.friends)
+            ]
+
+            for friend in friends:
+                friend.result()
+
+        elapsed = time.perf_counter() - begin
+
+    results = summarize(recorder, arguments, elapsed)
+    report(results, previous)
+
+    with open(arguments.output, "w") as file:
+        json.dump(results, file, indent=4)
+
+    failed = any(route["errors"] for route in results["routes"].values())
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
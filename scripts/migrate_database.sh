@@ -0,0 +1,4 @@
+#! /usr/bin/bash
+
+cd ..
+flask --app bs_free_friendship_test migrate-database
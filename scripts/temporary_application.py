@@ -0,0 +1,20 @@
+# Shared by the scripts, which run the application against a temporary database
+# Not meant to be run on its own
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bs_free_friendship_test import create_app
+from bs_free_friendship_test import database
+
+
+def create_temporary_app(database_path: str, **config):
+    # The configuration file is skipped, so that the scripts never touch the real database
+    application = create_app(dict(TESTING=True, DATABASE=database_path, **config))
+
+    with application.app_context():
+        database.initialize_database(application)
+
+    return application